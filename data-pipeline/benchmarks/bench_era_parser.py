@@ -0,0 +1,129 @@
+"""
+Benchmark: EraParser segment throughput on large synthetic remits.
+
+Compares the single-pass indexed/streaming parser against the previous
+approach (whole-document fromstring + one find() per SEG01..SEG39 tag and
+another find() per business field), and the XML backend against the raw
+X12 backend on the same remit.
+
+Usage:
+    python benchmarks/bench_era_parser.py --claims 2000 --lines 4 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.era_parser_xml import EraParser
+
+def remit_segments(claims=1000, lines_per_claim=4):
+    """Segment tuples (name, *values) with the segment mix Tebra produces."""
+    segs = [
+        ('ST', '835', '0001'),
+        ('BPR', 'I', f"{claims * 20:.2f}", 'C', 'ACH', 'CCP'),
+        ('TRN', '1', 'CHK000123', '1512345678'),
+        ('DTM', '405', '20250301'),
+        ('N1', 'PR', 'SYNTHETIC PAYER', 'XV', 'SP001'),
+        ('N3', 'PO BOX 1'),
+        ('N4', 'DURHAM', 'NC', '27702'),
+        ('N1', 'PE', 'SYNTHETIC CLINIC', 'XX', '1234567890'),
+        ('N3', '1 MAIN ST'),
+        ('N4', 'SANFORD', 'NC', '27330'),
+        ('LX', '1'),
+    ]
+    line_id = 100000
+    for c in range(claims):
+        segs.append(('CLP', f"{c:06d}Z00001", '1', '260.00', '20.06', '0', '12', f"PCN{c:08d}", '11', '1'))
+        segs.append(('NM1', 'QC', '1', 'DOE', 'JANE', 'Q', None, None, 'MI', f"MBR{c:08d}"))
+        segs.append(('NM1', '82', '1', 'SMITH', 'JOHN', None, None, None, 'XX', '1999999999'))
+        for _ in range(lines_per_claim):
+            line_id += 1
+            segs.append(('SVC', 'HC:97110:KX:GP', '65.00', '5.01', None, '1'))
+            segs.append(('DTM', '472', '20250212'))
+            segs.append(('CAS', 'CO', '45', '59.99'))
+            segs.append(('REF', '6R', f"{line_id}K{line_id}"))
+    segs.append(('SE', str(len(segs) + 1), '0001'))
+    return segs
+
+def to_xml(segs):
+    """Render segments in Tebra's XML-wrapped 835 form."""
+    parts = []
+    for name, *values in segs:
+        elements = "".join(f"<{name}{i:02d}>{v}</{name}{i:02d}>" for i, v in enumerate(values, 1) if v is not None)
+        parts.append(f'<segment name="{name}">{elements}</segment>')
+    return "".join(parts)
+
+def to_x12(segs, element_sep='*', sub_element_sep=':', segment_term='~'):
+    """Render segments as a raw X12 interchange (ISA/GS envelope around the 835)."""
+    isa = element_sep.join([
+        'ISA', '00', ' ' * 10, '00', ' ' * 10, 'ZZ', 'SENDER'.ljust(15), 'ZZ', 'RECEIVER'.ljust(15),
+        '250301', '1200', '^', '00501', '000000001', '0', 'P', sub_element_sep,
+    ])
+    lines = [isa, element_sep.join(['GS', 'HP', 'SENDER', 'RECEIVER', '20250301', '1200', '1', 'X', '005010X221A1'])]
+    for name, *values in segs:
+        values = ['' if v is None else v.replace(':', sub_element_sep) for v in values]
+        lines.append(element_sep.join([name] + values).rstrip(element_sep))
+    lines.append(element_sep.join(['GE', '1', '1']))
+    lines.append(element_sep.join(['IEA', '1', '000000001']))
+    return segment_term.join(lines) + segment_term
+
+def make_remit(claims=1000, lines_per_claim=4):
+    """Build an XML-wrapped 835 with the segment mix Tebra produces."""
+    return to_xml(remit_segments(claims, lines_per_claim))
+
+def legacy_scan(content):
+    """Pre-index baseline: tree build + 39 find() calls per segment + find() per field."""
+    root = ET.fromstring(f"<root>{content}</root>")
+    count = 0
+    for segment in root.iter('segment'):
+        seg_id = segment.get('name')
+        for i in range(1, 40):
+            node = segment.find(f"{seg_id}{i:02d}")
+            if node is not None and node.text is None:
+                "".join(node.itertext())
+        for i in (1, 2, 3, 4, 5):
+            segment.find(f"{seg_id}{i:02d}")
+        count += 1
+    return count
+
+def bench(fn, content, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(content)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description='EraParser throughput benchmark')
+    ap.add_argument('--claims', type=int, default=2000)
+    ap.add_argument('--lines', type=int, default=4, help='Service lines per claim')
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args()
+
+    segs = remit_segments(args.claims, args.lines)
+    content = to_xml(segs)
+    raw_x12 = to_x12(segs)
+    parser = EraParser()
+    n_segments = sum(1 for _ in parser.iter_segments(content))
+    print(f"Remit: {len(content) / 1e6:.1f} MB XML / {len(raw_x12) / 1e6:.1f} MB X12, "
+          f"{n_segments:,} segments, {args.claims:,} claims")
+
+    t_legacy = bench(legacy_scan, content, args.repeat)
+    t_new = bench(parser.parse, content, args.repeat)
+    t_business = bench(lambda c: parser.parse(c, detail='business'), content, args.repeat)
+    t_x12 = bench(lambda c: parser.parse(c, detail='business'), raw_x12, args.repeat)
+
+    print(f"  legacy find() scan : {n_segments / t_legacy:>12,.0f} segments/s ({t_legacy:.2f}s)")
+    print(f"  EraParser.parse    : {n_segments / t_new:>12,.0f} segments/s ({t_new:.2f}s)")
+    print(f"  parse(business)    : {n_segments / t_business:>12,.0f} segments/s ({t_business:.2f}s)")
+    print(f"  parse(X12,business): {n_segments / t_x12:>12,.0f} segments/s ({t_x12:.2f}s)")
+    print(f"  speedup            : {t_legacy / t_new:.2f}x full, {t_legacy / t_business:.2f}x business, "
+          f"{t_legacy / t_x12:.2f}x raw X12")
+
+if __name__ == "__main__":
+    main()
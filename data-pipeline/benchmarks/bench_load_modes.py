@@ -0,0 +1,107 @@
+"""
+Benchmark: load_practice_data in each of LOAD_MODES: 'values' (execute_values,
+one multi-row INSERT ... ON CONFLICT per BATCH_SIZE rows), 'copy' (COPY into
+temp staging tables, then one INSERT ... SELECT ... ON CONFLICT per table) and
+'parallel' (tables COPYed into tebra_stage concurrently on LOAD_WORKERS
+connections, then merged in FK order).
+
+Uses run_benchmarks' synthetic datasets (extract + enrich output is prepared
+on the replay backend). For each mode the tebra tables are truncated, then
+every practice is loaded twice: a cold pass (all inserts) and a warm pass
+(every row conflicts and updates). Row counts per table must match between
+modes.
+
+TRUNCATES the tebra tables in --dbname: point it at a scratch database (pending
+schema migrations are applied to it first).
+
+Usage:
+    python benchmarks/bench_load_modes.py --dbname tebra_bench --dataset medium
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.run_benchmarks import (DATASETS, TABLES, _count_round_trips, _practice_dir, _practices, _round_trips,
+                                       ensure_inputs, scratch_dbname, use_dataset)
+
+def warehouse(sql, fetch=False):
+    import psycopg2
+    from loading.load_to_postgres import DB_CONFIG
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        cur = conn.cursor()
+        cur.execute(sql)
+        rows = cur.fetchall() if fetch else None
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+def table_counts():
+    query = " UNION ALL ".join(f"SELECT '{t}', COUNT(*) FROM {t}" for t in TABLES)
+    return dict(warehouse(query, fetch=True))
+
+def load_pass(practices, work, mode, verbose):
+    from loading.load_to_postgres import load_practice_data
+    from src.intermediate import count_rows
+
+    trips = _round_trips['postgres']
+    rows = 0
+    start = time.perf_counter()
+    for guid, name in practices:
+        directory = _practice_dir(work, guid)
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            loaded = load_practice_data(data_dir=directory, practice_guid=guid, practice_name=name, load_mode=mode)
+        if loaded is False:
+            raise RuntimeError(f"{mode} load failed for {name}")
+        rows += count_rows(directory, 'encounters_enriched_deterministic.csv')
+    return rows, time.perf_counter() - start, _round_trips['postgres'] - trips
+
+def main():
+    ap = argparse.ArgumentParser(description='Postgres load: execute_values vs COPY + merge vs parallel staging')
+    ap.add_argument('--dbname', required=True, help='Scratch Postgres database (its tebra tables are truncated)')
+    ap.add_argument('--dataset', choices=sorted(DATASETS), default='small')
+    ap.add_argument('--scale', type=int, default=1, help='Multiplies ERAs per practice')
+    ap.add_argument('--verbose', action='store_true', help='Show loader output')
+    args = ap.parse_args()
+    scratch_dbname(ap, args.dbname)
+
+    from loading.load_to_postgres import DB_CONFIG, LOAD_MODES
+    DB_CONFIG['dbname'] = args.dbname
+    dataset, work = use_dataset(args.dataset, args.scale)
+    ensure_inputs('load', dataset, work, args.dbname, args.verbose)
+    practices = _practices(work)
+    import psycopg2
+    from src.migrations import migrate
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+    _count_round_trips()
+
+    print(f"Dataset {args.dataset}x{args.scale}: {len(practices)} practices, database {args.dbname}")
+    counts = {}
+    for mode in LOAD_MODES:
+        warehouse("TRUNCATE TABLE " + ", ".join(TABLES) + " CASCADE")
+        for label in ('cold', 'warm'):
+            rows, elapsed, trips = load_pass(practices, work, mode, args.verbose)
+            print(f"  {mode:<7}{label}: {rows:>9,} lines {elapsed:>8.2f}s {rows / elapsed:>11,.0f} lines/s "
+                  f"{trips:>8,} round trips")
+        counts[mode] = table_counts()
+
+    if len({tuple(sorted(c.items())) for c in counts.values()}) > 1:
+        print("  Row counts differ between modes:")
+        for table in TABLES:
+            print(f"    {table}: " + ", ".join(f"{mode} {c[table]}" for mode, c in counts.items()))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
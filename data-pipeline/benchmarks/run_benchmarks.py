@@ -0,0 +1,401 @@
+"""
+Benchmark suite: every pipeline stage on a fixed synthetic dataset, plus the
+orchestrator end to end, with regression checks against a stored baseline.
+
+Datasets are generated by src/synthetic_data.py (fixed seed, dated up to the
+first of the current month so they stay inside the orchestrator's 365-day
+window) and served by the replay backend (SNOWFLAKE_BACKEND=replay), so no
+Snowflake access is needed. Stages:
+
+    parse         EraParser.parse (business detail) over every ERA in the dataset
+    extract       extract_all_eras for each practice
+    enrich        extract_batch on the extract output
+    load          load_practice_data on the enrich output (needs Postgres)
+    orchestrator  run_pipeline over all practices, full refresh, cold caches (needs Postgres)
+
+load and orchestrator write the synthetic practices into --dbname (default
+tebra_bench; the production database is refused). Its tebra tables are
+truncated before each of them, so every run times the same cold load. They are
+skipped when Postgres can't be reached.
+
+Each stage runs in a fresh process, so peak RSS is that stage's own. Reported
+per stage: rows, wall time, rows/s, peak RSS and round trips to Snowflake
+(replay cursor executes) and Postgres (cursor executes/copies). Every run is
+appended to results/history.json. A stage fails when rows/s drops, or peak RSS
+or round trips grow, by more than --threshold against results/baseline.json;
+stages without a baseline entry are saved as the baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py --dataset small
+    python benchmarks/run_benchmarks.py --dataset medium --stage extract --stage enrich --threshold 0.1
+    python benchmarks/run_benchmarks.py --dataset small --update-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+
+BENCH_DIR = os.path.abspath(os.path.dirname(__file__))
+PIPELINE_ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+sys.path.append(PIPELINE_ROOT)
+sys.path.append(os.path.join(PIPELINE_ROOT, 'extraction'))
+sys.path.append(os.path.join(PIPELINE_ROOT, 'core'))
+
+WORK_DIR = os.path.join(BENCH_DIR, 'work')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# name -> synthetic_data.generate options (service lines = practices x eras x claims x lines)
+DATASETS = {
+    'small': {'practices': 2, 'eras': 10, 'claims': 20, 'lines': 3},
+    'medium': {'practices': 4, 'eras': 50, 'claims': 25, 'lines': 3},
+    'large': {'practices': 8, 'eras': 150, 'claims': 25, 'lines': 3},
+}
+STAGES = ('parse', 'extract', 'enrich', 'load', 'orchestrator')
+# Output a stage reads, produced (untimed) first if it isn't there yet
+REQUIRES = {'enrich': 'extract', 'load': 'enrich'}
+DEFAULT_THRESHOLD = 0.25
+
+# metric -> +1 if larger is better, -1 if smaller is better
+COMPARED_METRICS = {
+    'rows_per_sec': 1,
+    'peak_rss_mb': -1,
+    'snowflake_round_trips': -1,
+    'postgres_round_trips': -1,
+}
+
+# Round trips counted in the stage's process
+_round_trips = {'snowflake': 0, 'postgres': 0}
+
+def _count_round_trips():
+    """Wrap the replay cursor and psycopg2 connections so each statement sent is counted."""
+    import psycopg2
+    import psycopg2.extensions
+    from src import snowflake_replay
+
+    for name in ('execute', 'executemany'):
+        method = getattr(snowflake_replay.ReplayCursor, name)
+        def counted(self, *args, _method=method, **kwargs):
+            _round_trips['snowflake'] += 1
+            return _method(self, *args, **kwargs)
+        setattr(snowflake_replay.ReplayCursor, name, counted)
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def execute(self, *args, **kwargs):
+            _round_trips['postgres'] += 1
+            return super().execute(*args, **kwargs)
+
+        def executemany(self, *args, **kwargs):
+            _round_trips['postgres'] += 1
+            return super().executemany(*args, **kwargs)
+
+        def copy_expert(self, *args, **kwargs):
+            _round_trips['postgres'] += 1
+            return super().copy_expert(*args, **kwargs)
+
+    connect = psycopg2.connect
+    def counting_connect(*args, **kwargs):
+        kwargs.setdefault('cursor_factory', CountingCursor)
+        return connect(*args, **kwargs)
+    psycopg2.connect = counting_connect
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+# Same set (and order) as orchestrator.reset_db
+TABLES = [
+    'tebra.fin_claim_line', 'tebra.clin_encounter_diagnosis', 'tebra.clin_encounter',
+    'tebra.fin_era_bundle', 'tebra.fin_era_report', 'tebra.ref_insurance_policy_guid',
+    'tebra.ref_insurance_policy',
+    'tebra.cmn_location', 'tebra.cmn_provider', 'tebra.cmn_patient', 'tebra.cmn_practice'
+]
+
+def _practices(work):
+    with open(os.path.join(work, 'practices.json')) as f:
+        return json.load(f)
+
+def _practice_dir(work, guid):
+    return os.path.join(work, 'practices', guid)
+
+def scratch_dbname(ap, dbname):
+    """dbname, or an argparse error if it is the warehouse DB_CONFIG points at."""
+    from loading.load_to_postgres import DB_CONFIG
+    if dbname == DB_CONFIG['dbname']:
+        ap.error(f"--dbname {dbname} is the production warehouse; benchmarks truncate it. Use a scratch database.")
+    return dbname
+
+def _postgres_unavailable(dbname):
+    """Migrate and truncate the scratch database, or the reason it can't be reached."""
+    import psycopg2
+    from loading.load_to_postgres import DB_CONFIG
+    from src.migrations import migrate
+    # Shared with the orchestrator's import of the same dict
+    DB_CONFIG['dbname'] = dbname
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+    except Exception as e:
+        return f"Postgres unavailable: {str(e).strip().splitlines()[0]}"
+    try:
+        # Scratch database: bring it to the current schema, then empty it so every run loads cold
+        migrate(conn)
+        conn.cursor().execute("TRUNCATE TABLE " + ", ".join(TABLES + ['tebra.etl_practice_watermark', 'tebra.etl_era_failure']) + " CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+    return None
+
+def _stage_parse(dataset, work, dbname):
+    import pyarrow.parquet as pq
+    from src.era_parser_xml import EraParser
+
+    table = pq.read_table(os.path.join(dataset, 'tables', 'PM_CLEARINGHOUSERESPONSE.parquet'),
+                          columns=['CLEARINGHOUSERESPONSEREPORTTYPENAME', 'FILECONTENTS'])
+    contents = [c for t, c in zip(*table.to_pydict().values()) if t == 'ERA']
+    del table
+    parser = EraParser()
+    start = time.perf_counter()
+    rows = 0
+    for content in contents:
+        parsed = parser.parse(content, detail='business')
+        rows += sum(len(claim['service_lines']) for claim in parsed['claims'])
+    return rows, time.perf_counter() - start
+
+def _stage_extract(dataset, work, dbname):
+    from src.connection import checkout
+    from src.intermediate import count_rows
+    from extract_claim_encounters import extract_all_eras
+
+    conn = checkout()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT PRACTICEGUID, NAME FROM PM_PRACTICE ORDER BY NAME")
+        practices = [list(r) for r in cursor.fetchall()]
+    finally:
+        conn.close()
+    with open(os.path.join(work, 'practices.json'), 'w') as f:
+        json.dump(practices, f)
+    _round_trips['snowflake'] = 0
+
+    start = time.perf_counter()
+    rows = 0
+    for guid, _ in practices:
+        extract_all_eras(guid, start_date='2000-01-01', output_dir=_practice_dir(work, guid))
+        rows += count_rows(_practice_dir(work, guid), 'service_lines.csv')
+    return rows, time.perf_counter() - start
+
+def _stage_enrich(dataset, work, dbname):
+    from src.intermediate import count_rows
+    from extract_batch_optimized import extract_batch
+
+    start = time.perf_counter()
+    rows = 0
+    for guid, _ in _practices(work):
+        directory = _practice_dir(work, guid)
+        extract_batch(input_dir=directory, output_dir=directory)
+        rows += count_rows(directory, 'encounters_enriched_deterministic.csv')
+    return rows, time.perf_counter() - start
+
+def _stage_load(dataset, work, dbname):
+    unavailable = _postgres_unavailable(dbname)
+    if unavailable:
+        return unavailable
+    from src.intermediate import count_rows
+    from loading.load_to_postgres import load_practice_data
+    _round_trips['postgres'] = 0
+
+    start = time.perf_counter()
+    rows = 0
+    for guid, name in _practices(work):
+        directory = _practice_dir(work, guid)
+        if load_practice_data(data_dir=directory, practice_guid=guid, practice_name=name) is False:
+            raise RuntimeError(f"Load failed for {name}")
+        rows += count_rows(directory, 'encounters_enriched_deterministic.csv')
+    return rows, time.perf_counter() - start
+
+def _stage_orchestrator(dataset, work, dbname):
+    unavailable = _postgres_unavailable(dbname)
+    if unavailable:
+        return unavailable
+    import orchestrator
+    from src.intermediate import count_rows
+    _round_trips['postgres'] = 0
+
+    output_root = os.path.join(work, 'orchestrator')
+    shutil.rmtree(output_root, ignore_errors=True)
+    orchestrator.OUTPUT_ROOT = output_root
+    orchestrator.REPORT_FILE = os.path.join(work, 'execution_report.md')
+    start = time.perf_counter()
+    orchestrator.run_pipeline(full_refresh=True, parse_cache=False, entity_cache=False)
+    elapsed = time.perf_counter() - start
+    rows = sum(count_rows(os.path.join(output_root, d), 'encounters_enriched_deterministic.csv')
+               for d in os.listdir(output_root))
+    return rows, elapsed
+
+def run_stage(stage, dataset, work, dbname, verbose=False):
+    """Run one stage in this process; returns its metrics (or {'skipped': reason})."""
+    import logging
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING, force=True)
+    _count_round_trips()
+    result = globals()[f"_stage_{stage}"](dataset, work, dbname)
+    if isinstance(result, str):
+        return {'skipped': result}
+    rows, elapsed = result
+    return {
+        'rows': rows,
+        'wall_sec': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed else 0.0,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'snowflake_round_trips': _round_trips['snowflake'],
+        'postgres_round_trips': _round_trips['postgres'],
+    }
+
+def run_isolated(stage, dataset, work, dbname, verbose=False):
+    """run_stage in a fresh (spawned) process, so RSS and imports start clean."""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(run_stage, (stage, dataset, work, dbname, verbose))
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Regressions of one stage's metrics against its baseline, as readable strings."""
+    regressions = []
+    for metric, direction in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), current.get(metric)
+        if old is None or new is None:
+            continue
+        if direction > 0:
+            worse = new < old * (1 - threshold)
+        else:
+            # Counts at zero stay comparable: 0 -> 1 round trip is a regression
+            worse = new > old * (1 + threshold) and new > old
+        if worse:
+            regressions.append(f"{metric} {old} -> {new}")
+    return regressions
+
+def prepare_dataset(name, scale, seed=0):
+    """Generate the dataset unless an identical one is already on disk; returns its replay directory."""
+    from src.synthetic_data import generate
+
+    spec = dict(DATASETS[name], scale=scale, seed=seed, end=date.today().replace(day=1).isoformat())
+    directory = os.path.join(WORK_DIR, f"{name}x{scale}", 'replay')
+    spec_path = os.path.join(directory, 'dataset.json')
+    if os.path.exists(spec_path):
+        with open(spec_path) as f:
+            if json.load(f) == spec:
+                return directory
+    # Stage outputs of an older dataset go too
+    shutil.rmtree(os.path.dirname(directory), ignore_errors=True)
+    print(f"Generating dataset {name}x{scale}...")
+    options = {k: v for k, v in spec.items() if k != 'end'}
+    generate(directory, end=datetime.fromisoformat(spec['end']), **options)
+    with open(spec_path, 'w') as f:
+        json.dump(spec, f)
+    return directory
+
+def use_dataset(name, scale):
+    """Prepare a dataset and point stage processes at it; returns (replay dir, work dir)."""
+    dataset = prepare_dataset(name, scale)
+    work = os.path.dirname(dataset)
+    # Inherited by every stage process before it imports src.connection
+    os.environ.update({
+        'SNOWFLAKE_BACKEND': 'replay',
+        'SNOWFLAKE_REPLAY_DIR': dataset,
+        'REFERENCE_CACHE': os.path.join(work, 'reference_cache.sqlite'),
+    })
+    return dataset, work
+
+def ensure_inputs(stage, dataset, work, dbname, verbose=False, planned=()):
+    """Produce (untimed) the output `stage` reads, unless it exists or a planned stage makes it."""
+    needed = REQUIRES.get(stage)
+    if not needed or needed in planned or os.path.exists(os.path.join(work, f"{needed}.done")):
+        return
+    ensure_inputs(needed, dataset, work, dbname, verbose)
+    print(f"  (preparing {needed} output for {stage})")
+    metrics = run_isolated(needed, dataset, work, dbname, verbose)
+    if 'skipped' in metrics:
+        raise RuntimeError(f"Can't prepare {needed} output: {metrics['skipped']}")
+    open(os.path.join(work, f"{needed}.done"), 'w').close()
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PIPELINE_ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description='Pipeline stage benchmarks with regression thresholds')
+    ap.add_argument('--dataset', choices=sorted(DATASETS), default='small')
+    ap.add_argument('--scale', type=int, default=1, help='Multiplies ERAs per practice')
+    ap.add_argument('--stage', action='append', choices=STAGES, help='Stage to run (repeatable; default all)')
+    ap.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                    help='Allowed relative regression per metric (0.25 = 25%%)')
+    ap.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    ap.add_argument('--history', default=os.path.join(RESULTS_DIR, 'history.json'))
+    ap.add_argument('--update-baseline', action='store_true', help="Store this run's metrics as the baseline")
+    ap.add_argument('--dbname', default='tebra_bench',
+                    help='Scratch Postgres database for the load and orchestrator stages (its tebra tables are truncated)')
+    ap.add_argument('--verbose', action='store_true', help='Show pipeline logging')
+    args = ap.parse_args()
+    scratch_dbname(ap, args.dbname)
+
+    key = f"{args.dataset}x{args.scale}"
+    dataset, work = use_dataset(args.dataset, args.scale)
+
+    stages = [s for s in STAGES if s in (args.stage or STAGES)]
+    results = {}
+    for stage in stages:
+        ensure_inputs(stage, dataset, work, args.dbname, args.verbose, planned=stages)
+        if stage == 'orchestrator' and os.path.exists(os.environ['REFERENCE_CACHE']):
+            os.remove(os.environ['REFERENCE_CACHE'])
+        metrics = run_isolated(stage, dataset, work, args.dbname, args.verbose)
+        if 'skipped' not in metrics:
+            open(os.path.join(work, f"{stage}.done"), 'w').close()
+        results[stage] = metrics
+
+    history = _load_json(args.history, [])
+    history.append({'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': _git_commit(),
+                    'dataset': key, 'stages': results})
+    _write_json(args.history, history)
+
+    baseline = _load_json(args.baseline, {})
+    stored = baseline.setdefault(key, {})
+    failed = False
+    print(f"\nDataset {key}")
+    print(f"  {'stage':<13}{'rows':>9}{'wall s':>9}{'rows/s':>11}{'RSS MB':>9}{'SF trips':>10}{'PG trips':>10}")
+    for stage, metrics in results.items():
+        if 'skipped' in metrics:
+            print(f"  {stage:<13}skipped: {metrics['skipped']}")
+            continue
+        print(f"  {stage:<13}{metrics['rows']:>9,}{metrics['wall_sec']:>9.2f}{metrics['rows_per_sec']:>11,.0f}"
+              f"{metrics['peak_rss_mb']:>9.0f}{metrics['snowflake_round_trips']:>10,}"
+              f"{metrics['postgres_round_trips']:>10,}")
+        if stage not in stored or args.update_baseline:
+            stored[stage] = metrics
+            continue
+        regressions = compare(metrics, stored[stage], args.threshold)
+        if regressions:
+            failed = True
+            print(f"    REGRESSION vs baseline: {'; '.join(regressions)}")
+    _write_json(args.baseline, baseline)
+    print(f"\nHistory: {args.history}\nBaseline: {args.baseline}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
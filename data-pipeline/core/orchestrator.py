@@ -5,12 +5,17 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import logging
-from src.connection import get_connection
+from src.connection import POOL_SIZE, checkout, close_pool, configure_pool, get_pool
+from src.parse_cache import DEFAULT_PATH as PARSE_CACHE_PATH
+from src.reference_cache import ReferenceCache
+from src.entity_cache import EntityCache
+from src.migrations import migrate
+from src.intermediate import DEFAULT_FORMAT, FORMATS, count_rows, table_exists
 
 # Import Pipeline Steps
-from extraction.extract_claim_encounters import extract_all_eras
-from extraction.extract_batch_optimized import extract_batch
-from loading.load_to_postgres import load_practice_data, DB_CONFIG
+from extraction.extract_claim_encounters import extract_all_eras, parse_pool
+from extraction.extract_batch_optimized import ENRICH_ENGINE, ENRICH_ENGINES, ENRICH_SESSIONS, extract_batch
+from loading.load_to_postgres import LOAD_MODE, LOAD_MODES, LOAD_WORKERS, configure_load_pool, load_practice_data, get_watermark, save_watermark, ERA_RETRY_LIMIT, get_era_failures, record_era_failures, DB_CONFIG
 
 # Setup Logging
 logger = logging.getLogger('Orchestrator')
@@ -18,6 +23,7 @@ logger = logging.getLogger('Orchestrator')
 import csv
 import time
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import psycopg2
 # ... imports ...
@@ -29,7 +35,7 @@ REPORT_FILE = 'execution_report.md'
 
 def get_practices():
     """Get all practices that have clearinghouse response data, regardless of ACTIVE status."""
-    conn = get_connection()
+    conn = checkout()
     cursor = conn.cursor()
     try:
         # Include ACTIVE practices with clearinghouse data
@@ -68,6 +74,8 @@ class PracticeStats:
         self.db_load_status = 'Skipped'
         self.duration_sec = 0
         self.error_msg = ''
+        # (date, id, failed runs) of ERAs that failed to parse (tebra.etl_era_failure)
+        self.era_failures = []
 
 def count_file_lines(filepath):
     """Returns number of lines in file."""
@@ -116,16 +124,36 @@ def generate_report(stats_list):
                     f.write(f"### {s.name}\n")
                     f.write(f"```\n{s.error_msg}\n```\n")
 
+        # ERAs that fail to parse hold the watermark back until ERA_RETRY_LIMIT runs
+        era_failures = [(s, failure) for s in stats_list for failure in s.era_failures]
+        if era_failures:
+            f.write("\n## ERA Parse Failures\n")
+            f.write("| Practice Name | Received | Response ID | Failed Runs | Watermark |\n")
+            f.write("|---|---|---|---|---|\n")
+            for s, (date_recv, response_id, attempts) in era_failures:
+                held = 'Skipped' if attempts >= ERA_RETRY_LIMIT else 'Held'
+                f.write(f"| {s.name} | {date_recv} | {response_id} | {attempts}/{ERA_RETRY_LIMIT} | {held} |\n")
+
     logger.info(f"Report generated: {os.path.abspath(REPORT_FILE)}")
 
+def migrate_db():
+    """Apply pending schema migrations once, before any practice is loaded."""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        applied = migrate(conn)
+        logger.info(f"Schema migrations applied: {len(applied)}" if applied else "Schema is up to date.")
+    finally:
+        conn.close()
+
 def reset_db():
     """Truncate all tables to ensure a clean state."""
-    logger.info("--- TRUNCATING DATABASE TABLES (10 TABLES) ---")
+    logger.info("--- TRUNCATING DATABASE TABLES (11 TABLES) ---")
     conn = psycopg2.connect(**DB_CONFIG)
     cur = conn.cursor()
     tables = [
         'tebra.fin_claim_line', 'tebra.clin_encounter_diagnosis', 'tebra.clin_encounter',
-        'tebra.fin_era_bundle', 'tebra.fin_era_report', 'tebra.ref_insurance_policy',
+        'tebra.fin_era_bundle', 'tebra.fin_era_report', 'tebra.ref_insurance_policy_guid',
+        'tebra.ref_insurance_policy',
         'tebra.cmn_location', 'tebra.cmn_provider', 'tebra.cmn_patient', 'tebra.cmn_practice'
     ]
     try:
@@ -138,9 +166,159 @@ def reset_db():
     finally:
         conn.close()
 
-def run_pipeline(reset=False, practice_filter=None):
+def process_practice(i, total_practices, p_guid, p_name, full_refresh=False, parse_detail='business',
+                     parse_workers=1, parse_cache=True, output_format=DEFAULT_FORMAT, debug_csv=False,
+                     enrich_engine=ENRICH_ENGINE, enrich_sessions=ENRICH_SESSIONS, reference=None,
+                     entities=None, load_mode=LOAD_MODE, parse_executor=None):
+    """Run extract -> validate -> enrich -> load for one practice.
+
+    Self-contained so it can run inside a worker thread: every step checks out
+    its own Snowflake session from the process pool (src/connection.py) and
+    opens its own Postgres connection, and all bookkeeping lives on the
+    returned PracticeStats.
+
+    Unless full_refresh is set, only clearinghouse responses newer than the
+    practice's stored high-water mark are extracted, and the mark is advanced
+    once the load succeeds. parse_detail is passed to EraParser ('business'
+    skips the per-segment dump in eras_extracted.jsonl). ERAs are parsed in
+    parse_executor, the run's shared process pool, if given (else
+    parse_workers > 1 opens one for this practice). parse_cache reuses parsed
+    ERAs from earlier runs (src/parse_cache.py). output_format picks CSV or
+    Parquet for the stage handoff tables; debug_csv keeps CSV copies as well.
+    enrich_engine is the Step 2 lookup strategy, one of ENRICH_ENGINES
+    (extract_batch_optimized); enrich_sessions > 1 runs its independent
+    lookups concurrently. reference is the run's shared ReferenceCache (None
+    queries dictionaries directly); entities the shared EntityCache over
+    tebra_dw dimensions. load_mode is how Step 3 writes to Postgres, one of
+    LOAD_MODES (load_to_postgres).
+    """
+    stats = PracticeStats(p_name, p_guid)
+    stats.start_time = time.time()
+
+    logger.info(f"[{i}/{total_practices}] Processing {p_name}...")
+
+    MAX_RETRIES = 1 # Allow 1 retry per practice
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            folder_name = f"{sanitize(p_name)}_{p_guid}"
+            practice_dir = os.path.join(OUTPUT_ROOT, folder_name)
+
+            # Step 0: Cleanup (if retrying)
+            if attempt > 0:
+                import shutil
+                logger.warning(f"  ... Retrying {p_name} (Attempt {attempt+1}/{MAX_RETRIES+1}). Cleaning {practice_dir}...")
+                if os.path.exists(practice_dir): shutil.rmtree(practice_dir)
+
+            # Step 1: Extract ERAs
+            from datetime import timedelta
+            start_dt = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+            watermark = None if full_refresh else get_watermark(p_guid)
+            if watermark:
+                logger.info(f"  > Step 1: Extracting Clearinghouse Responses newer than {watermark[0]} (ID {watermark[1]})...")
+            else:
+                logger.info(f"  > Step 1: Extracting ALL Clearinghouse Responses (Since {start_dt})...")
+            # ERAs on their last retry stop holding the mark back if they fail again
+            settled = {mark for mark, attempts in get_era_failures(p_guid).items()
+                       if attempts + 1 >= ERA_RETRY_LIMIT}
+
+            extract_result = extract_all_eras(p_guid, start_date=start_dt, output_dir=practice_dir,
+                                              since=watermark, parse_detail=parse_detail,
+                                              parse_workers=parse_workers, executor=parse_executor,
+                                              cache_path=PARSE_CACHE_PATH if parse_cache else None,
+                                              output_format=output_format, debug_csv=debug_csv,
+                                              settled=settled)
+
+            stats.era_count = count_file_lines(os.path.join(practice_dir, 'eras_extracted.jsonl')) + 1 
+            # Note: count_file_lines currently adds robustness for CSVs but jsonl has no header. 
+            # This +1 is a heuristic artifact. Keeping for consistency with report.
+
+            stats.lines_extracted = count_rows(practice_dir, 'service_lines.csv')
+            logger.info(f"    -> Found {stats.era_count} ERAs, {stats.lines_extracted} Lines.")
+
+            # Step 1.5: Validation
+            from validate_extract import validate_extraction
+            if stats.lines_extracted > 0:
+                logger.info("  > Step 1.5: Validating CSV Integrity...")
+                if not validate_extraction(practice_dir):
+                    raise Exception("Extraction Validation Failed (Orphan Lines Detectected)")
+
+            # Step 2: Batch Enrichment
+            logger.info(f"  > Step 2: Batch Enrichment...")
+            if stats.lines_extracted > 0:
+                extract_batch(input_dir=practice_dir, output_dir=practice_dir,
+                              output_format=output_format, debug_csv=debug_csv,
+                              engine=enrich_engine, sessions=enrich_sessions, reference=reference,
+                              entities=entities)
+                stats.lines_enriched = count_rows(practice_dir, 'encounters_enriched_deterministic.csv')
+                logger.info(f"    -> Enriched {stats.lines_enriched} Encounters/Lines.")
+            else:
+                logger.warning("    -> Skipping (No Data).")
+
+            # Step 3: Load to Postgres
+            logger.info(f"  > Step 3: Loading to Postgres...")
+            # Always try to load ERA reports, even if no enriched encounter data
+            if stats.lines_enriched > 0 or table_exists(practice_dir, 'era_reports.csv'):
+                loaded = load_practice_data(
+                    data_dir=practice_dir, 
+                    practice_guid=p_guid,
+                    practice_name=p_name,
+                    era_only=(stats.lines_enriched == 0),
+                    load_mode=load_mode
+                )
+                if loaded is False:
+                    stats.db_load_status = 'Failed'
+                else:
+                    stats.db_load_status = 'Success' if stats.lines_enriched > 0 else 'ERA Only'
+            else:
+                loaded = None
+                stats.db_load_status = 'No Data'
+
+            # Step 4: Advance the high-water mark only after a successful load
+            high_water = (extract_result or {}).get('high_water')
+            if loaded is not False:
+                stats.era_failures = record_era_failures(p_guid, (extract_result or {}).get('failed', []))
+                for date_recv, response_id, attempts in stats.era_failures:
+                    if attempts < ERA_RETRY_LIMIT:
+                        logger.warning(f"    -> ERA {response_id} ({date_recv}) failed to parse on {attempts} run(s); "
+                                       f"watermark held until {ERA_RETRY_LIMIT}")
+                if high_water:
+                    save_watermark(p_guid, *high_water)
+
+            stats.status = 'Success'
+            break # Success, exit retry loop
+
+        except Exception as e:
+            logger.error(f"  !!! FAILED (Attempt {attempt+1}): {str(e)}")
+            if attempt == MAX_RETRIES:
+                stats.status = 'Failed'
+                stats.error_msg = str(e)
+            else:
+               time.sleep(2) # Backoff slightly
+
+        finally:
+            if attempt == MAX_RETRIES or stats.status == 'Success':
+                stats.end_time = time.time()
+                stats.duration_sec = stats.end_time - stats.start_time
+                logger.info(f"  > Finished {p_name} in {stats.duration_sec:.2f}s")
+
+    return stats
+
+def run_pipeline(reset=False, practice_filter=None, workers=1, full_refresh=False, parse_detail='business',
+                 parse_workers=1, parse_cache=True, output_format=DEFAULT_FORMAT, debug_csv=False,
+                 enrich_engine=ENRICH_ENGINE, enrich_sessions=ENRICH_SESSIONS, reference_cache=True,
+                 entity_cache=True, load_mode=LOAD_MODE, load_workers=LOAD_WORKERS, migrate_schema=True):
+    if migrate_schema:
+        migrate_db()
     if reset:
         reset_db()
+        # Truncated warehouse: stored watermarks no longer describe what is loaded
+        full_refresh = True
+
+    # Each practice in flight holds a session for its extract step, or one plus
+    # enrich_sessions during enrichment; size the pool so they never wait on each other
+    configure_pool(max(POOL_SIZE, workers * (max(enrich_sessions, 1) + 1)))
+    # Parallel loads of all practices share these Postgres staging connections
+    configure_load_pool(load_workers)
         
     practices = get_practices()
     if practice_filter:
@@ -154,87 +332,60 @@ def run_pipeline(reset=False, practice_filter=None):
     
     os.makedirs(OUTPUT_ROOT, exist_ok=True)
     stats_list = []
+    # Reference dictionaries (CARC/RARC, POS, procedure, diagnosis) are shared by every practice
+    reference = None
+    if reference_cache:
+        reference = ReferenceCache()
+        conn = checkout()
+        try:
+            reference.check_versions(conn.cursor())
+        finally:
+            conn.close()
+    # Patients/providers/locations/policies already loaded into tebra_dw, shared the same way
+    entities = None
+    if entity_cache:
+        try:
+            entities = EntityCache(psycopg2.connect(**DB_CONFIG))
+        except Exception as e:
+            logger.warning(f"Entity cache unavailable, enriching from Snowflake only: {e}")
+
+    # One parse pool for the run, shared by every practice thread
+    parse_executor = parse_pool(parse_workers) if parse_workers > 1 else None
+
+    practice_opts = {'full_refresh': full_refresh, 'parse_detail': parse_detail, 'parse_workers': parse_workers,
+                     'parse_cache': parse_cache, 'output_format': output_format, 'debug_csv': debug_csv,
+                     'enrich_engine': enrich_engine, 'enrich_sessions': enrich_sessions, 'reference': reference,
+                     'entities': entities, 'load_mode': load_mode, 'parse_executor': parse_executor}
     
-    for i, (p_guid, p_name) in enumerate(practices, 1):
-        stats = PracticeStats(p_name, p_guid)
-        stats.start_time = time.time()
-        stats_list.append(stats)
-        
-        logger.info(f"[{i}/{total_practices}] Processing {p_name}...")
-        
-        MAX_RETRIES = 1 # Allow 1 retry per practice
-        for attempt in range(MAX_RETRIES + 1):
-            try:
-                folder_name = f"{sanitize(p_name)}_{p_guid}"
-                practice_dir = os.path.join(OUTPUT_ROOT, folder_name)
-                
-                # Step 0: Cleanup (if retrying)
-                if attempt > 0:
-                    import shutil
-                    logger.warning(f"  ... Retrying {p_name} (Attempt {attempt+1}/{MAX_RETRIES+1}). Cleaning {practice_dir}...")
-                    if os.path.exists(practice_dir): shutil.rmtree(practice_dir)
-
-                # Step 1: Extract ERAs
-                from datetime import timedelta
-                start_dt = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
-                logger.info(f"  > Step 1: Extracting ALL Clearinghouse Responses (Since {start_dt})...")
-                
-                extract_all_eras(p_guid, start_date=start_dt, output_dir=practice_dir)
-                
-                stats.era_count = count_file_lines(os.path.join(practice_dir, 'eras_extracted.jsonl')) + 1 
-                # Note: count_file_lines currently adds robustness for CSVs but jsonl has no header. 
-                # This +1 is a heuristic artifact. Keeping for consistency with report.
-
-                stats.lines_extracted = count_file_lines(os.path.join(practice_dir, 'service_lines.csv'))
-                logger.info(f"    -> Found {stats.era_count} ERAs, {stats.lines_extracted} Lines.")
-
-                # Step 1.5: Validation
-                from validate_extract import validate_extraction
-                if stats.lines_extracted > 0:
-                    logger.info("  > Step 1.5: Validating CSV Integrity...")
-                    if not validate_extraction(practice_dir):
-                        raise Exception("Extraction Validation Failed (Orphan Lines Detectected)")
-
-                # Step 2: Batch Enrichment
-                logger.info(f"  > Step 2: Batch Enrichment...")
-                if stats.lines_extracted > 0:
-                    extract_batch(input_dir=practice_dir, output_dir=practice_dir)
-                    stats.lines_enriched = count_file_lines(os.path.join(practice_dir, 'encounters_enriched_deterministic.csv'))
-                    logger.info(f"    -> Enriched {stats.lines_enriched} Encounters/Lines.")
-                else:
-                    logger.warning("    -> Skipping (No Data).")
-                
-                # Step 3: Load to Postgres
-                logger.info(f"  > Step 3: Loading to Postgres...")
-                # Always try to load ERA reports, even if no enriched encounter data
-                era_reports_file = os.path.join(practice_dir, 'era_reports.csv')
-                if stats.lines_enriched > 0 or os.path.exists(era_reports_file):
-                    load_practice_data(
-                        data_dir=practice_dir, 
-                        practice_guid=p_guid,
-                        practice_name=p_name,
-                        era_only=(stats.lines_enriched == 0)
-                    )
-                    stats.db_load_status = 'Success' if stats.lines_enriched > 0 else 'ERA Only'
-                else:
-                    stats.db_load_status = 'No Data'
-                
-                stats.status = 'Success'
-                break # Success, exit retry loop
-                
-            except Exception as e:
-                logger.error(f"  !!! FAILED (Attempt {attempt+1}): {str(e)}")
-                if attempt == MAX_RETRIES:
-                    stats.status = 'Failed'
-                    stats.error_msg = str(e)
-                else:
-                   time.sleep(2) # Backoff slightly
-                
-            finally:
-                if attempt == MAX_RETRIES or stats.status == 'Success':
-                    stats.end_time = time.time()
-                    stats.duration_sec = stats.end_time - stats.start_time
-                    logger.info(f"  > Finished in {stats.duration_sec:.2f}s")
+    try:
+        if workers <= 1:
+            for i, (p_guid, p_name) in enumerate(practices, 1):
+                stats_list.append(process_practice(i, total_practices, p_guid, p_name, **practice_opts))
+        else:
+            # Practices are independent (own output dir, own connections, own stats),
+            # and the work is dominated by Snowflake/Postgres round trips, so threads
+            # are enough to keep several practices in flight at once.
+            logger.info(f"Running with {workers} concurrent workers.")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='practice') as pool:
+                futures = [
+                    pool.submit(process_practice, i, total_practices, p_guid, p_name, **practice_opts)
+                    for i, (p_guid, p_name) in enumerate(practices, 1)
+                ]
+                # Collect in submission order so the report matches get_practices() ordering
+                for future in futures:
+                    stats_list.append(future.result())
+    finally:
+        if parse_executor is not None:
+            parse_executor.shutdown(cancel_futures=True)
+        if reference is not None:
+            logger.info(f"Reference cache: {reference.hits} hits, {reference.misses} misses.")
+            reference.close()
+        if entities is not None:
+            logger.info(f"Entity cache: {entities.hits} hits, {entities.misses} misses.")
+            entities.close()
+        pool = get_pool()
+        logger.info(f"Snowflake pool: {pool.opened} connections opened, {pool.reused} reused.")
+        close_pool()
             
     generate_report(stats_list)
 
@@ -242,9 +393,40 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Tebra E2E Data Orchestrator')
     parser.add_argument('--reset', action='store_true', help='Truncate all tables before starting')
     parser.add_argument('--practice', type=str, help='Run only for this specific practice GUID')
+    parser.add_argument('--workers', type=int, default=1, help='Number of practices to process concurrently')
+    parser.add_argument('--full', action='store_true', help='Ignore stored watermarks and re-extract the full lookback window')
+    parser.add_argument('--parse-detail', choices=['business', 'full'], default='business',
+                        help="ERA parse detail: 'full' also writes every segment to eras_extracted.jsonl")
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='Processes used to parse ERAs, shared by all concurrent practices')
+    parser.add_argument('--format', choices=FORMATS, default=DEFAULT_FORMAT,
+                        help='Stage handoff table format (parquet needs pyarrow)')
+    parser.add_argument('--csv-debug', action='store_true', help='With --format parquet, also write CSV copies of each table')
+    parser.add_argument('--enrich-engine', choices=ENRICH_ENGINES, default=ENRICH_ENGINE,
+                        help="Step 2 lookups: 'joined' (three set-based queries), 'columnar' (the same, "
+                             "joined in Arrow; needs pyarrow) or 'stepwise' (one query per table)")
+    parser.add_argument('--enrich-sessions', type=int, default=ENRICH_SESSIONS,
+                        help='Snowflake sessions per practice for concurrent Step 2 lookups (1 = sequential)')
+    parser.add_argument('--no-reference-cache', action='store_true',
+                        help='Query CARC/RARC and other reference dictionaries from Snowflake for every practice')
+    parser.add_argument('--no-entity-cache', action='store_true',
+                        help='Look up every patient/provider/location/policy in Snowflake instead of reusing tebra_dw rows')
+    parser.add_argument('--load-mode', choices=LOAD_MODES, default=LOAD_MODE,
+                        help="Step 3 writes: 'values' (batched INSERTs), 'copy' (COPY into staging tables, one merge per table) "
+                             "or 'parallel' (tables staged concurrently, merged in FK order)")
+    parser.add_argument('--load-workers', type=int, default=LOAD_WORKERS,
+                        help='Postgres connections shared by --load-mode parallel staging')
+    parser.add_argument('--skip-migrations', action='store_true',
+                        help='Do not apply pending database/migrations at startup (schema already migrated at deploy)')
+    parser.add_argument('--no-parse-cache', action='store_true', help='Re-parse every ERA instead of reusing cached results')
     args = parser.parse_args()
     
-    # Simple logging setup
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Simple logging setup (thread name identifies the practice worker when --workers > 1)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s', force=True)
     
-    run_pipeline(reset=args.reset, practice_filter=args.practice)
+    run_pipeline(reset=args.reset, practice_filter=args.practice, workers=args.workers, full_refresh=args.full,
+                 parse_detail=args.parse_detail, parse_workers=args.parse_workers,
+                 parse_cache=not args.no_parse_cache, output_format=args.format, debug_csv=args.csv_debug,
+                 enrich_engine=args.enrich_engine, enrich_sessions=args.enrich_sessions,
+                 reference_cache=not args.no_reference_cache, entity_cache=not args.no_entity_cache,
+                 load_mode=args.load_mode, load_workers=args.load_workers, migrate_schema=not args.skip_migrations)
@@ -16,7 +16,8 @@ def reset_db():
     cur = conn.cursor()
     tables = [
         'tebra.fin_claim_line', 'tebra.clin_encounter_diagnosis', 'tebra.clin_encounter',
-        'tebra.fin_era_bundle', 'tebra.fin_era_report', 'tebra.ref_insurance_policy',
+        'tebra.fin_era_bundle', 'tebra.fin_era_report', 'tebra.ref_insurance_policy_guid',
+        'tebra.ref_insurance_policy',
         'tebra.cmn_location', 'tebra.cmn_provider', 'tebra.cmn_patient', 'tebra.cmn_practice'
     ]
     try:
@@ -1,19 +1,18 @@
-import csv
-import os
 import logging
+from src.intermediate import find_table, read_table
 
 logger = logging.getLogger(__name__)
 
 def validate_extraction(output_dir):
     """
-    Validates integrity of extracted CSVs before loading.
+    Validates integrity of extracted tables (CSV or Parquet) before loading.
     Checks for:
     1. Orphaned Service Lines (Lines pointing to missing Claims)
     """
-    claims_path = os.path.join(output_dir, 'claims_extracted.csv')
-    lines_path = os.path.join(output_dir, 'service_lines.csv')
+    claims_path = find_table(output_dir, 'claims_extracted.csv')
+    lines_path = find_table(output_dir, 'service_lines.csv')
     
-    if not os.path.exists(claims_path) or not os.path.exists(lines_path):
+    if not claims_path or not lines_path:
         # If files missing, maybe no data found? Check existence.
         logger.warning(f"Validation skipped: CSVs not found in {output_dir}")
         return True
@@ -21,11 +20,9 @@ def validate_extraction(output_dir):
     # Load Claim IDs
     claim_ids = set()
     try:
-        with open(claims_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('ClaimID'):
-                    claim_ids.add(row['ClaimID'])
+        for row in read_table(output_dir, 'claims_extracted.csv', columns=['ClaimID']):
+            if row.get('ClaimID'):
+                claim_ids.add(row['ClaimID'])
     except Exception as e:
          logger.error(f"Failed to read claims CSV: {e}")
          return False
@@ -34,15 +31,13 @@ def validate_extraction(output_dir):
     orphans = 0
     total_lines = 0
     try:
-        with open(lines_path, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                total_lines += 1
-                cid = row.get('ClaimID')
-                if cid and cid not in claim_ids:
-                    orphans += 1
-                    if orphans <= 5:
-                        logger.error(f"Orphan Line Found! Line Ref: {row.get('LineID_Ref6R')}, Missing Parent Claim: {cid}")
+        for row in read_table(output_dir, 'service_lines.csv', columns=['ClaimID', 'LineID_Ref6R']):
+            total_lines += 1
+            cid = row.get('ClaimID')
+            if cid and cid not in claim_ids:
+                orphans += 1
+                if orphans <= 5:
+                    logger.error(f"Orphan Line Found! Line Ref: {row.get('LineID_Ref6R')}, Missing Parent Claim: {cid}")
     except Exception as e:
         logger.error(f"Failed to read lines CSV: {e}")
         return False
@@ -7,25 +7,206 @@ import json
 import csv
 import logging
 import hashlib
+import multiprocessing
 import os
 import re
-from src.connection import get_connection
+from concurrent.futures import Future, ProcessPoolExecutor
+from src.connection import checkout
 from src.era_parser_xml import EraParser
+from src.parse_cache import EraParseCache, content_hash
+from src.intermediate import DEFAULT_FORMAT, TableWriter
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.'):
+# Rows pulled from Snowflake per fetchmany() call. Each row can carry a full 835
+# in FILECONTENTS, so this (not practice volume) bounds extraction memory.
+FETCH_BATCH_SIZE = int(os.environ.get('ERA_FETCH_BATCH_SIZE', '100'))
+
+# Non-ERA responses only ever keep this many characters (rejections.csv ContentSnippet)
+SNIPPET_LENGTH = 500
+
+# Position of FILECONTENTS in the extraction SELECT list
+CONTENT_COL = 7
+
+def fetch_era_contents(cursor, practice_guid, response_ids):
+    """Phase 2 of two-phase extraction: full FILECONTENTS for the given ERA response IDs."""
+    if not response_ids:
+        return {}
+    cursor.execute(f"""
+    SELECT CLEARINGHOUSERESPONSEID, FILECONTENTS
+    FROM PM_CLEARINGHOUSERESPONSE
+    WHERE PRACTICEGUID = %s
+      AND CLEARINGHOUSERESPONSEID IN ({", ".join(["%s"] * len(response_ids))})
+    """, [practice_guid, *response_ids])
+    return {r[0]: r[1] for r in cursor.fetchall()}
+
+# Parser shared by everything running in this process (serial path or a parse worker)
+_parser = EraParser()
+
+def extract_line_ref(svc):
+    """LineID from the REF*6R reference: the 6-digit claim ID after 'K', else the raw value."""
+    for r in svc.get('refs', []):
+        if r['type'] == '6R':
+            match = re.search(r'K(\d{6})[A-Z0-9]*$', r['value'])
+            return match.group(1) if match else r['value']
+    return ""
+
+def parse_era_record(job):
+    """Parse one ERA into compact, ready-to-write records.
+
+    Runs inside parse worker processes, so it only takes and returns plain
+    picklable data: the JSONL line, the parsed report fields, and the
+    claims_extracted / service_lines rows.
+    """
+    rid, content, filename, date_recv, ch_response_id, source_name, parse_detail = job
+    try:
+        parsed = _parser.parse(content, detail=parse_detail)
+        if 'error' in parsed:
+            return {'error': parsed['error']}
+        
+        # Metadata injection for JSONL
+        parsed['_metadata'] = {
+            'filename': filename,
+            'received_date': str(date_recv),
+            'clearinghouse_response_id': ch_response_id,
+            'source_db': source_name
+        }
+        parsed['id'] = rid
+        
+        # Extract parsed payment info
+        payment = parsed.get('payment', {})
+        payer = parsed.get('payer', {})
+        
+        claim_rows = []
+        line_rows = []
+        for c in parsed.get('claims', []):
+            claim_rows.append({
+                'EraReportID': rid,
+                'FileName': filename,
+                'ReceivedDate': date_recv,
+                'PayerName': payer.get('name', 'Unknown'),
+                'ClaimID': c.get('claim_id', ''),
+                'PayerControlNumber': c.get('payer_control_number', ''),
+                'PatientName': c.get('patient', {}).get('name', ''),
+                'PatientID': c.get('patient', {}).get('id', ''),
+                'ProviderName': c.get('provider', {}).get('name', ''),
+                'Status': c.get('status_code', ''),
+                'Billed': c.get('charge_amount', '0'),
+                'Paid': c.get('paid_amount', '0'),
+                'PatResp': c.get('patient_resp', '0'),
+                'Adjustments': "; ".join(c.get('adjustments', []))
+            })
+            
+            for svc in c.get('service_lines', []):
+                line_rows.append({
+                    'FileName': filename,
+                    'ClaimID': c.get('claim_id', ''),
+                    'LineID_Ref6R': extract_line_ref(svc),
+                    'Date': svc.get('date', ''),
+                    'ProcCode': svc.get('proc_code', ''),
+                    'Billed': svc.get('charge', '0'),
+                    'Paid': svc.get('paid', '0'),
+                    'Units': svc.get('units', ''),
+                    'Adjustments': "; ".join(svc.get('adjustments', [])),
+                    'Status': c.get('status_code', '')
+                })
+        
+        return {
+            'jsonl': json.dumps(parsed),
+            'report': {
+                'PayerName': payer.get('name', source_name or 'Unknown Payer'),
+                'PayerID': payer.get('id', ''),
+                'CheckNumber': payment.get('check_number', ''),
+                'CheckDate': payment.get('date', ''),
+                'TotalPaid': payment.get('total_paid', 0),
+                'Method': payment.get('method', '')
+            },
+            'claims': claim_rows,
+            'lines': line_rows
+        }
+    except Exception as e:
+        return {'exception': str(e)}
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+def parse_pool(workers):
+    """Process pool for parse_era_record.
+
+    Callers are multi-threaded (practice workers, enrichment lookups, the
+    Snowflake connector), and a forked child can inherit a lock some other
+    thread held; forkserver/spawn children start from a clean process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def _parse_inline(job):
+    """Serial stand-in for ProcessPoolExecutor.submit(parse_era_record, job)."""
+    return _completed(parse_era_record(job))
+
+def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.', since=None,
+                     batch_size=FETCH_BATCH_SIZE, two_phase=True, parse_detail='full',
+                     parse_workers=1, cache_path=None, output_format=DEFAULT_FORMAT, debug_csv=False,
+                     executor=None, settled=()):
     """
     Extract all clearinghouse responses for a practice.
     Now pulls ALL columns from PM_CLEARINGHOUSERESPONSE.
+    Rows are streamed in batches of batch_size and parsed/written as they arrive.
+
+    since: optional (FILERECEIVEDATE, CLEARINGHOUSERESPONSEID) high-water mark.
+           When given, only responses strictly after the mark are extracted.
+    two_phase: pull metadata plus a server-side SUBSTR snippet first, then fetch
+           full FILECONTENTS only for the ERA rows of each batch. Most responses
+           are Processing/CSR reports that only need the snippet.
+    parse_detail: EraParser detail mode. 'business' leaves the per-segment dump
+           out of eras_extracted.jsonl.
+    parse_workers: >1 parses ERAs in a process pool. Batch N is parsed while
+           batch N+1 is fetched; a single writer emits results in query order,
+           so output files are identical to a serial run.
+    executor: a parse_pool() shared across practices; used instead of
+           opening one here, and left running.
+    cache_path: sqlite parse cache (src/parse_cache.py). ERAs whose response ID and
+           content hash are cached are written from the cache without parsing.
+    output_format: 'csv' or 'parquet' for the era_reports / claims_extracted /
+           service_lines handoff tables (src/intermediate.py). debug_csv also
+           writes the CSVs next to Parquet tables.
+
+    settled: (date, id) marks of ERAs that have failed on too many runs; they
+           are still retried here but no longer hold back high_water.
+
+    Returns counts, 'failed', the (date, id) of each response that failed, and
+    'high_water', the newest (date, id) written. It stays below the oldest
+    failed response not in settled, so the next run retries it.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     logger.info(f"Querying ALL Clearinghouse Responses for Practice GUID: {practice_guid} since {start_date}")
     
+    # Incremental window: (date, id) strictly greater than the stored mark
+    since_filter = ""
+    since_params = None
+    if since:
+        since_date, since_id = since
+        logger.info(f"  Incremental mode: after {since_date} / response {since_id}")
+        since_filter = """
+      AND (FILERECEIVEDATE > %s
+           OR (FILERECEIVEDATE = %s AND CLEARINGHOUSERESPONSEID > %s))"""
+        since_params = [since_date, since_date, since_id]
+    
+    # Two-phase: ERA blobs are fetched per batch by ID; everything else only needs
+    # the snippet. ERA rows without an ID can't be fetched later, so keep them inline.
+    if two_phase:
+        content_expr = f"""CASE
+            WHEN CLEARINGHOUSERESPONSEREPORTTYPENAME = 'ERA' AND CLEARINGHOUSERESPONSEID IS NOT NULL THEN NULL
+            WHEN CLEARINGHOUSERESPONSEREPORTTYPENAME = 'ERA' THEN FILECONTENTS
+            ELSE SUBSTR(FILECONTENTS, 1, {SNIPPET_LENGTH})
+        END AS FILECONTENTS"""
+    else:
+        content_expr = "FILECONTENTS"
+    
     # Updated query: ALL columns, NO type filter
     query = f"""
     SELECT 
@@ -36,7 +217,7 @@ def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.'):
         CLEARINGHOUSERESPONSESOURCETYPEID,
         CLEARINGHOUSERESPONSESOURCETYPENAME,
         DENIED,
-        FILECONTENTS,
+        {content_expr},
         FILENAME,
         FILERECEIVEDATE,
         ITEMCOUNT,
@@ -53,23 +234,14 @@ def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.'):
         TOTALAMOUNT
     FROM PM_CLEARINGHOUSERESPONSE 
     WHERE PRACTICEGUID = '{practice_guid}'
-      AND FILERECEIVEDATE >= '{start_date}'
+      AND FILERECEIVEDATE >= '{start_date}'{since_filter}
     ORDER BY FILERECEIVEDATE DESC
     """
     
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    logger.info(f"Found {len(rows)} Clearinghouse Response records to process.")
-    
     os.makedirs(output_dir, exist_ok=True)
     
     jsonl_path = os.path.join(output_dir, 'eras_extracted.jsonl')
-    claims_csv = os.path.join(output_dir, 'claims_extracted.csv')
-    lines_csv  = os.path.join(output_dir, 'service_lines.csv')
     reject_csv = os.path.join(output_dir, 'rejections.csv')
-    reports_csv = os.path.join(output_dir, 'era_reports.csv')
-    
-    parser = EraParser()
     
     # Updated headers with ALL Snowflake columns
     report_headers = [
@@ -98,20 +270,19 @@ def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.'):
     
     reject_headers = ['ReceivedDate', 'FileName', 'Type', 'ContentSnippet']
     
-    with open(jsonl_path, 'w') as f_json, \
-         open(claims_csv, 'w', newline='') as f_claims, \
-         open(lines_csv, 'w', newline='') as f_lines, \
+    table_opts = {'fmt': output_format, 'debug_csv': debug_csv}
+    # The session goes back to the pool when the block exits
+    conn = checkout()
+    with conn, \
+         open(jsonl_path, 'w') as f_json, \
+         TableWriter(output_dir, 'claims_extracted.csv', claim_headers, **table_opts) as writer_claims, \
+         TableWriter(output_dir, 'service_lines.csv', line_headers, **table_opts) as writer_lines, \
          open(reject_csv, 'w', newline='') as f_reject, \
-         open(reports_csv, 'w', newline='') as f_reports:
-        
-        writer_reports = csv.DictWriter(f_reports, fieldnames=report_headers)
-        writer_reports.writeheader()
+         TableWriter(output_dir, 'era_reports.csv', report_headers, **table_opts) as writer_reports:
         
-        writer_claims = csv.DictWriter(f_claims, fieldnames=claim_headers)
-        writer_claims.writeheader()
-        
-        writer_lines = csv.DictWriter(f_lines, fieldnames=line_headers)
-        writer_lines.writeheader()
+        cursor = conn.cursor()
+        blob_cursor = conn.cursor() if two_phase else None
+        cursor.execute(query, since_params)
         
         writer_reject = csv.DictWriter(f_reject, fieldnames=reject_headers)
         writer_reject.writeheader()
@@ -119,8 +290,13 @@ def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.'):
         success_count = 0
         error_count = 0
         rej_count = 0
+        # (date, id) of every written and every failed response
+        written_marks = []
+        failed_marks = []
         
-        for row in rows:
+        def write_response(row, future, cache_key):
+            """Write one response; False if its ERA failed to parse."""
+            nonlocal success_count, rej_count
             # Unpack all 22 columns
             (customer_id, ch_response_id, report_type_id, report_type_name,
              source_type_id, source_type_name, denied_cnt, content, filename,
@@ -131,167 +307,172 @@ def extract_all_eras(practice_guid, start_date='2025-08-01', output_dir='.'):
             # Use Snowflake's ID as primary key (fallback to hash if null)
             rid = ch_response_id if ch_response_id else hashlib.md5(f"{filename}{date_recv}".encode()).hexdigest()
             
+            report_row = {
+                'EraReportID': rid,
+                'ClearinghouseResponseID': ch_response_id,
+                'CustomerID': customer_id,
+                'FileName': filename,
+                'ReceivedDate': date_recv,
+                'ReportTypeID': report_type_id,
+                'ReportTypeName': report_type_name,
+                'SourceTypeID': source_type_id,
+                'SourceTypeName': source_type_name,
+                'PayerName': source_name or 'Unknown',
+                'PayerID': '',
+                'CheckNumber': '',
+                'CheckDate': '',
+                'TotalPaid': 0,
+                'TotalAmount': total_amount or 0,
+                'Method': '',
+                'PracticeGUID': prac_guid,
+                'DeniedCount': denied_cnt or 0,
+                'RejectedCount': rejected_cnt or 0,
+                'ClaimCount': item_count or 0,
+                'PaymentID': payment_id,
+                'ProcessedFlag': processed_flag,
+                'ResponseType': response_type,
+                'ResponseTypeName': response_type_name,
+                'ReviewedFlag': reviewed_flag,
+                'SourceAddress': source_address,
+                'Title': title
+            }
+            
             # --- Type A: Non-ERA (Processing, Rejection, Acknowledgment, etc.) ---
-            if report_type_name not in ('ERA',):
-                snippet = content[:500].replace('\n', ' ').replace('\r', '') if content else ""
+            if future is None:
+                snippet = content[:SNIPPET_LENGTH].replace('\n', ' ').replace('\r', '') if content else ""
                 writer_reject.writerow({
                     'ReceivedDate': date_recv,
                     'FileName': filename,
                     'Type': report_type_name,
                     'ContentSnippet': snippet
                 })
-                rej_count += 1
                 
                 # Still write to era_reports for completeness
-                writer_reports.writerow({
-                    'EraReportID': rid,
-                    'ClearinghouseResponseID': ch_response_id,
-                    'CustomerID': customer_id,
-                    'FileName': filename,
-                    'ReceivedDate': date_recv,
-                    'ReportTypeID': report_type_id,
-                    'ReportTypeName': report_type_name,
-                    'SourceTypeID': source_type_id,
-                    'SourceTypeName': source_type_name,
-                    'PayerName': source_name or 'Unknown',
-                    'PayerID': '',
-                    'CheckNumber': '',
-                    'CheckDate': '',
-                    'TotalPaid': 0,
-                    'TotalAmount': total_amount or 0,
-                    'Method': '',
-                    'PracticeGUID': prac_guid,
-                    'DeniedCount': denied_cnt or 0,
-                    'RejectedCount': rejected_cnt or 0,
-                    'ClaimCount': item_count or 0,
-                    'PaymentID': payment_id,
-                    'ProcessedFlag': processed_flag,
-                    'ResponseType': response_type,
-                    'ResponseTypeName': response_type_name,
-                    'ReviewedFlag': reviewed_flag,
-                    'SourceAddress': source_address,
-                    'Title': title
-                })
-                continue
+                writer_reports.writerow(report_row)
+                rej_count += 1
+                return True
             
-            # --- Type B: ERA Parsing ---
-            try:
-                parsed = parser.parse(content)
-                
-                if 'error' in parsed:
-                    logger.warning(f"Failed to parse ERA {filename}: {parsed['error']}")
-                    error_count += 1
+            # --- Type B: Parsed ERA ---
+            result = future.result()
+            if 'error' in result:
+                logger.warning(f"Failed to parse ERA {filename}: {result['error']}")
+                return False
+            if 'exception' in result:
+                logger.error(f"Error processing {filename}: {result['exception']}")
+                return False
+            
+            if cache_key:
+                cache.put(*cache_key, parse_detail, result)
+            
+            # Write Report with ALL fields
+            report_row.update(result['report'])
+            writer_reports.writerow(report_row)
+            
+            # Write JSONL, Claims and Service Lines
+            f_json.write(result['jsonl'] + "\n")
+            writer_claims.writerows(result['claims'])
+            writer_lines.writerows(result['lines'])
+            
+            success_count += 1
+            return True
+        
+        def write_batch(jobs):
+            """Single writer: emit one fetched batch in query order."""
+            nonlocal error_count
+            for row, future, cache_key in jobs:
+                date_recv, ch_response_id, filename = row[9], row[1], row[8]
+                mark = (date_recv, ch_response_id) if date_recv is not None and ch_response_id is not None else None
+                try:
+                    written = write_response(row, future, cache_key)
+                except Exception as e:
+                    # A bad response is skipped, not fatal to the practice
+                    logger.error(f"Error writing response {filename}: {e}")
+                    written = False
+                if written:
+                    if mark:
+                        written_marks.append(mark)
                     continue
-                
-                # Metadata injection for JSONL
-                parsed['_metadata'] = {
-                    'filename': filename,
-                    'received_date': str(date_recv),
-                    'clearinghouse_response_id': ch_response_id,
-                    'source_db': source_name
-                }
-                parsed['id'] = rid
-                
-                # Extract parsed payment info
-                payment = parsed.get('payment', {})
-                payer = parsed.get('payer', {})
-                
-                # Write Report with ALL fields
-                writer_reports.writerow({
-                    'EraReportID': rid,
-                    'ClearinghouseResponseID': ch_response_id,
-                    'CustomerID': customer_id,
-                    'FileName': filename,
-                    'ReceivedDate': date_recv,
-                    'ReportTypeID': report_type_id,
-                    'ReportTypeName': report_type_name,
-                    'SourceTypeID': source_type_id,
-                    'SourceTypeName': source_type_name,
-                    'PayerName': payer.get('name', source_name or 'Unknown Payer'),
-                    'PayerID': payer.get('id', ''),
-                    'CheckNumber': payment.get('check_number', ''),
-                    'CheckDate': payment.get('date', ''),
-                    'TotalPaid': payment.get('total_paid', 0),
-                    'TotalAmount': total_amount or 0,
-                    'Method': payment.get('method', ''),
-                    'PracticeGUID': prac_guid,
-                    'DeniedCount': denied_cnt or 0,
-                    'RejectedCount': rejected_cnt or 0,
-                    'ClaimCount': item_count or 0,
-                    'PaymentID': payment_id,
-                    'ProcessedFlag': processed_flag,
-                    'ResponseType': response_type,
-                    'ResponseTypeName': response_type_name,
-                    'ReviewedFlag': reviewed_flag,
-                    'SourceAddress': source_address,
-                    'Title': title
-                })
-
-                # Write JSONL
-                f_json.write(json.dumps(parsed) + "\n")
-                
-                # Write Claims
-                for c in parsed.get('claims', []):
-                    c_adjs = "; ".join(c.get('adjustments', []))
+                error_count += 1
+                if mark:
+                    failed_marks.append(mark)
+            
+            # Flush buffers once per batch
+            f_json.flush()
+            writer_claims.flush()
+            writer_lines.flush()
+            f_reject.flush()
+            writer_reports.flush()
+            if cache:
+                cache.commit()
+        
+        cache = EraParseCache(cache_path) if cache_path else None
+        own_executor = executor is None and parse_workers > 1
+        if own_executor:
+            executor = parse_pool(parse_workers)
+        submit = (lambda job: executor.submit(parse_era_record, job)) if executor else _parse_inline
+        
+        try:
+            total_rows = 0
+            pending = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                jobs = []
+                if rows:
+                    total_rows += len(rows)
                     
-                    writer_claims.writerow({
-                        'EraReportID': rid,
-                        'FileName': filename,
-                        'ReceivedDate': date_recv,
-                        'PayerName': payer.get('name', 'Unknown'),
-                        'ClaimID': c.get('claim_id', ''),
-                        'PayerControlNumber': c.get('payer_control_number', ''),
-                        'PatientName': c.get('patient', {}).get('name', ''),
-                        'PatientID': c.get('patient', {}).get('id', ''),
-                        'ProviderName': c.get('provider', {}).get('name', ''),
-                        'Status': c.get('status_code', ''),
-                        'Billed': c.get('charge_amount', '0'),
-                        'Paid': c.get('paid_amount', '0'),
-                        'PatResp': c.get('patient_resp', '0'),
-                        'Adjustments': c_adjs
-                    })
+                    if two_phase:
+                        era_ids = [r[1] for r in rows if r[3] == 'ERA' and r[1] is not None]
+                        contents = fetch_era_contents(blob_cursor, practice_guid, era_ids)
+                        rows = [
+                            r[:CONTENT_COL] + (contents.get(r[1]),) + r[CONTENT_COL + 1:]
+                            if r[3] == 'ERA' and r[1] is not None else r
+                            for r in rows
+                        ]
                     
-                    # Write Service Lines
-                    for svc in c.get('service_lines', []):
-                        line_ref = ""
-                        if 'refs' in svc:
-                            for r in svc['refs']:
-                                if r['type'] == '6R':
-                                    match = re.search(r'K(\d{6})[A-Z0-9]*$', r['value'])
-                                    if match:
-                                        line_ref = match.group(1)
-                                    else:
-                                        line_ref = r['value']
-                                    break
+                    # Hand ERAs to the parse stage; non-ERA rows need no parsing
+                    for r in rows:
+                        if r[3] != 'ERA':
+                            jobs.append((r, None, None))
+                            continue
+                        ch_response_id, content, filename, date_recv, source_name = r[1], r[CONTENT_COL], r[8], r[9], r[19]
                         
-                        s_adjs = "; ".join(svc.get('adjustments', []))
+                        # Cache hit: same response ID, same bytes, same parser version
+                        cache_key = None
+                        if cache and ch_response_id and content:
+                            digest = content_hash(content)
+                            cached = cache.get(ch_response_id, digest, parse_detail)
+                            if cached is not None:
+                                jobs.append((r, _completed(cached), None))
+                                continue
+                            cache_key = (ch_response_id, digest)
                         
-                        writer_lines.writerow({
-                            'FileName': filename,
-                            'ClaimID': c.get('claim_id', ''),
-                            'LineID_Ref6R': line_ref,
-                            'Date': svc.get('date', ''),
-                            'ProcCode': svc.get('proc_code', ''),
-                            'Billed': svc.get('charge', '0'),
-                            'Paid': svc.get('paid', '0'),
-                            'Units': svc.get('units', ''),
-                            'Adjustments': s_adjs,
-                            'Status': c.get('status_code', '')
-                        })
+                        rid = ch_response_id if ch_response_id else hashlib.md5(f"{filename}{date_recv}".encode()).hexdigest()
+                        future = submit((rid, content, filename, date_recv, ch_response_id, source_name, parse_detail))
+                        jobs.append((r, future, cache_key))
                 
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Error processing {filename}: {e}")
-                error_count += 1
-            
-            # Flush buffers
-            f_claims.flush()
-            f_lines.flush()
-            f_reject.flush()
-            f_reports.flush()
+                # Write the previous batch while this one parses
+                if pending:
+                    write_batch(pending)
+                    logger.info(f"  Processed {total_rows - len(rows)} Clearinghouse Response records...")
+                if not rows:
+                    break
+                pending = jobs
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+            if cache:
+                logger.info(f"  Parse cache: {cache.hits} hits, {cache.misses} misses")
+                cache.close()
+    
+    # Next incremental run resumes after the newest written response, but never
+    # past a failed one: everything from the oldest failure on is fetched again
+    oldest_failure = min((m for m in failed_marks if m not in settled), default=None)
+    kept = [m for m in written_marks if oldest_failure is None or m < oldest_failure]
+    high_water = max(kept) if kept else None
     
-    logger.info(f"Extraction Complete. ERAs: {success_count}, Non-ERA: {rej_count}, Errors: {error_count}")
-    return {'success': success_count, 'non_era': rej_count, 'errors': error_count}
+    logger.info(f"Extraction Complete. Records: {total_rows}, ERAs: {success_count}, Non-ERA: {rej_count}, Errors: {error_count}")
+    return {'success': success_count, 'non_era': rej_count, 'errors': error_count,
+            'failed': failed_marks, 'high_water': high_water}
 
 if __name__ == "__main__":
     # Default: Single practice test with 6 months lookback
@@ -4,7 +4,7 @@ Linkage: ERA LineID (REF*6R) -> PM_CLAIM.CLAIMID -> PM_ENCOUNTERPROCEDURE -> PM_
 """
 import csv
 import logging
-from src.connection import get_connection
+from src.connection import checkout
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,7 +34,7 @@ def extract_encounter_details_deterministic():
 
     logger.info(f"Loaded {len(lines_map)} service lines to enrich.")
 
-    conn = get_connection()
+    conn = checkout()
     cursor = conn.cursor()
     
     import time
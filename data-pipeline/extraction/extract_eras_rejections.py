@@ -6,7 +6,7 @@ Query PM_CLEARINGHOUSERESPONSE for ERAs and Rejections.
 import json
 import io
 import re
-from src.connection import get_connection
+from src.connection import checkout
 
 # Constants
 TARGET_PRACTICE_GUID = 'EE5ED349-D9DD-4BF5-81A5-AA503A261961'
@@ -168,7 +168,7 @@ def extract_eras_rejections():
     print_debug(f"Starting extraction for {TARGET_PRACTICE_NAME} ({TARGET_PRACTICE_GUID})...")
     print_debug(f"Lookback window: {LOOKBACK_HOURS} hours")
     
-    conn = get_connection()
+    conn = checkout()
     cursor = conn.cursor()
 
     try:
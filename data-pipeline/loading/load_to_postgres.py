@@ -4,7 +4,16 @@ import psycopg2.extras
 import json
 import os
 import hashlib
+import io
+import re
+import atexit
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from src.connection import ConnectionPool
+from src.intermediate import read_table, table_exists
+from src.migrations import fk_levels
 
 # Connection Config
 DB_CONFIG = {
@@ -16,6 +25,52 @@ DB_CONFIG = {
 }
 
 BATCH_SIZE = 1000
+# Queued clinical + claim line rows that trigger a flush of every table (bounds loader memory)
+FLUSH_ROWS = 20000
+
+# 'values': one multi-row INSERT ... ON CONFLICT per BATCH_SIZE rows (execute_values).
+# 'copy': COPY a table's rows into a temp staging table, then one INSERT ... SELECT ... ON CONFLICT.
+# 'parallel': COPY every clinical/claim table into tebra_stage concurrently on LOAD_WORKERS pooled
+#     connections, then merge them in FK order in the load's single transaction.
+LOAD_MODES = ('values', 'copy', 'parallel')
+LOAD_MODE = os.environ.get('LOAD_MODE', 'values')
+# Rows per COPY statement in copy mode (bounds the text buffer, not the merge)
+COPY_BATCH_SIZE = 50000
+# Postgres connections shared by every load in the process for parallel-mode staging
+LOAD_WORKERS = int(os.environ.get('LOAD_WORKERS', '4'))
+# Runs an ERA may fail to parse before the watermark moves past it (tebra.etl_era_failure)
+ERA_RETRY_LIMIT = int(os.environ.get('ERA_RETRY_LIMIT', '3'))
+# UNLOGGED copies of the loaded tables plus load_id (database/migrations/005_add_load_staging.sql)
+STAGE_SCHEMA = 'tebra_stage'
+
+# Handoff-table columns each load phase reads (Parquet intermediates read only these)
+REPORT_COLUMNS = [
+    'EraReportID', 'FileName', 'ReceivedDate', 'PayerName', 'PayerID', 'CheckNumber', 'CheckDate',
+    'TotalPaid', 'Method', 'PracticeGUID', 'DeniedCount', 'RejectedCount', 'ClaimCount'
+]
+BUNDLE_COLUMNS = ['ClaimID', 'PayerName', 'Paid', 'PatResp', 'EraReportID']
+CLINICAL_COLUMNS = [
+    'DB_PatientGUID', 'PatientID', 'PatientName', 'PatientCaseID', 'PatientDOB', 'PatientGender',
+    'PatientAddress', 'PatientCity', 'PatientState', 'PatientZip',
+    'Patient_PracticeGUID', 'Patient_PrimaryProvGUID', 'Patient_DefaultLocGUID', 'Patient_ReferringProvGUID', 'Patient_Active',
+    'ProviderGUID', 'ProviderNPI', 'ProviderName', 'Provider_PracticeGUID', 'Provider_ID', 'Provider_TaxonomyCode',
+    'ServiceLocationGUID', 'FacilityName', 'FacilityAddress', 'FacilityCity', 'FacilityState',
+    'Location_PracticeGUID', 'Location_NPI', 'Location_POSCode', 'Location_ID',
+    'Insurance_PolicyNum', 'Insurance_GroupNum', 'Insurance_Company', 'Insurance_Plan',
+    'Policy_Start', 'Policy_End', 'Policy_Copay', 'Policy_PracticeGUID', 'Policy_PatientCaseID', 'Policy_GUID', 'Policy_Precedence',
+    'Patient_RefreshedAt', 'Provider_RefreshedAt', 'Location_RefreshedAt', 'Policy_RefreshedAt',
+    'EncounterID', 'Enc_EncounterGUID', 'EncounterDate', 'EncounterStatus',
+    'Appt_Type', 'Appt_Reason', 'Appt_Desc', 'Appt_Subject', 'Appt_Notes', 'POS_Desc',
+    'ReferringProvGUID', 'Enc_PracticeGUID', 'Enc_ApptGUID', 'Enc_POSCode',
+] + [f'DiagID_{i}' for i in range(1, 9)] + [f'DiagDesc_{i}' for i in range(1, 9)]
+CLAIM_LINE_COLUMNS = [
+    'EncounterID', 'ClaimID', 'LineID_Ref6R', 'DB_ClaimID', 'ServiceLocationGUID', 'Date', 'ProcCode',
+    'Proc_Description', 'Billed', 'Paid', 'Units', 'Adjustments', 'Adjustment_Descriptions',
+    'Claim_Status', 'Payer_Status', 'Claim_PracticeGUID', 'Enc_PracticeGUID', 'Tracking_Num', 'CH_Payer',
+    'DB_PatientGUID', 'DB_EncounterProcedureID'
+]
+# Both read in the same pass over the enriched table
+ENRICHED_COLUMNS = list(dict.fromkeys(CLINICAL_COLUMNS + CLAIM_LINE_COLUMNS))
 
 def get_db():
     try:
@@ -80,15 +135,111 @@ def make_policy_key(pol, grp):
     raw = f"{pol or ''}|{grp or ''}"
     return hashlib.md5(raw.encode()).hexdigest()
 
-def execute_batch(cursor, sql, data, desc):
+# INSERT INTO <table> (<columns>) VALUES %s <ON CONFLICT ...>, as passed to execute_batch
+_UPSERT = re.compile(r'INSERT INTO\s+([\w.]+)\s*\(([^)]*)\)\s*VALUES\s+%s\s*(.*)', re.S | re.I)
+
+def copy_text(val):
+    """A value in COPY's text format."""
+    if val is None: return '\\N'
+    if val is True: return 't'
+    if val is False: return 'f'
+    return str(val).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def copy_merge(cursor, sql, data):
+    """Run an execute_values upsert as COPY into a staging table plus one set-based merge."""
+    table, columns, conflict = _UPSERT.match(sql.strip()).groups()
+    stage = f"stage_{table.split('.')[-1]}"
+    cursor.execute(f"CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    for start in range(0, len(data), COPY_BATCH_SIZE):
+        buf = io.StringIO()
+        for row in data[start:start + COPY_BATCH_SIZE]:
+            buf.write("\t".join(copy_text(v) for v in row) + "\n")
+        buf.seek(0)
+        cursor.copy_expert(f"COPY {stage} ({columns}) FROM STDIN", buf)
+    cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} {conflict}")
+    cursor.execute(f"DROP TABLE {stage}")
+
+def execute_batch(cursor, sql, data, desc, mode=LOAD_MODE):
     if not data: return
     try:
-        psycopg2.extras.execute_values(cursor, sql, data, page_size=BATCH_SIZE)
+        if mode != 'values':
+            copy_merge(cursor, sql, data)
+        else:
+            psycopg2.extras.execute_values(cursor, sql, data, page_size=BATCH_SIZE)
         print(f"  -> {desc}: Loaded {len(data)} rows.")
     except Exception as e:
         print(f"  -> Error loading {desc}: {e}")
         raise e
 
+def upsert_table(sql):
+    return _UPSERT.match(sql.strip()).group(1)
+
+def staging_table(table):
+    return f"{STAGE_SCHEMA}.{table.split('.')[-1]}"
+
+_load_pool = None
+_load_pool_lock = threading.Lock()
+
+def get_load_pool():
+    """The process-wide Postgres pool used for parallel-mode staging."""
+    global _load_pool
+    with _load_pool_lock:
+        if _load_pool is None:
+            _load_pool = ConnectionPool(lambda: psycopg2.connect(**DB_CONFIG), size=LOAD_WORKERS,
+                                        name='Postgres', size_env='LOAD_WORKERS')
+        return _load_pool
+
+def configure_load_pool(size):
+    """Set how many staging connections all concurrent loads share."""
+    get_load_pool().resize(size)
+
+@atexit.register
+def close_load_pool():
+    global _load_pool
+    with _load_pool_lock:
+        pool, _load_pool = _load_pool, None
+    if pool is not None:
+        pool.close()
+
+def stage_rows(load_id, sql, data):
+    """COPY an upsert's rows into its tebra_stage table on a pooled connection, tagged with load_id."""
+    table, columns, _ = _UPSERT.match(sql.strip()).groups()
+    buf = io.StringIO()
+    for row in data:
+        buf.write(load_id + "\t" + "\t".join(copy_text(v) for v in row) + "\n")
+    buf.seek(0)
+    with get_load_pool().checkout() as conn:
+        try:
+            conn.cursor().copy_expert(f"COPY {staging_table(table)} (load_id, {columns}) FROM STDIN", buf)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(data)
+
+def merge_staged(cursor, sql, load_id):
+    """Upsert one load's staged rows into the target table and clear them, inside cursor's transaction."""
+    table, columns, conflict = _UPSERT.match(sql.strip()).groups()
+    stage = staging_table(table)
+    cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} WHERE load_id = %s {conflict}",
+                   (load_id,))
+    cursor.execute(f"DELETE FROM {stage} WHERE load_id = %s", (load_id,))
+
+def discard_staged(load_id, tables):
+    """Delete a failed load's staged rows."""
+    try:
+        with get_load_pool().checkout() as conn:
+            try:
+                cur = conn.cursor()
+                for table in tables:
+                    cur.execute(f"DELETE FROM {staging_table(table)} WHERE load_id = %s", (load_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    except Exception as e:
+        print(f"Warning: could not discard staged rows for load {load_id}: {e}")
+
 def load_service_lines(conn):
     """
     Loads extracted service lines from service_lines.csv into tebra.fin_claim_line.
@@ -195,32 +346,186 @@ def load_practice_info(cur, guid, name):
     except Exception as e:
         print(f"Error loading practice info: {e}")
 
-def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era_only=False):
+def get_watermark(practice_guid):
+    """Return the (FILERECEIVEDATE, CLEARINGHOUSERESPONSEID) high-water mark for a practice.
+
+    Returns None when no mark has been recorded yet (or the table is missing),
+    which callers treat as "do a full refresh".
+    """
+    conn = get_db()
+    if not conn: return None
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT last_file_receive_date, last_clearinghouse_response_id
+            FROM tebra.etl_practice_watermark
+            WHERE practice_guid = %s
+        """, (practice_guid,))
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else None
+    except Exception as e:
+        print(f"Could not read watermark for {practice_guid}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def save_watermark(practice_guid, file_receive_date, response_id):
+    """Advance the practice high-water mark. Never moves it backwards."""
+    conn = get_db()
+    if not conn: return
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO tebra.etl_practice_watermark (
+                practice_guid, last_file_receive_date, last_clearinghouse_response_id, updated_at
+            ) VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (practice_guid) DO UPDATE
+            SET last_file_receive_date = EXCLUDED.last_file_receive_date,
+                last_clearinghouse_response_id = EXCLUDED.last_clearinghouse_response_id,
+                updated_at = NOW()
+            WHERE (EXCLUDED.last_file_receive_date, EXCLUDED.last_clearinghouse_response_id)
+                > (tebra.etl_practice_watermark.last_file_receive_date,
+                   tebra.etl_practice_watermark.last_clearinghouse_response_id)
+        """, (practice_guid, file_receive_date, response_id))
+        conn.commit()
+    except Exception as e:
+        print(f"Could not save watermark for {practice_guid}: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+def get_era_failures(practice_guid):
+    """Return {(FILERECEIVEDATE, CLEARINGHOUSERESPONSEID): failed runs} for a practice's ERAs."""
+    conn = get_db()
+    if not conn: return {}
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT file_receive_date, clearinghouse_response_id, attempts
+            FROM tebra.etl_era_failure
+            WHERE practice_guid = %s
+        """, (practice_guid,))
+        return {(row[0], row[1]): row[2] for row in cur.fetchall()}
+    except Exception as e:
+        print(f"Could not read ERA failures for {practice_guid}: {e}")
+        return {}
+    finally:
+        conn.close()
+
+def record_era_failures(practice_guid, failed):
+    """Count one more failed run for each (date, id) in failed.
+
+    ERAs still under ERA_RETRY_LIMIT held the watermark back, so this run
+    fetched them again: any missing from failed parsed and are forgotten.
+    Returns [(date, id, attempts)] for the ERAs in failed.
+    """
+    conn = get_db()
+    if not conn: return []
+    failed_ids = [rid for _, rid in failed]
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM tebra.etl_era_failure
+            WHERE practice_guid = %s AND attempts < %s
+              AND NOT (clearinghouse_response_id = ANY(%s))
+        """, (practice_guid, ERA_RETRY_LIMIT, failed_ids))
+        rows = []
+        if failed:
+            rows = psycopg2.extras.execute_values(cur, """
+                INSERT INTO tebra.etl_era_failure (
+                    practice_guid, file_receive_date, clearinghouse_response_id
+                ) VALUES %s
+                ON CONFLICT (practice_guid, clearinghouse_response_id) DO UPDATE
+                SET attempts = tebra.etl_era_failure.attempts + 1,
+                    last_failed_at = NOW()
+                RETURNING file_receive_date, clearinghouse_response_id, attempts
+            """, [(practice_guid, date, rid) for date, rid in failed], fetch=True)
+        conn.commit()
+        return [tuple(row) for row in rows]
+    except Exception as e:
+        print(f"Could not record ERA failures for {practice_guid}: {e}")
+        conn.rollback()
+        return []
+    finally:
+        conn.close()
+
+def recount_era_counts(cur, report_ids=None, claim_refs=None):
+    """Recompute fin_era_report denied/rejected counts from the loaded claim lines.
+
+    Only reports in report_ids, or owning a bundle in claim_refs, are recounted;
+    with neither given every report in the warehouse is.
+    """
+    scope = ""
+    params = None
+    if report_ids is not None or claim_refs is not None:
+        scope = """
+                    WHERE b.era_report_id IN (
+                        SELECT unnest(%s::text[])
+                        UNION
+                        SELECT era_report_id FROM tebra.fin_era_bundle WHERE claim_reference_id = ANY(%s::text[])
+                    )"""
+        params = (sorted(report_ids or ()), sorted(claim_refs or ()))
+    cur.execute(f"""
+        WITH counts AS (
+            SELECT 
+                b.era_report_id,
+                COUNT(CASE WHEN cl.payer_status ILIKE '%%Denied%%' OR cl.claim_status ILIKE '%%Denied%%' THEN 1 END) as d_count,
+                COUNT(CASE WHEN cl.payer_status ILIKE '%%Rejected%%' OR cl.claim_status ILIKE '%%Rejected%%' THEN 1 END) as r_count
+            FROM tebra.fin_era_bundle b
+            JOIN tebra.fin_claim_line cl ON b.claim_reference_id = cl.claim_reference_id{scope}
+            GROUP BY b.era_report_id
+        )
+        UPDATE tebra.fin_era_report r
+        SET denied_count = c.d_count,
+            rejected_count = c.r_count
+        FROM counts c
+        WHERE r.era_report_id = c.era_report_id
+    """, params)
+    return cur.rowcount
+
+def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era_only=False, load_mode=LOAD_MODE):
     """Load practice data to Postgres.
     
     Args:
-        data_dir: Directory containing the extracted CSV files
+        data_dir: Directory containing the extracted handoff tables (CSV or Parquet)
         era_only: If True, only load ERA reports (skip bundles and clinical data)
+        load_mode: 'values' (batched multi-row INSERTs), 'copy' (COPY into staging
+            tables, then one merge per table) or 'parallel' (stage every table
+            concurrently on pooled connections, merge in FK order); see LOAD_MODES
+
+    Returns:
+        True if the load transaction committed, False if it was rolled back
+        (None when there was nothing to load).
     """
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode {load_mode!r}; expected one of {LOAD_MODES}")
     conn = get_db()
-    if not conn: return
+    if not conn: return False
     
-    # Files acting as our "Single Practice" source
-    file_era = os.path.join(data_dir, 'claims_extracted.csv')
-    file_enc = os.path.join(data_dir, 'encounters_enriched_deterministic.csv')
-    file_reports = os.path.join(data_dir, 'era_reports.csv')
+    # Tables acting as our "Single Practice" source
+    file_era = 'claims_extracted.csv'
+    file_enc = 'encounters_enriched_deterministic.csv'
+    file_reports = 'era_reports.csv'
     
-    # For ERA-only mode, we only need era_reports.csv
+    # For ERA-only mode, we only need era_reports
     if era_only:
-        if not os.path.exists(file_reports):
+        if not table_exists(data_dir, file_reports):
             print(f"ERA reports file not found in {data_dir}.")
             return
     else:
-        if not os.path.exists(file_era) or not os.path.exists(file_enc):
+        if not table_exists(data_dir, file_era) or not table_exists(data_dir, file_enc):
             print(f"Source files not found in {data_dir}.")
             return
 
     print(f"Starting Load Transaction for {data_dir}...{'  [ERA ONLY]' if era_only else ''}")
+    # Phase 4 recounts only the reports this load can have changed
+    recount_reports = set()
+    recount_claims = set()
+    # Parallel mode: staging threads, in-flight copies and the tables they write to
+    executor = None
+    staging = []
+    staged_tables = []
+    load_id = uuid.uuid4().hex
     try:
         cur = conn.cursor()
         
@@ -233,33 +538,25 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
         print("Phase 0: ERA Reports...")
 
         
-        if os.path.exists(file_reports):
-            # Schema Migration for PracticeGUID (Transient)
-            try:
-                cur.execute("ALTER TABLE tebra.fin_era_report ADD COLUMN IF NOT EXISTS practice_guid TEXT")
-                conn.commit()
-            except Exception as e:
-                conn.rollback()
-
+        if table_exists(data_dir, file_reports):
             reports = []
             seen_reports = set()
-            with open(file_reports, 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    rid = row.get('EraReportID')
-                    if not rid or rid in seen_reports: continue
-                    
-                    reports.append((
-                        rid, row.get('FileName'), clean_date(row.get('ReceivedDate')),
-                        row.get('PayerName'), row.get('PayerID'),
-                        row.get('CheckNumber'), clean_date(row.get('CheckDate')),
-                        clean_money(row.get('TotalPaid')), row.get('Method'),
-                        row.get('PracticeGUID'),
-                        int(row.get('DeniedCount') or 0),
-                        int(row.get('RejectedCount') or 0),
-                        int(row.get('ClaimCount') or 0)
-                    ))
-                    seen_reports.add(rid)
+            for row in read_table(data_dir, file_reports, columns=REPORT_COLUMNS):
+                rid = row.get('EraReportID')
+                if not rid or rid in seen_reports: continue
+                
+                reports.append((
+                    rid, row.get('FileName'), clean_date(row.get('ReceivedDate')),
+                    row.get('PayerName'), row.get('PayerID'),
+                    row.get('CheckNumber'), clean_date(row.get('CheckDate')),
+                    clean_money(row.get('TotalPaid')), row.get('Method'),
+                    row.get('PracticeGUID'),
+                    int(row.get('DeniedCount') or 0),
+                    int(row.get('RejectedCount') or 0),
+                    int(row.get('ClaimCount') or 0)
+                ))
+                seen_reports.add(rid)
+                recount_reports.add(rid)
 
             sql_report = """
                 INSERT INTO tebra.fin_era_report (
@@ -275,39 +572,45 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
                     rejected_count = EXCLUDED.rejected_count,
                     claim_count_source = EXCLUDED.claim_count_source
             """
-            execute_batch(cur, sql_report, reports, "ERA Reports")
+            execute_batch(cur, sql_report, reports, "ERA Reports", mode=load_mode)
 
         # ==========================================================
         # 1. Load ERA Bundles (Parents) - Skip if ERA only
         # ==========================================================
-        if not era_only and os.path.exists(file_era):
+        if not era_only and table_exists(data_dir, file_era):
             print("Phase 1: ERA Bundles...")
             bundles = []
             seen_bundles = set()
             
-            with open(file_era, 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    ref_id = row.get('ClaimID')
-                    if not ref_id or ref_id in seen_bundles: continue
-                    
-                    bundles.append((
-                        ref_id,
-                        row.get('PayerName'),
-                        clean_money(row.get('Paid')),
-                        clean_money(row.get('PatResp')),
-                        row.get('EraReportID') # New FK
-                        # ReceivedDate missing in this CSV, default to null or enrich later
-                    ))
-                    seen_bundles.add(ref_id)
+            for row in read_table(data_dir, file_era, columns=BUNDLE_COLUMNS):
+                ref_id = row.get('ClaimID')
+                if not ref_id or ref_id in seen_bundles: continue
+                
+                bundles.append((
+                    ref_id,
+                    row.get('PayerName'),
+                    clean_money(row.get('Paid')),
+                    clean_money(row.get('PatResp')),
+                    row.get('EraReportID') # New FK
+                    # ReceivedDate missing in this CSV, default to null or enrich later
+                ))
+                seen_bundles.add(ref_id)
+                recount_claims.add(ref_id)
+                if row.get('EraReportID'):
+                    recount_reports.add(row.get('EraReportID'))
             
+            # A bundle moving to another report changes the count of the one it leaves
+            if bundles:
+                cur.execute("SELECT DISTINCT era_report_id FROM tebra.fin_era_bundle WHERE claim_reference_id = ANY(%s::text[])",
+                            (sorted(seen_bundles),))
+                recount_reports.update(r[0] for r in cur.fetchall() if r[0])
             sql_bundle = """
                 INSERT INTO tebra.fin_era_bundle (claim_reference_id, payer_name, total_paid, total_patient_resp, era_report_id)
                 VALUES %s
                 ON CONFLICT (claim_reference_id) DO UPDATE 
                 SET total_paid = EXCLUDED.total_paid, era_report_id = EXCLUDED.era_report_id
             """
-            execute_batch(cur, sql_bundle, bundles, "ERA Bundles")
+            execute_batch(cur, sql_bundle, bundles, "ERA Bundles", mode=load_mode)
         elif era_only:
             print("Phase 1: Skipped (ERA Only Mode)")
 
@@ -321,143 +624,15 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
             print("Success! Transaction Committed.")
             cur.close()
             conn.close()
-            return
+            return True
             
-        print("Phase 2: Clinical Data...")
-        
-        batch_pat = []
-        batch_prov = []
-        batch_loc = []
-        batch_ins = []
-        batch_enc = []
-        batch_diag = []
-        
-        seen_pat = set()
-        seen_prov = set()
-        seen_loc = set()
-        seen_ins = set()
-        seen_enc = set()
-        
-        with open(file_enc, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Entities
-                pat_guid = row.get('DB_PatientGUID')
-                if pat_guid and pat_guid not in seen_pat:
-                    # Added Patient Mapping (with new FK columns)
-                    batch_pat.append((
-                        pat_guid, clean_str(row.get('PatientID')), clean_str(row.get('PatientName')), clean_str(row.get('PatientCaseID')),
-                        clean_date(row.get('PatientDOB')), clean_str(row.get('PatientGender')),
-                        clean_str(row.get('PatientAddress')), clean_str(row.get('PatientCity')), clean_str(row.get('PatientState')), clean_str(row.get('PatientZip')),
-                        clean_id(row.get('Patient_PracticeGUID')),
-                        clean_id(row.get('Patient_PrimaryProvGUID')),
-                        clean_id(row.get('Patient_DefaultLocGUID')),
-                        clean_id(row.get('Patient_ReferringProvGUID')),
-                        True if row.get('Patient_Active') in (True, 'True', 'true', '1', 1) else (False if row.get('Patient_Active') in (False, 'False', 'false', '0', 0) else None)
-                    )) 
-                    seen_pat.add(pat_guid)
-                
-                prov_guid = row.get('ProviderGUID')
-                if prov_guid and prov_guid not in seen_prov:
-                    batch_prov.append((
-                        prov_guid, clean_str(row.get('ProviderNPI')), clean_str(row.get('ProviderName')),
-                        clean_id(row.get('Provider_PracticeGUID')),
-                        clean_int(row.get('Provider_ID')),
-                        clean_str(row.get('Provider_TaxonomyCode'))
-                    ))
-                    seen_prov.add(prov_guid)
-                    
-                loc_guid = row.get('ServiceLocationGUID')
-                if loc_guid and loc_guid not in seen_loc:
-                    addr_json = json.dumps({
-                        'address': clean_str(row.get('FacilityAddress')), 
-                        'city': clean_str(row.get('FacilityCity')), 
-                        'state': clean_str(row.get('FacilityState'))
-                    })
-                    batch_loc.append((
-                        loc_guid, clean_str(row.get('FacilityName')), addr_json,
-                        clean_id(row.get('Location_PracticeGUID')),
-                        clean_str(row.get('Location_NPI')),
-                        clean_str(row.get('Location_POSCode')),
-                        clean_int(row.get('Location_ID'))
-                    ))
-                    seen_loc.add(loc_guid)
-                
-                # Insurance
-                pol_num = clean_str(row.get('Insurance_PolicyNum'))
-                grp_num = clean_str(row.get('Insurance_GroupNum'))
-                pol_key = None
-                if pol_num or grp_num:
-                    pol_key = make_policy_key(pol_num, grp_num)
-                    if pol_key not in seen_ins:
-                        batch_ins.append((
-                            pol_key, clean_str(row.get('Insurance_Company')), clean_str(row.get('Insurance_Plan')), pol_num, grp_num,
-                            clean_date(row.get('Policy_Start')), clean_date(row.get('Policy_End')), clean_money(row.get('Policy_Copay')),
-                            clean_id(row.get('Policy_PracticeGUID')),
-                            clean_int(row.get('Policy_PatientCaseID')),
-                            clean_id(row.get('Policy_GUID')),
-                            clean_int(row.get('Policy_Precedence'))
-                        ))
-                        seen_ins.add(pol_key)
-                
-                # Encounter
-                enc_id = row.get('EncounterID')
-                if enc_id and enc_id not in seen_enc:
-                    batch_enc.append((
-                        enc_id, row.get('Enc_EncounterGUID'), clean_date(row.get('EncounterDate')),
-                        clean_str(row.get('EncounterStatus')), clean_str(row.get('Appt_Type')), clean_str(row.get('Appt_Reason') or row.get('Appt_Desc')),
-                        clean_str(row.get('Appt_Subject')), 
-                        clean_str(row.get('Appt_Notes')),   
-                        clean_str(row.get('POS_Desc')),
-                        pat_guid, prov_guid, loc_guid, pol_key,
-                        clean_id(row.get('ReferringProvGUID')),
-                        clean_id(row.get('Enc_PracticeGUID')),
-                        clean_id(row.get('Enc_ApptGUID')),
-                        clean_int(row.get('PatientCaseID')),
-                        clean_str(row.get('Enc_POSCode'))
-                    ))
-                    
-                    # Diagnoses (with new FK columns)
-                    enc_seen_diags = set()
-                    enc_guid_for_diag = row.get('Enc_EncounterGUID')
-                    enc_practice_guid_for_diag = clean_id(row.get('Enc_PracticeGUID'))
-                    for i in range(1, 9):
-                        d_code = clean_str(row.get(f'DiagID_{i}'))
-                        d_desc = clean_str(row.get(f'DiagDesc_{i}'))
-                        if d_code and d_code not in enc_seen_diags:
-                            batch_diag.append((enc_id, d_code, i, d_desc, enc_practice_guid_for_diag, enc_guid_for_diag))
-                            enc_seen_diags.add(d_code)
-                            
-                    seen_enc.add(enc_id)
-                
-                # End of Encounter processing
-                # Old claim line logic removed - now handled by load_service_lines
-
-        # Execute Batches
-        # Schema Migrations (Transient)
-        try:
-             cur.execute("ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS dob DATE")
-             cur.execute("ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS gender TEXT")
-             cur.execute("ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS address_line1 TEXT")
-             cur.execute("ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS city TEXT")
-             cur.execute("ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS state TEXT")
-             cur.execute("ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS zip TEXT")
-             
-             cur.execute("ALTER TABLE tebra.ref_insurance_policy ADD COLUMN IF NOT EXISTS start_date DATE")
-             cur.execute("ALTER TABLE tebra.ref_insurance_policy ADD COLUMN IF NOT EXISTS end_date DATE")
-             cur.execute("ALTER TABLE tebra.ref_insurance_policy ADD COLUMN IF NOT EXISTS copay NUMERIC(18,2)")
-             
-             cur.execute("ALTER TABLE tebra.clin_encounter ADD COLUMN IF NOT EXISTS referring_provider_guid TEXT")
-             
-             conn.commit()
-        except Exception as e:
-             conn.rollback()
+        print("Phase 2/3: Clinical Data and Claim Lines (single pass)...")
 
-        # Updated to UPSERT to backfill names
         sql_pat = """
             INSERT INTO tebra.cmn_patient (
                 patient_guid, patient_id, full_name, case_id, dob, gender, address_line1, city, state, zip,
-                practice_guid, primary_provider_guid, default_location_guid, referring_provider_guid, active
+                practice_guid, primary_provider_guid, default_location_guid, referring_provider_guid, active,
+                refreshed_at
             ) VALUES %s 
             ON CONFLICT (patient_guid) DO UPDATE 
             SET full_name = EXCLUDED.full_name, dob = EXCLUDED.dob, gender = EXCLUDED.gender, 
@@ -466,59 +641,56 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
                 primary_provider_guid = COALESCE(EXCLUDED.primary_provider_guid, tebra.cmn_patient.primary_provider_guid),
                 default_location_guid = COALESCE(EXCLUDED.default_location_guid, tebra.cmn_patient.default_location_guid),
                 referring_provider_guid = COALESCE(EXCLUDED.referring_provider_guid, tebra.cmn_patient.referring_provider_guid),
-                active = COALESCE(EXCLUDED.active, tebra.cmn_patient.active)
+                active = COALESCE(EXCLUDED.active, tebra.cmn_patient.active),
+                refreshed_at = GREATEST(EXCLUDED.refreshed_at, tebra.cmn_patient.refreshed_at)
         """
-        execute_batch(cur, sql_pat, batch_pat, "Patients")
-        
+
         sql_prov = """
             INSERT INTO tebra.cmn_provider (
                 provider_guid, npi, name,
-                practice_guid, provider_id, taxonomy_code
+                practice_guid, provider_id, taxonomy_code, refreshed_at
             ) VALUES %s 
             ON CONFLICT (provider_guid) DO UPDATE 
             SET npi = EXCLUDED.npi, name = EXCLUDED.name,
                 practice_guid = COALESCE(EXCLUDED.practice_guid, tebra.cmn_provider.practice_guid),
                 provider_id = COALESCE(EXCLUDED.provider_id, tebra.cmn_provider.provider_id),
-                taxonomy_code = COALESCE(EXCLUDED.taxonomy_code, tebra.cmn_provider.taxonomy_code)
+                taxonomy_code = COALESCE(EXCLUDED.taxonomy_code, tebra.cmn_provider.taxonomy_code),
+                refreshed_at = GREATEST(EXCLUDED.refreshed_at, tebra.cmn_provider.refreshed_at)
         """
-        execute_batch(cur, sql_prov, batch_prov, "Providers")
-        
+
         sql_loc = """
             INSERT INTO tebra.cmn_location (
                 location_guid, name, address_block,
-                practice_guid, npi, place_of_service_code, location_id
+                practice_guid, npi, place_of_service_code, location_id, refreshed_at
             ) VALUES %s 
             ON CONFLICT (location_guid) DO UPDATE 
             SET name = EXCLUDED.name, address_block = EXCLUDED.address_block,
                 practice_guid = COALESCE(EXCLUDED.practice_guid, tebra.cmn_location.practice_guid),
                 npi = COALESCE(EXCLUDED.npi, tebra.cmn_location.npi),
                 place_of_service_code = COALESCE(EXCLUDED.place_of_service_code, tebra.cmn_location.place_of_service_code),
-                location_id = COALESCE(EXCLUDED.location_id, tebra.cmn_location.location_id)
+                location_id = COALESCE(EXCLUDED.location_id, tebra.cmn_location.location_id),
+                refreshed_at = GREATEST(EXCLUDED.refreshed_at, tebra.cmn_location.refreshed_at)
         """
-        execute_batch(cur, sql_loc, batch_loc, "Locations")
-        
+
         sql_ins = """
             INSERT INTO tebra.ref_insurance_policy (
                 policy_key, company_name, plan_name, policy_number, group_number, start_date, end_date, copay,
-                practice_guid, patient_case_id, policy_guid, precedence
+                practice_guid, patient_case_id, policy_guid, precedence, refreshed_at
             ) VALUES %s 
             ON CONFLICT (policy_key) DO UPDATE
             SET start_date = EXCLUDED.start_date, end_date = EXCLUDED.end_date, copay = EXCLUDED.copay,
                 practice_guid = COALESCE(EXCLUDED.practice_guid, tebra.ref_insurance_policy.practice_guid),
                 patient_case_id = COALESCE(EXCLUDED.patient_case_id, tebra.ref_insurance_policy.patient_case_id),
                 policy_guid = COALESCE(EXCLUDED.policy_guid, tebra.ref_insurance_policy.policy_guid),
-                precedence = COALESCE(EXCLUDED.precedence, tebra.ref_insurance_policy.precedence)
+                precedence = COALESCE(EXCLUDED.precedence, tebra.ref_insurance_policy.precedence),
+                refreshed_at = GREATEST(EXCLUDED.refreshed_at, tebra.ref_insurance_policy.refreshed_at)
+        """
+
+        # Each policy GUID's current policy_key (006_add_policy_guid_map.sql)
+        sql_ins_guid = """
+            INSERT INTO tebra.ref_insurance_policy_guid (policy_guid, policy_key) VALUES %s
+            ON CONFLICT (policy_guid) DO UPDATE SET policy_key = EXCLUDED.policy_key
         """
-        execute_batch(cur, sql_ins, batch_ins, "Insurance Policies")
-        
-        # Schema Migration for Encounter (Transient)
-        try:
-             cur.execute("ALTER TABLE tebra.clin_encounter ADD COLUMN IF NOT EXISTS appt_subject TEXT")
-             cur.execute("ALTER TABLE tebra.clin_encounter ADD COLUMN IF NOT EXISTS appt_notes TEXT")
-             cur.execute("ALTER TABLE tebra.clin_encounter ADD COLUMN IF NOT EXISTS pos_description TEXT")
-             conn.commit()
-        except Exception as e:
-             conn.rollback()
 
         sql_enc = """
             INSERT INTO tebra.clin_encounter (
@@ -535,14 +707,6 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
                 patient_case_id = COALESCE(EXCLUDED.patient_case_id, tebra.clin_encounter.patient_case_id),
                 place_of_service_code = COALESCE(EXCLUDED.place_of_service_code, tebra.clin_encounter.place_of_service_code)
         """
-        execute_batch(cur, sql_enc, batch_enc, "Encounters")
-        
-        # Schema Migration for Diag Description (Transient)
-        try:
-             cur.execute("ALTER TABLE tebra.clin_encounter_diagnosis ADD COLUMN IF NOT EXISTS description TEXT")
-             conn.commit()
-        except Exception as e:
-             conn.rollback()
 
         sql_diag = """
             INSERT INTO tebra.clin_encounter_diagnosis (encounter_id, diag_code, precedence, description, practice_guid, encounter_guid) 
@@ -552,79 +716,7 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
                 practice_guid = COALESCE(EXCLUDED.practice_guid, tebra.clin_encounter_diagnosis.practice_guid),
                 encounter_guid = COALESCE(EXCLUDED.encounter_guid, tebra.clin_encounter_diagnosis.encounter_guid)
         """
-        execute_batch(cur, sql_diag, batch_diag, "Diagnoses")
-        
-        # ==========================================================
-        # Phase 3: Load Claim Lines from Enriched CSV (with proper linkage)
-        # ==========================================================
-        print("Phase 3: Claim Lines (with Encounter Linkage)...")
-        
-        # ID generator for claim lines
-        def generate_claim_id(s):
-            return int(hashlib.md5(s.encode()).hexdigest(), 16) % (10**15)
-        
-        batch_claims = []
-        seen_claims = set()
-        
-        with open(file_enc, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                enc_id = row.get('EncounterID')
-                claim_ref = row.get('ClaimID')
-                line_ref = row.get('LineID_Ref6R') or row.get('DB_ClaimID')
-                loc_guid = row.get('ServiceLocationGUID')
-                
-                if not enc_id or not claim_ref:
-                    continue
-                
-                # Generate unique ID for this claim line
-                unique_str = f"{claim_ref}_{row.get('Date')}_{row.get('ProcCode')}_{line_ref}"
-                if unique_str in seen_claims:
-                    continue
-                
-                tebra_id = generate_claim_id(unique_str)
-                
-                # Parse adjustments to JSON format
-                adj_str = row.get('Adjustments')
-                adj_json = None
-                if adj_str:
-                    try:
-                        adj_dict = parse_adjustments(adj_str)
-                        adj_json = json.dumps(adj_dict) if adj_dict else None
-                    except:
-                        adj_json = json.dumps(adj_str)
-                
-                batch_claims.append((
-                    tebra_id,
-                    clean_int(enc_id),           # Proper encounter FK!
-                    claim_ref,                    # Links to ERA bundle
-                    row.get('ProcCode'),
-                    row.get('Proc_Description'),
-                    clean_date(row.get('Date')),
-                    clean_money(row.get('Billed')),
-                    clean_money(row.get('Paid')),
-                    clean_int(row.get('Units')),
-                    adj_json,
-                    row.get('Adjustment_Descriptions'),
-                    row.get('Claim_Status'),
-                    row.get('Payer_Status'),
-                    clean_id(row.get('Claim_PracticeGUID') or row.get('Enc_PracticeGUID')),  # Practice GUID
-                    row.get('Tracking_Num'),
-                    row.get('CH_Payer'),
-                    clean_id(row.get('DB_PatientGUID')),
-                    clean_int(row.get('DB_EncounterProcedureID'))
-                ))
-                seen_claims.add(unique_str)
-        
-        # Ensure practice_guid column exists
-        try:
-            cur.execute("ALTER TABLE tebra.fin_claim_line ADD COLUMN IF NOT EXISTS practice_guid UUID")
-            cur.execute("ALTER TABLE tebra.fin_claim_line ADD COLUMN IF NOT EXISTS tracking_number TEXT")
-            cur.execute("ALTER TABLE tebra.fin_claim_line ADD COLUMN IF NOT EXISTS clearinghouse_payer TEXT")
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-        
+
         sql_claim = """
             INSERT INTO tebra.fin_claim_line (
                 tebra_claim_id, encounter_id, claim_reference_id,
@@ -646,47 +738,267 @@ def load_practice_data(data_dir='.', practice_guid=None, practice_name=None, era
                 patient_guid = COALESCE(EXCLUDED.patient_guid, tebra.fin_claim_line.patient_guid),
                 encounter_procedure_id = COALESCE(EXCLUDED.encounter_procedure_id, tebra.fin_claim_line.encounter_procedure_id)
         """
-        execute_batch(cur, sql_claim, batch_claims, "Claim Lines")
-        print(f"    -> Loaded {len(batch_claims)} claim lines with encounter linkage.")
+
+        batch_pat = []
+        batch_prov = []
+        batch_loc = []
+        batch_ins = []
+        batch_ins_guid = []
+        batch_enc = []
+        batch_diag = []
+        batch_claims = []
+
+        # Flushed (or, in parallel mode, merged) in the FK order declared in
+        # database/migrations, so every row's parents are written first
+        targets = [
+            (sql_pat, batch_pat, "Patients"),
+            (sql_prov, batch_prov, "Providers"),
+            (sql_loc, batch_loc, "Locations"),
+            (sql_ins, batch_ins, "Insurance Policies"),
+            (sql_ins_guid, batch_ins_guid, "Insurance Policy GUIDs"),
+            (sql_enc, batch_enc, "Encounters"),
+            (sql_diag, batch_diag, "Diagnoses"),
+            (sql_claim, batch_claims, "Claim Lines"),
+        ]
+        order = [t for level in fk_levels([upsert_table(sql) for sql, _, _ in targets]) for t in level]
+        targets.sort(key=lambda t: order.index(upsert_table(t[0])))
+        loaded = dict.fromkeys([desc for _, _, desc in targets], 0)
+
+        if load_mode == 'parallel':
+            executor = ThreadPoolExecutor(max_workers=get_load_pool().size, thread_name_prefix='load')
+            staged_tables = order
+
+        def flush():
+            if executor is not None:
+                # Staging tables have no FKs, so every table copies at once. Waiting for the
+                # previous flush keeps one batch per table in flight while the next fills.
+                for future in staging:
+                    future.result()
+                staging[:] = [executor.submit(stage_rows, load_id, sql, list(batch)) for sql, batch, _ in targets if batch]
+                for _, batch, desc in targets:
+                    loaded[desc] += len(batch)
+                    batch.clear()
+                return
+            for sql, batch, desc in targets:
+                execute_batch(cur, sql, batch, desc, mode=load_mode)
+                loaded[desc] += len(batch)
+                batch.clear()
+
+        # ID generator for claim lines
+        def generate_claim_id(s):
+            return int(hashlib.md5(s.encode()).hexdigest(), 16) % (10**15)
+
+        # Only keys are kept for the whole file; row tuples are flushed every FLUSH_ROWS
+        seen_pat = set()
+        seen_prov = set()
+        seen_loc = set()
+        seen_ins = set()
+        seen_ins_guid = set()
+        seen_enc = set()
+        seen_claims = set()
+
+        for row in read_table(data_dir, file_enc, columns=ENRICHED_COLUMNS):
+            if sum(len(batch) for _, batch, _ in targets) >= FLUSH_ROWS:
+                flush()
+
+            # Entities
+            pat_guid = row.get('DB_PatientGUID')
+            if pat_guid and pat_guid not in seen_pat:
+                # Added Patient Mapping (with new FK columns)
+                batch_pat.append((
+                    pat_guid, clean_str(row.get('PatientID')), clean_str(row.get('PatientName')), clean_str(row.get('PatientCaseID')),
+                    clean_date(row.get('PatientDOB')), clean_str(row.get('PatientGender')),
+                    clean_str(row.get('PatientAddress')), clean_str(row.get('PatientCity')), clean_str(row.get('PatientState')), clean_str(row.get('PatientZip')),
+                    clean_id(row.get('Patient_PracticeGUID')),
+                    clean_id(row.get('Patient_PrimaryProvGUID')),
+                    clean_id(row.get('Patient_DefaultLocGUID')),
+                    clean_id(row.get('Patient_ReferringProvGUID')),
+                    True if row.get('Patient_Active') in (True, 'True', 'true', '1', 1) else (False if row.get('Patient_Active') in (False, 'False', 'false', '0', 0) else None),
+                    clean_str(row.get('Patient_RefreshedAt'))
+                )) 
+                seen_pat.add(pat_guid)
+            
+            prov_guid = row.get('ProviderGUID')
+            if prov_guid and prov_guid not in seen_prov:
+                batch_prov.append((
+                    prov_guid, clean_str(row.get('ProviderNPI')), clean_str(row.get('ProviderName')),
+                    clean_id(row.get('Provider_PracticeGUID')),
+                    clean_int(row.get('Provider_ID')),
+                    clean_str(row.get('Provider_TaxonomyCode')),
+                    clean_str(row.get('Provider_RefreshedAt'))
+                ))
+                seen_prov.add(prov_guid)
+                
+            loc_guid = row.get('ServiceLocationGUID')
+            if loc_guid and loc_guid not in seen_loc:
+                addr_json = json.dumps({
+                    'address': clean_str(row.get('FacilityAddress')), 
+                    'city': clean_str(row.get('FacilityCity')), 
+                    'state': clean_str(row.get('FacilityState'))
+                })
+                batch_loc.append((
+                    loc_guid, clean_str(row.get('FacilityName')), addr_json,
+                    clean_id(row.get('Location_PracticeGUID')),
+                    clean_str(row.get('Location_NPI')),
+                    clean_str(row.get('Location_POSCode')),
+                    clean_int(row.get('Location_ID')),
+                    clean_str(row.get('Location_RefreshedAt'))
+                ))
+                seen_loc.add(loc_guid)
+            
+            # Insurance
+            pol_num = clean_str(row.get('Insurance_PolicyNum'))
+            grp_num = clean_str(row.get('Insurance_GroupNum'))
+            pol_key = None
+            if pol_num or grp_num:
+                pol_key = make_policy_key(pol_num, grp_num)
+                if pol_key not in seen_ins:
+                    batch_ins.append((
+                        pol_key, clean_str(row.get('Insurance_Company')), clean_str(row.get('Insurance_Plan')), pol_num, grp_num,
+                        clean_date(row.get('Policy_Start')), clean_date(row.get('Policy_End')), clean_money(row.get('Policy_Copay')),
+                        clean_id(row.get('Policy_PracticeGUID')),
+                        clean_int(row.get('Policy_PatientCaseID')),
+                        clean_id(row.get('Policy_GUID')),
+                        clean_int(row.get('Policy_Precedence')),
+                        clean_str(row.get('Policy_RefreshedAt'))
+                    ))
+                    seen_ins.add(pol_key)
+                pol_guid = clean_id(row.get('Policy_GUID'))
+                if pol_guid and pol_guid not in seen_ins_guid:
+                    batch_ins_guid.append((pol_guid, pol_key))
+                    seen_ins_guid.add(pol_guid)
+            
+            # Encounter
+            enc_id = row.get('EncounterID')
+            if enc_id and enc_id not in seen_enc:
+                batch_enc.append((
+                    enc_id, row.get('Enc_EncounterGUID'), clean_date(row.get('EncounterDate')),
+                    clean_str(row.get('EncounterStatus')), clean_str(row.get('Appt_Type')), clean_str(row.get('Appt_Reason') or row.get('Appt_Desc')),
+                    clean_str(row.get('Appt_Subject')), 
+                    clean_str(row.get('Appt_Notes')),   
+                    clean_str(row.get('POS_Desc')),
+                    pat_guid, prov_guid, loc_guid, pol_key,
+                    clean_id(row.get('ReferringProvGUID')),
+                    clean_id(row.get('Enc_PracticeGUID')),
+                    clean_id(row.get('Enc_ApptGUID')),
+                    clean_int(row.get('PatientCaseID')),
+                    clean_str(row.get('Enc_POSCode'))
+                ))
+                
+                # Diagnoses (with new FK columns)
+                enc_seen_diags = set()
+                enc_guid_for_diag = row.get('Enc_EncounterGUID')
+                enc_practice_guid_for_diag = clean_id(row.get('Enc_PracticeGUID'))
+                for i in range(1, 9):
+                    d_code = clean_str(row.get(f'DiagID_{i}'))
+                    d_desc = clean_str(row.get(f'DiagDesc_{i}'))
+                    if d_code and d_code not in enc_seen_diags:
+                        batch_diag.append((enc_id, d_code, i, d_desc, enc_practice_guid_for_diag, enc_guid_for_diag))
+                        enc_seen_diags.add(d_code)
+                        
+                seen_enc.add(enc_id)
+
+            # Claim line (Phase 3)
+            claim_ref = row.get('ClaimID')
+            line_ref = row.get('LineID_Ref6R') or row.get('DB_ClaimID')
+            if not enc_id or not claim_ref:
+                continue
+            
+            # Generate unique ID for this claim line
+            unique_str = f"{claim_ref}_{row.get('Date')}_{row.get('ProcCode')}_{line_ref}"
+            if unique_str in seen_claims:
+                continue
+            
+            tebra_id = generate_claim_id(unique_str)
+            
+            # Parse adjustments to JSON format
+            adj_str = row.get('Adjustments')
+            adj_json = None
+            if adj_str:
+                try:
+                    adj_dict = parse_adjustments(adj_str)
+                    adj_json = json.dumps(adj_dict) if adj_dict else None
+                except:
+                    adj_json = json.dumps(adj_str)
+            
+            batch_claims.append((
+                tebra_id,
+                clean_int(enc_id),           # Proper encounter FK!
+                claim_ref,                    # Links to ERA bundle
+                row.get('ProcCode'),
+                row.get('Proc_Description'),
+                clean_date(row.get('Date')),
+                clean_money(row.get('Billed')),
+                clean_money(row.get('Paid')),
+                clean_int(row.get('Units')),
+                adj_json,
+                row.get('Adjustment_Descriptions'),
+                row.get('Claim_Status'),
+                row.get('Payer_Status'),
+                clean_id(row.get('Claim_PracticeGUID') or row.get('Enc_PracticeGUID')),  # Practice GUID
+                row.get('Tracking_Num'),
+                row.get('CH_Payer'),
+                clean_id(row.get('DB_PatientGUID')),
+                clean_int(row.get('DB_EncounterProcedureID'))
+            ))
+            seen_claims.add(unique_str)
+            recount_claims.add(claim_ref)
+
+        flush()
+        if executor is not None:
+            for future in staging:
+                future.result()
+            executor.shutdown()
+            # Same transaction as Phases 0-1: everything commits below or nothing does
+            for sql, _, desc in targets:
+                merge_staged(cur, sql, load_id)
+                print(f"  -> {desc}: Merged {loaded[desc]} staged rows.")
+        print(f"    -> Loaded {loaded['Claim Lines']} claim lines with encounter linkage.")
         
         conn.commit()
         print("Success! Transaction Committed.")
         
         # Phase 4: Consistency Check (User Request)
         # Ensure counts in fin_era_report match the actual claim lines
-        print("Phase 4: Recalculating ERA Counts for Consistency...")
+        print(f"Phase 4: Recalculating ERA Counts for Consistency ({len(recount_reports)} reports, {len(recount_claims)} claims touched)...")
         try:
-            cur.execute("""
-                WITH counts AS (
-                    SELECT 
-                        b.era_report_id,
-                        COUNT(CASE WHEN cl.payer_status ILIKE '%%Denied%%' OR cl.claim_status ILIKE '%%Denied%%' THEN 1 END) as d_count,
-                        COUNT(CASE WHEN cl.payer_status ILIKE '%%Rejected%%' OR cl.claim_status ILIKE '%%Rejected%%' THEN 1 END) as r_count
-                    FROM tebra.fin_era_bundle b
-                    JOIN tebra.fin_claim_line cl ON b.claim_reference_id = cl.claim_reference_id
-                    GROUP BY b.era_report_id
-                )
-                UPDATE tebra.fin_era_report r
-                SET denied_count = c.d_count,
-                    rejected_count = c.r_count
-                FROM counts c
-                WHERE r.era_report_id = c.era_report_id
-            """)
+            updated = recount_era_counts(cur, recount_reports, recount_claims)
             conn.commit()
-            print("    -> ERA Counts Updated from Line Items.")
+            print(f"    -> ERA Counts Updated from Line Items ({updated} reports).")
         except Exception as e:
             print(f"    -> Warning: Could not update counts: {e}")
             conn.rollback()
 
         cur.close()
         conn.close()
+        return True
         
     except Exception as e:
         print(f"CRITICAL FAILURE: Rolling back transaction. Error: {e}")
         conn.rollback()
         conn.close()
+        if executor is not None:
+            # Let in-flight copies land before deleting what they staged
+            executor.shutdown(wait=True)
+            discard_staged(load_id, staged_tables)
+        return False
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Load practice data to Postgres')
+    parser.add_argument('--recount-all', action='store_true',
+                        help='Only recompute denied/rejected counts for every ERA report in the warehouse')
+    args = parser.parse_args()
+    if args.recount_all:
+        conn = get_db()
+        if conn:
+            try:
+                cur = conn.cursor()
+                print(f"Recounted {recount_era_counts(cur)} ERA reports.")
+                conn.commit()
+            finally:
+                conn.close()
+        raise SystemExit
     load_practice_data()
     # Also load newly extracted service lines
     conn = get_db()
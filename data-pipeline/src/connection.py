@@ -1,8 +1,21 @@
 """
 Snowflake connection for KAREO.TALISMANSOLUTIONS.
 Uses same env vars as Tebra-Snowflake: SNOWFLAKE_URL, USER, PASSWORD, DATABASE, SCHEMA.
+
+Pipeline stages take connections from a process-wide pool (checkout()) instead
+of authenticating per call: close() on a checked-out connection returns it for
+the next stage/practice. Pooled sessions use client_session_keep_alive, and a
+connection that sat idle is pinged before it is handed out again.
+
+SNOWFLAKE_BACKEND=record saves every query result under SNOWFLAKE_REPLAY_DIR;
+SNOWFLAKE_BACKEND=replay serves connections from those files and a local
+DuckDB copy of the PM_* tables, with no network (src/snowflake_replay.py).
 """
+import atexit
+import logging
 import os
+import threading
+import time
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -27,8 +40,30 @@ def _account_from_url(url: str) -> str:
     return host
 
 
-def get_connection():
-    """Return a Snowflake connection (KAREO.TALISMANSOLUTIONS)."""
+logger = logging.getLogger(__name__)
+
+# Most connections open at once (checked out + idle); checkout() waits beyond that
+POOL_SIZE = int(os.environ.get("SNOWFLAKE_POOL_SIZE", "8"))
+# Seconds a checkout waits for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("SNOWFLAKE_POOL_TIMEOUT", "300"))
+# Idle connections older than this are pinged (SELECT 1) before reuse
+POOL_PING_AFTER = float(os.environ.get("SNOWFLAKE_POOL_PING_AFTER", "60"))
+
+BACKENDS = ("snowflake", "record", "replay")
+BACKEND = os.environ.get("SNOWFLAKE_BACKEND", "snowflake")
+
+
+def get_connection(keep_alive=False):
+    """Return a new Snowflake connection (KAREO.TALISMANSOLUTIONS).
+
+    Pipeline code should use checkout(); this always authenticates.
+    """
+    if BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown SNOWFLAKE_BACKEND {BACKEND!r} (expected one of {BACKENDS})")
+    if BACKEND == "replay":
+        from src.snowflake_replay import ReplayConnection
+        return ReplayConnection()
+
     import snowflake.connector
 
     url = os.environ.get("SNOWFLAKE_URL", "").strip()
@@ -47,7 +82,7 @@ def get_connection():
             "Set SNOWFLAKE_URL (or SNOWFLAKE_ACCOUNT), SNOWFLAKE_USER, SNOWFLAKE_PASSWORD in .env"
         )
 
-    return snowflake.connector.connect(
+    conn = snowflake.connector.connect(
         account=account,
         user=user,
         password=password,
@@ -55,4 +90,189 @@ def get_connection():
         warehouse=warehouse or None,
         database=database or None,
         schema=schema or None,
+        client_session_keep_alive=keep_alive,
     )
+    if BACKEND == "record":
+        from src.snowflake_replay import RecordingConnection
+        return RecordingConnection(conn)
+    return conn
+
+
+def _is_closed(conn):
+    # snowflake.connector has is_closed(); psycopg2 sets closed to non-zero
+    is_closed = getattr(conn, "is_closed", None)
+    if callable(is_closed):
+        return bool(is_closed())
+    closed = getattr(conn, "closed", 0)
+    return isinstance(closed, int) and closed != 0
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class PooledConnection:
+    """A checked-out connection. close() (or leaving a with block) returns it to the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.checkin(self._conn)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded pool of DB-API connections; Snowflake by default.
+
+    name and size_env only label log and timeout messages for other
+    backends, e.g. the loader's Postgres staging pool.
+    """
+
+    def __init__(self, connect=None, size=POOL_SIZE, timeout=POOL_TIMEOUT, ping_after=POOL_PING_AFTER,
+                 name="Snowflake", size_env="SNOWFLAKE_POOL_SIZE"):
+        self._connect = connect or (lambda: get_connection(keep_alive=True))
+        self.name = name
+        self.size_env = size_env
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        # (connection, returned_at), most recently returned last
+        self._idle = []
+        # id(connection) -> connection, for everything handed out
+        self._out = {}
+        self._opening = 0
+        self.opened = 0
+        self.reused = 0
+
+    def resize(self, size):
+        with self._cond:
+            self.size = size
+            self._cond.notify_all()
+
+    def _healthy(self, conn, returned_at):
+        if _is_closed(conn):
+            return False
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            cur.close()
+            return True
+        except Exception as e:
+            logger.info(f"Dropping stale {self.name} connection: {e}")
+            return False
+
+    def checkout(self):
+        """A connection from the pool, opening one if none is idle and the pool isn't full."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while not self._idle and len(self._out) + self._opening >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No {self.name} connection free after {self.timeout:.0f}s "
+                        f"({self.size} in use; raise {self.size_env})")
+                self._cond.wait(remaining)
+            conn, returned_at = self._idle.pop() if self._idle else (None, None)
+            # Counts against the size while it is checked or opened
+            self._opening += 1
+
+        try:
+            if conn is not None and not self._healthy(conn, returned_at):
+                _close_quietly(conn)
+                conn = None
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._opening -= 1
+            self._out[id(conn)] = conn
+            if reused:
+                self.reused += 1
+            else:
+                self.opened += 1
+        return PooledConnection(self, conn)
+
+    def checkin(self, conn):
+        """Return a connection (pooled wrapper or the raw connection) to the pool."""
+        if isinstance(conn, PooledConnection):
+            conn.close()
+            return
+        with self._cond:
+            if self._out.pop(id(conn), None) is None:
+                return
+            if len(self._out) + len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            _close_quietly(conn)
+
+    def close(self):
+        """Close idle connections; ones still checked out are closed when returned."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self.size = 0
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide Snowflake pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def configure_pool(size):
+    """Set the pool's size, e.g. to the number of sessions a run keeps open at once."""
+    get_pool().resize(size)
+
+
+def checkout():
+    """Snowflake connection from the process-wide pool; close() returns it."""
+    return get_pool().checkout()
+
+
+def checkin(conn):
+    """Return a pooled connection, given its wrapper or the raw connection (cursor.connection)."""
+    get_pool().checkin(conn)
+
+
+@atexit.register
+def close_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
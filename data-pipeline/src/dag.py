@@ -0,0 +1,129 @@
+"""
+Small dependency-DAG runner for warehouse lookups.
+Each node is (deps, fetch, apply): fetch(session) runs on a worker session as
+soon as every dependency has been applied; apply(result) runs on the calling
+thread, so shared state is only mutated from one thread. Per-node timings and
+the critical path are logged.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+def _check(nodes):
+    for name, (deps, _, _) in nodes.items():
+        for dep in deps:
+            if dep not in nodes:
+                raise ValueError(f"DAG node {name!r} depends on unknown node {dep!r}")
+
+def critical_path(nodes, timings):
+    """Dependency chain with the largest summed node time.
+
+    This is the floor for the run however many sessions are used, so it is
+    meaningful for sequential runs too.
+    """
+    cost = {}
+    def chain(name):
+        if name not in cost:
+            deps = nodes[name][0]
+            best = max((chain(d) for d in deps), key=lambda c: c[0], default=(0.0, []))
+            start, end = timings[name]
+            cost[name] = (best[0] + end - start, best[1] + [name])
+        return cost[name]
+    if not timings:
+        return 0.0, []
+    return max((chain(n) for n in timings), key=lambda c: c[0])
+
+def _log_timings(label, nodes, timings):
+    for name, (start, end) in sorted(timings.items(), key=lambda kv: kv[1][0]):
+        logger.info(f"  [{label}] {name}: {end - start:.2f}s (started +{start:.2f}s)")
+    total, path = critical_path(nodes, timings)
+    if path:
+        steps = " -> ".join(f"{n} ({timings[n][1] - timings[n][0]:.2f}s)" for n in path)
+        wall = max(end for _, end in timings.values())
+        logger.info(f"  [{label}] critical path {total:.2f}s of {wall:.2f}s: {steps}")
+
+def run_dag(nodes, session, workers=1, open_session=None, close_session=None, label='dag'):
+    """Run every node once, dependencies first.
+
+    With workers > 1 and an open_session factory, ready nodes run concurrently
+    on up to `workers` threads, each with its own session (closed afterwards
+    with close_session). Otherwise nodes run one after another on `session`.
+    Returns name -> (start, end) seconds relative to the start of the run.
+    """
+    _check(nodes)
+    t0 = time.perf_counter()
+    timings = {}
+    done = set()
+    pending = dict(nodes)
+
+    def ready():
+        return [n for n, (deps, _, _) in pending.items() if all(d in done for d in deps)]
+
+    def finish(name, result, start):
+        apply = nodes[name][2]
+        if apply is not None:
+            apply(result)
+        timings[name] = (start, time.perf_counter() - t0)
+        done.add(name)
+
+    if workers <= 1 or open_session is None:
+        while pending:
+            batch = ready()
+            if not batch:
+                raise ValueError(f"DAG has a dependency cycle among {sorted(pending)}")
+            for name in batch:
+                _, fetch, _ = pending.pop(name)
+                start = time.perf_counter() - t0
+                finish(name, fetch(session), start)
+        _log_timings(label, nodes, timings)
+        return timings
+
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def worker_session():
+        if not hasattr(local, 'session'):
+            local.session = open_session()
+            with opened_lock:
+                opened.append(local.session)
+        return local.session
+
+    def call(fetch):
+        # Timed on the worker, after connecting: neither queueing for a thread
+        # nor opening its session is billed to the node
+        session = worker_session()
+        start = time.perf_counter() - t0
+        return start, fetch(session)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=label) as pool:
+            running = {}
+            while pending or running:
+                for name in ready():
+                    _, fetch, _ = pending.pop(name)
+                    running[pool.submit(call, fetch)] = name
+                if not running:
+                    raise ValueError(f"DAG has a dependency cycle among {sorted(pending)}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        start, result = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    finish(name, result, start)
+    finally:
+        if close_session is not None:
+            for s in opened:
+                try:
+                    close_session(s)
+                except Exception as e:
+                    logger.warning(f"Failed to close {label} session: {e}")
+    _log_timings(label, nodes, timings)
+    return timings
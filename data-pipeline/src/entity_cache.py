@@ -0,0 +1,131 @@
+"""
+Patient/provider/location/policy cache backed by tebra_dw.
+Enrichment first reads cmn_patient, cmn_provider, cmn_location and
+ref_insurance_policy; only GUIDs that are unknown there, or whose refreshed_at
+is older than the TTL, are looked up in Snowflake. Policies are keyed on
+policy_key (policy + group number), so a policy GUID is found through its
+ref_insurance_policy_guid entry. If ENTITY_CHANGE_COLUMN
+names a modification timestamp on the Snowflake tables, cached rows changed
+since they were refreshed are re-fetched too.
+
+refreshed_at is written by the loader from the *_RefreshedAt enrichment
+fields: the Snowflake fetch time for fresh rows, the cached value otherwise, so
+reloading a cached row doesn't extend its life.
+"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.environ.get('ENTITY_CACHE_TTL_HOURS', '24')) * 3600
+# e.g. MODIFIEDDATE; empty disables the Snowflake change check
+CHANGE_COLUMN = os.environ.get('ENTITY_CHANGE_COLUMN', '')
+
+# kind -> (warehouse table(s), warehouse key, Snowflake table, Snowflake key, [(warehouse expr, enrichment field)])
+ENTITIES = {
+    'patient': ('tebra.cmn_patient', 'patient_guid', 'PM_PATIENT', 'PATIENTGUID', [
+        ('patient_id', 'PatientID'), ('full_name', 'PatientName'), ('dob::text', 'PatientDOB'),
+        ('gender', 'PatientGender'), ('address_line1', 'PatientAddress'), ('city', 'PatientCity'),
+        ('state', 'PatientState'), ('zip', 'PatientZip'), ('practice_guid::text', 'Patient_PracticeGUID'),
+        ('primary_provider_guid::text', 'Patient_PrimaryProvGUID'),
+        ('default_location_guid::text', 'Patient_DefaultLocGUID'),
+        ('referring_provider_guid::text', 'Patient_ReferringProvGUID'), ('active', 'Patient_Active'),
+    ]),
+    'provider': ('tebra.cmn_provider', 'provider_guid', 'PM_DOCTOR', 'DOCTORGUID', [
+        ('npi', 'ProviderNPI'), ('name', 'ProviderName'), ('practice_guid::text', 'Provider_PracticeGUID'),
+        ('provider_id', 'Provider_ID'), ('taxonomy_code', 'Provider_TaxonomyCode'),
+    ]),
+    'location': ('tebra.cmn_location', 'location_guid', 'PM_SERVICELOCATION', 'SERVICELOCATIONGUID', [
+        ('name', 'FacilityName'), ("address_block->>'address'", 'FacilityAddress'),
+        ("address_block->>'city'", 'FacilityCity'), ("address_block->>'state'", 'FacilityState'),
+        ('practice_guid::text', 'Location_PracticeGUID'), ('npi', 'Location_NPI'),
+        ('place_of_service_code', 'Location_POSCode'), ('location_id', 'Location_ID'),
+    ]),
+    # One policy_key row serves every GUID filed under it
+    'policy': ('tebra.ref_insurance_policy_guid m JOIN tebra.ref_insurance_policy p USING (policy_key)', 'm.policy_guid',
+               'PM_INSURANCEPOLICY', 'INSURANCEPOLICYGUID', [
+        ('policy_number', 'Insurance_PolicyNum'), ('group_number', 'Insurance_GroupNum'),
+        ('plan_name', 'Insurance_Plan'), ('company_name', 'Insurance_Company'),
+        ('start_date::text', 'Policy_Start'), ('end_date::text', 'Policy_End'), ('copay', 'Policy_Copay'),
+        ('practice_guid::text', 'Policy_PracticeGUID'), ('patient_case_id', 'Policy_PatientCaseID'),
+        ('precedence', 'Policy_Precedence'),
+    ]),
+}
+
+# Enrichment field carrying each kind's refreshed_at through to the loader
+REFRESHED_FIELDS = {
+    'patient': 'Patient_RefreshedAt',
+    'provider': 'Provider_RefreshedAt',
+    'location': 'Location_RefreshedAt',
+    'policy': 'Policy_RefreshedAt',
+}
+
+def _norm(guid):
+    # Postgres prints UUIDs lower-case; Snowflake GUIDs may not be
+    return str(guid).strip().lower()
+
+class EntityCache:
+    def __init__(self, conn, ttl=DEFAULT_TTL, change_column=CHANGE_COLUMN):
+        self.conn = conn
+        self.ttl = ttl
+        self.change_column = change_column
+        # One warehouse connection shared by every practice/lookup thread
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, kind, guids, fetch=None):
+        """Cached fields for `guids` as {guid: fields} plus the GUIDs still to fetch.
+
+        Each hit's fields include its REFRESHED_FIELDS entry. fetch(query, keys)
+        runs the optional Snowflake change check for the hits.
+        """
+        table, key, sf_table, sf_key, columns = ENTITIES[kind]
+        by_norm = {_norm(g): g for g in guids}
+        if not by_norm:
+            return {}, []
+        exprs = ", ".join(expr for expr, _ in columns)
+        query = f"""
+            SELECT {key}::text, refreshed_at, {exprs}
+            FROM {table}
+            WHERE {key}::text = ANY(%s)
+              AND refreshed_at >= now() - %s * interval '1 second'
+        """
+        try:
+            with self._lock:
+                with self.conn.cursor() as cur:
+                    cur.execute(query, (list(by_norm), self.ttl))
+                    rows = cur.fetchall()
+                self.conn.rollback()
+        except Exception as e:
+            logger.warning(f"Entity cache read failed for {kind}, querying Snowflake: {e}")
+            with self._lock:
+                self.conn.rollback()
+            return {}, list(guids)
+
+        found = {}
+        for r in rows:
+            guid = by_norm.get(r[0])
+            if guid is None or guid in found:
+                continue
+            fields = {field: value for (_, field), value in zip(columns, r[2:])}
+            fields[REFRESHED_FIELDS[kind]] = r[1].isoformat()
+            found[guid] = fields
+
+        if found and self.change_column and fetch is not None:
+            since = min(f[REFRESHED_FIELDS[kind]] for f in found.values())
+            changed = fetch(f"SELECT {sf_key} FROM {sf_table} WHERE {sf_key} IN {{keys}} "
+                            f"AND {self.change_column} > '{since}'", list(found))
+            for r in changed:
+                found.pop(r[0], None)
+
+        missing = [g for g in guids if g not in found]
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,67 @@
+"""
+Raw X12 835 tokenizer (alternative EraParser backend).
+Reads the element / sub-element / segment separators from the ISA header and
+yields the same (segment id, element map) pairs as the XML backend, so
+EraParser.build() produces an identical claim/service-line structure.
+"""
+
+# ISA is fixed-width: 106 characters including the segment terminator
+ISA_LENGTH = 106
+
+class X12FormatError(ValueError):
+    """Raised when content looks like X12 but the ISA envelope is unusable."""
+
+def is_x12(content):
+    """Sniff raw X12: an interchange always starts with the ISA segment."""
+    if not content:
+        return False
+    return content.lstrip()[:3] == 'ISA'
+
+def read_delimiters(content):
+    """Return (element_sep, sub_element_sep, segment_term) from the ISA header."""
+    start = len(content) - len(content.lstrip())
+    if len(content) - start < ISA_LENGTH:
+        raise X12FormatError("Truncated ISA header")
+    element_sep = content[start + 3]
+    # ISA16 (component separator) follows the 16th element separator,
+    # and the segment terminator comes right after it.
+    pos = start
+    for _ in range(16):
+        pos = content.find(element_sep, pos + 1)
+        if pos == -1:
+            raise X12FormatError("ISA header has fewer than 16 elements")
+    sub_element_sep = content[pos + 1]
+    segment_term = content[pos + 2]
+    return element_sep, sub_element_sep, segment_term
+
+def iter_segments(content):
+    """Stream (segment id, element map) pairs out of raw X12 835 text.
+
+    Segments are sliced out one at a time (no full split of the document).
+    Composite elements are kept as text joined with ':' to match Tebra's XML
+    representation (e.g. SVC01 = 'HC:97110:KX:GP'); empty elements are omitted.
+    """
+    element_sep, sub_element_sep, segment_term = read_delimiters(content)
+    normalize_composites = sub_element_sep != ':'
+
+    pos = 0
+    end_of_content = len(content)
+    while pos < end_of_content:
+        end = content.find(segment_term, pos)
+        if end == -1:
+            end = end_of_content
+        raw = content[pos:end].strip()
+        pos = end + 1
+        if not raw:
+            continue
+
+        fields = raw.split(element_sep)
+        seg_id = fields[0]
+        elements = {}
+        for i, value in enumerate(fields[1:], 1):
+            if not value:
+                continue
+            if normalize_composites and sub_element_sep in value:
+                value = value.replace(sub_element_sep, ':')
+            elements[f"{seg_id}{i:02d}"] = value
+        yield seg_id, elements
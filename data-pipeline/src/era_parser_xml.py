@@ -1,9 +1,18 @@
 """
 ERA Parser Module (XML-wrapped 835).
 Refactored from verified logic in pase_specific_835.py.
+Raw X12 835 content is detected automatically and tokenized by era_parser_x12.
 """
 import xml.etree.ElementTree as ET
 
+from src import era_parser_x12
+
+# 'business': payer/payee/payment/claims only. 'full': also the per-segment dump.
+PARSE_DETAILS = ('business', 'full')
+
+# Bump whenever parsed output changes; cached parse results from other versions are discarded
+PARSER_VERSION = '2'
+
 class EraParser:
     SEGMENT_DESC = {
         'ST': 'Transaction Set Header',
@@ -36,57 +45,107 @@ class EraParser:
         'LQ': 'Industry Code',
     }
 
+    # Characters handed to the pull parser per feed() call
+    FEED_CHUNK_SIZE = 64 * 1024
+
     @staticmethod
-    def get_element(segment_node, tag_name):
-        """Retrieve text from a specific XML tag within a segment."""
-        node = segment_node.find(tag_name)
-        return node.text if node is not None else ""
+    def get_element(elements, tag_name):
+        """Retrieve text for a specific element tag from an indexed segment."""
+        return elements.get(tag_name, "")
 
     @staticmethod
-    def get_all_elements(segment_node, seg_name):
-        """Retrieve all data elements for a segment in order."""
-        elements = []
-        for i in range(1, 40):
-            tag = f"{seg_name}{i:02d}"
-            node = segment_node.find(tag)
-            if node is not None:
-                text = node.text
-                if text is None:
-                     text = "".join(node.itertext())
-                elements.append((tag, text))
+    def index_elements(segment_node):
+        """Walk a segment's children once into a tag -> text map (document order)."""
+        elements = {}
+        for node in segment_node:
+            if node.tag in elements:
+                continue # First occurrence wins, same as find()
+            text = node.text
+            if text is None:
+                text = "".join(node.itertext())
+            elements[node.tag] = text
         return elements
 
-    def parse(self, content):
-        """Parse 835 XML content into structured dictionary."""
-        wrapped_content = f"<root>{content}</root>"
+    @staticmethod
+    def get_all_elements(elements, seg_name):
+        """Retrieve all data elements (SEG01..SEG39) for an indexed segment in order."""
+        prefix_len = len(seg_name)
+        ordered = []
+        for tag, text in elements.items():
+            suffix = tag[prefix_len:]
+            if tag.startswith(seg_name) and len(suffix) == 2 and suffix.isdigit() and 1 <= int(suffix) < 40:
+                ordered.append((tag, text))
+        ordered.sort()
+        return ordered
+
+    def iter_segments(self, content):
+        """Stream (segment id, element map) pairs out of XML-wrapped 835 content.
+
+        Uses a pull parser fed in chunks instead of building one wrapped copy
+        of the document; each segment is indexed once and then cleared.
+        """
+        parser = ET.XMLPullParser(events=('end',))
+        parser.feed("<root>")
+        content = content or ""
+        for start in range(0, len(content), self.FEED_CHUNK_SIZE):
+            parser.feed(content[start:start + self.FEED_CHUNK_SIZE])
+            yield from self._drain_segments(parser)
+        parser.feed("</root>")
+        parser.close()
+        yield from self._drain_segments(parser)
+
+    def _drain_segments(self, parser):
+        for _, node in parser.read_events():
+            if node.tag == 'segment':
+                yield node.get('name'), self.index_elements(node)
+                node.clear()
+
+    def parse(self, content, detail='full'):
+        """Parse 835 XML content into structured dictionary.
+
+        detail='full' also returns every segment with its description and
+        elements under 'segments'; detail='business' skips that list and only
+        returns payer/payee/payment/claims (what the extraction path uses).
+
+        The backend is picked by sniffing the content: raw X12 (starts with ISA)
+        goes through the X12 tokenizer, anything else is treated as Tebra XML.
+        """
         try:
-            root = ET.fromstring(wrapped_content)
-        except ET.ParseError as e:
+            if era_parser_x12.is_x12(content):
+                segments = era_parser_x12.iter_segments(content)
+            else:
+                segments = self.iter_segments(content)
+            return self.build(segments, detail=detail)
+        except (ET.ParseError, era_parser_x12.X12FormatError) as e:
             return {'error': str(e)}
 
+    def build(self, segments, detail='full'):
+        """Assemble payer/payee/payment/claims from a stream of (segment id, element map)."""
+        if detail not in PARSE_DETAILS:
+            raise ValueError(f"Unknown parse detail {detail!r}; expected one of {PARSE_DETAILS}")
+        keep_segments = detail == 'full'
+
         parsed_data = {
-            'segments': [], 
             'payer': {},
             'payee': {},
             'claims': []
         }
+        if keep_segments:
+            parsed_data['segments'] = []
         
         current_loop_type = None
         current_claim = None
         current_svc = None
         
         # Iterate all segments
-        for segment in root.iter('segment'):
-            seg_id = segment.get('name')
-            seg_desc = self.SEGMENT_DESC.get(seg_id, "Unknown Segment")
-            
-            # Granular elements (optional, can be disabled for speed if needed)
-            elements = self.get_all_elements(segment, seg_id)
-            parsed_data['segments'].append({
-                'id': seg_id,
-                'desc': seg_desc,
-                'elements': elements
-            })
+        for seg_id, segment in segments:
+            # Granular elements (only in 'full' detail mode)
+            if keep_segments:
+                parsed_data['segments'].append({
+                    'id': seg_id,
+                    'desc': self.SEGMENT_DESC.get(seg_id, "Unknown Segment"),
+                    'elements': self.get_all_elements(segment, seg_id)
+                })
             
             # --- Business Logic ---
             # --- Business Logic ---
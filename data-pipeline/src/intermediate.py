@@ -0,0 +1,241 @@
+"""
+Stage handoff tables (service_lines, claims_extracted, era_reports,
+encounters_enriched_deterministic).
+Written as CSV (default) or Parquet (typed, zstd-compressed, column-projectable
+reads). Tables are addressed by their CSV file name; readers pick up whichever
+format the producing stage wrote, so only the writers need to know the format.
+"""
+import csv
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pc = None
+    pacsv = None
+    pq = None
+
+FORMATS = ('csv', 'parquet')
+DEFAULT_FORMAT = os.environ.get('PIPELINE_INTERMEDIATE_FORMAT', 'csv')
+
+# Rows buffered per Parquet row group / yielded per read batch
+ROW_GROUP_SIZE = 50000
+
+# Typed Parquet columns (same meaning in every table). Everything else is a string,
+# which Parquet dictionary-encodes; values read back exactly as they would from CSV.
+FLOAT_COLUMNS = {'Billed', 'Paid', 'PatResp', 'TotalPaid', 'TotalAmount'}
+INT_COLUMNS = {'DeniedCount', 'RejectedCount', 'ClaimCount'}
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet intermediates need pyarrow (pip install pyarrow), or use --format csv")
+
+def table_path(directory, name, fmt):
+    """Path of table `name` (its CSV file name) in the given format."""
+    base, _ = os.path.splitext(name)
+    return os.path.join(directory, f"{base}.{fmt}")
+
+def find_table(directory, name):
+    """Path of the table as written by the last run, or None."""
+    for fmt in ('parquet', 'csv'):
+        path = table_path(directory, name, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+def table_exists(directory, name):
+    return find_table(directory, name) is not None
+
+def _to_float(val):
+    if val is None or val == '':
+        return None
+    try:
+        return float(str(val).replace('$', '').replace(',', ''))
+    except ValueError:
+        return None
+
+def _to_int(val):
+    if val is None or val == '':
+        return None
+    try:
+        return int(float(str(val).strip()))
+    except ValueError:
+        return None
+
+def _to_str(val):
+    # csv.DictWriter writes None as ''
+    if val is None:
+        return ''
+    return val if type(val) is str else str(val)
+
+def _column_spec(col):
+    if col in FLOAT_COLUMNS:
+        return pa.float64(), _to_float
+    if col in INT_COLUMNS:
+        return pa.int64(), _to_int
+    return pa.string(), _to_str
+
+def _convert_column(column, typ, conv):
+    # Same values _append would produce. Cast in bulk where Arrow's text form
+    # matches str(); anything else (floats, bools, timestamps) goes value by value.
+    if column.type == typ and typ != pa.string():
+        return column
+    if typ == pa.string():
+        t = column.type
+        if t == pa.string():
+            return pc.fill_null(column, '')
+        if pa.types.is_integer(t) or pa.types.is_decimal(t) or pa.types.is_date(t) or pa.types.is_null(t):
+            return pc.fill_null(pc.cast(column, pa.string()), '')
+    return pa.array([conv(v) for v in column.to_pylist()], type=typ)
+
+class TableWriter:
+    """csv.DictWriter-style writer for one handoff table.
+
+    debug_csv additionally writes the CSV next to a Parquet table.
+    """
+    def __init__(self, directory, name, fieldnames, fmt=DEFAULT_FORMAT, debug_csv=False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown intermediate format {fmt!r} (expected one of {FORMATS})")
+        self.fieldnames = list(fieldnames)
+        self.path = table_path(directory, name, fmt)
+        self._csv_file = None
+        self._csv = None
+        self._parquet = None
+
+        # Readers prefer Parquet, so drop a table left behind by a run in the other format
+        for other in FORMATS:
+            stale = table_path(directory, name, other)
+            if other != fmt and not (other == 'csv' and debug_csv) and os.path.exists(stale):
+                os.remove(stale)
+
+        if fmt == 'parquet':
+            _require_pyarrow()
+            specs = [_column_spec(c) for c in self.fieldnames]
+            self._schema = pa.schema([(c, t) for c, (t, _) in zip(self.fieldnames, specs)])
+            self._converters = [conv for _, conv in specs]
+            self._columns = [[] for _ in self.fieldnames]
+            self._parquet = pq.ParquetWriter(self.path, self._schema, compression='zstd')
+
+        if fmt == 'csv' or debug_csv:
+            self._csv_file = open(table_path(directory, name, 'csv'), 'w', newline='')
+            self._csv = csv.DictWriter(self._csv_file, fieldnames=self.fieldnames)
+            self._csv.writeheader()
+
+    def writerow(self, row):
+        if self._csv:
+            self._csv.writerow(row)
+        if self._parquet:
+            self._append(row)
+
+    def writerows(self, rows):
+        rows = list(rows)
+        if self._csv:
+            self._csv.writerows(rows)
+        if self._parquet:
+            for row in rows:
+                self._append(row)
+
+    def write_table(self, table):
+        """Write an Arrow table; columns are matched by name, absent ones are empty."""
+        present = [c for c in self.fieldnames if c in table.column_names]
+        if self._csv:
+            # Rows only exist here, one batch at a time
+            for batch in table.select(present).to_batches(ROW_GROUP_SIZE):
+                self._csv.writerows(batch.to_pylist())
+        if self._parquet:
+            self._write_row_group()
+            columns = []
+            for col, conv, field in zip(self.fieldnames, self._converters, self._schema):
+                if col in table.column_names:
+                    columns.append(_convert_column(table.column(col), field.type, conv))
+                else:
+                    columns.append(_convert_column(pa.nulls(table.num_rows), field.type, conv))
+            self._parquet.write_table(pa.Table.from_arrays(columns, schema=self._schema),
+                                      row_group_size=ROW_GROUP_SIZE)
+
+    def _append(self, row):
+        for col, conv, values in zip(self.fieldnames, self._converters, self._columns):
+            values.append(conv(row.get(col)))
+        if self._columns and len(self._columns[0]) >= ROW_GROUP_SIZE:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if not self._columns or not self._columns[0]:
+            return
+        arrays = [pa.array(values, type=field.type) for values, field in zip(self._columns, self._schema)]
+        self._parquet.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+        self._columns = [[] for _ in self.fieldnames]
+
+    def flush(self):
+        # Parquet rows go out a row group at a time; only the CSV has a stream buffer
+        if self._csv_file:
+            self._csv_file.flush()
+
+    def close(self):
+        if self._parquet:
+            self._write_row_group()
+            self._parquet.close()
+            self._parquet = None
+        if self._csv_file:
+            self._csv_file.close()
+            self._csv_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_table(directory, name, columns=None):
+    """Yield rows of a handoff table as dicts.
+
+    columns limits a Parquet read to those columns (absent ones are skipped);
+    CSV rows always carry every column.
+    """
+    path = find_table(directory, name)
+    if path is None:
+        return
+    if path.endswith('.parquet'):
+        _require_pyarrow()
+        pf = pq.ParquetFile(path)
+        if columns is not None:
+            present = set(pf.schema_arrow.names)
+            columns = [c for c in columns if c in present]
+        for batch in pf.iter_batches(batch_size=ROW_GROUP_SIZE, columns=columns):
+            yield from batch.to_pylist()
+    else:
+        with open(path, 'r') as f:
+            yield from csv.DictReader(f)
+
+def read_arrow(directory, name):
+    """Whole handoff table as an Arrow table, or None if missing.
+
+    CSV columns are all read as strings, as csv.DictReader would return them.
+    """
+    path = find_table(directory, name)
+    if path is None:
+        return None
+    _require_pyarrow()
+    if path.endswith('.parquet'):
+        return pq.read_table(path)
+    with open(path, 'r', newline='') as f:
+        header = next(csv.reader(f), [])
+    return pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(
+        column_types={c: pa.string() for c in header}, strings_can_be_null=False))
+
+def count_rows(directory, name):
+    """Data rows in a handoff table (0 if missing)."""
+    path = find_table(directory, name)
+    if path is None:
+        return 0
+    if path.endswith('.parquet'):
+        _require_pyarrow()
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, 'r') as f:
+        count = sum(1 for _ in f)
+    # Header line
+    return max(count - 1, 0)
@@ -0,0 +1,149 @@
+"""
+Versioned schema migrations for tebra_dw.
+Applies database/migrations/NNN_*.sql in version order, each in its own
+transaction, and records it in schema_migrations so it runs once per
+database. Run at deploy (python -m src.migrations) and at orchestrator
+startup; the load path itself never issues DDL.
+
+Fresh Docker volumes also run these files as initdb scripts, which does not
+record them, so every migration must be idempotent (IF NOT EXISTS, or a DO
+block that ignores duplicate_object): the first runner pass re-applies them
+harmlessly and records them.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../database/migrations'))
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+# pg_advisory_lock key: concurrent orchestrators wait instead of applying twice
+LOCK_ID = 835001
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] sorted by version; other files are ignored."""
+    found = []
+    for fname in os.listdir(directory):
+        m = MIGRATION_FILE.match(fname)
+        if m:
+            found.append((int(m.group(1)), m.group(2), os.path.join(directory, fname)))
+    found.sort()
+    versions = [v for v, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return found
+
+# Owner of the REFERENCES clauses that follow it (CREATE TABLE column FKs, ALTER TABLE ... ADD CONSTRAINT)
+_FK_CLAUSE = re.compile(r'(?:CREATE TABLE(?: IF NOT EXISTS)?|ALTER TABLE)\s+([\w.]+)|REFERENCES\s+([\w.]+)', re.I)
+
+def foreign_keys(directory=MIGRATIONS_DIR):
+    """{table: {tables it references}} as declared across the migrations."""
+    parents = {}
+    for _, _, path in list_migrations(directory):
+        with open(path) as f:
+            sql = re.sub(r'--[^\n]*', '', f.read())
+        owner = None
+        for m in _FK_CLAUSE.finditer(sql):
+            if m.group(1):
+                owner = m.group(1)
+                parents.setdefault(owner, set())
+            elif owner and m.group(2) != owner:
+                parents[owner].add(m.group(2))
+    return parents
+
+def fk_levels(tables, directory=MIGRATIONS_DIR):
+    """Split tables into levels that only reference tables in earlier levels.
+
+    Tables in one level are independent of each other; order within a level
+    follows `tables`. References to tables not listed are ignored.
+    """
+    parents = foreign_keys(directory)
+    remaining = list(tables)
+    levels = []
+    while remaining:
+        level = [t for t in remaining if not (parents.get(t, set()) - {t}) & set(remaining)]
+        if not level:
+            raise ValueError(f"Foreign key cycle among {remaining}")
+        levels.append(level)
+        remaining = [t for t in remaining if t not in level]
+    return levels
+
+def _checksum(sql):
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+def applied_migrations(cur):
+    """{version: checksum} already recorded in schema_migrations."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def migrate(conn, directory=MIGRATIONS_DIR, dry_run=False):
+    """Apply pending migrations on a psycopg2 connection.
+
+    Returns the (version, name) pairs applied (or pending, with dry_run).
+    A failing migration is rolled back and re-raised; earlier ones stay applied.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+    try:
+        applied = applied_migrations(cur)
+        conn.commit()
+        done = []
+        for version, name, path in list_migrations(directory):
+            with open(path) as f:
+                sql = f.read()
+            if version in applied:
+                if applied[version] != _checksum(sql):
+                    logger.warning(f"Migration {version:03d}_{name} changed after it was applied; not re-running it.")
+                continue
+            if dry_run:
+                done.append((version, name))
+                continue
+            logger.info(f"Applying migration {version:03d}_{name}...")
+            try:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                            (version, name, _checksum(sql)))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            done.append((version, name))
+        return done
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+        conn.commit()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    import psycopg2
+    from loading.load_to_postgres import DB_CONFIG
+
+    ap = argparse.ArgumentParser(description='Apply pending tebra_dw schema migrations')
+    ap.add_argument('--dbname', default=DB_CONFIG['dbname'])
+    ap.add_argument('--dry-run', action='store_true', help='List pending migrations without applying them')
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(**{**DB_CONFIG, 'dbname': args.dbname})
+    try:
+        done = migrate(conn, dry_run=args.dry_run)
+    finally:
+        conn.close()
+    verb = 'Pending' if args.dry_run else 'Applied'
+    print(f"{verb}: " + (", ".join(f"{v:03d}_{n}" for v, n in done) or "none (schema is up to date)"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+On-disk cache of parsed ERA records (sqlite).
+Entries are keyed by CLEARINGHOUSERESPONSEID, the SHA-256 of FILECONTENTS, the
+parser version and the parse detail, so a changed file or a parser version bump
+is simply a miss. Size-bounded: least recently used entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from src.era_parser_xml import PARSER_VERSION
+
+DEFAULT_PATH = os.environ.get(
+    'ERA_PARSE_CACHE',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/cache/era_parse_cache.sqlite'))
+)
+DEFAULT_MAX_BYTES = int(os.environ.get('ERA_PARSE_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+def content_hash(content):
+    """SHA-256 hex digest of FILECONTENTS."""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+class EraParseCache:
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Several practice workers may share the file; wait on their write locks
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS era_parse_cache (
+                response_id TEXT NOT NULL,
+                content_sha256 TEXT NOT NULL,
+                parser_version TEXT NOT NULL,
+                detail TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (response_id, content_sha256, parser_version, detail)
+            )
+        """)
+        # Entries from other parser versions can never hit again
+        self.conn.execute("DELETE FROM era_parse_cache WHERE parser_version <> ?", (PARSER_VERSION,))
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, response_id, digest, detail):
+        """Cached records for this response/content, or None."""
+        row = self.conn.execute("""
+            SELECT payload FROM era_parse_cache
+            WHERE response_id = ? AND content_sha256 = ? AND parser_version = ? AND detail = ?
+        """, (str(response_id), digest, PARSER_VERSION, detail)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("""
+            UPDATE era_parse_cache SET last_used = ?
+            WHERE response_id = ? AND content_sha256 = ? AND parser_version = ? AND detail = ?
+        """, (time.time(), str(response_id), digest, PARSER_VERSION, detail))
+        return json.loads(row[0])
+
+    def put(self, response_id, digest, detail, records):
+        # default=str: dates are written to CSV as str() anyway
+        payload = json.dumps(records, default=str)
+        self.conn.execute("""
+            INSERT OR REPLACE INTO era_parse_cache
+                (response_id, content_sha256, parser_version, detail, payload, size_bytes, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (str(response_id), digest, PARSER_VERSION, detail, payload, len(payload), time.time()))
+
+    def commit(self):
+        """Persist pending writes and evict LRU entries beyond max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM era_parse_cache").fetchone()[0]
+        if total > self.max_bytes:
+            freed = 0
+            evict = []
+            for key, size in self.conn.execute("""
+                SELECT rowid, size_bytes FROM era_parse_cache ORDER BY last_used
+            """):
+                if total - freed <= self.max_bytes:
+                    break
+                evict.append((key,))
+                freed += size
+            self.conn.executemany("DELETE FROM era_parse_cache WHERE rowid = ?", evict)
+        self.conn.commit()
+
+    def close(self):
+        self.commit()
+        self.conn.close()
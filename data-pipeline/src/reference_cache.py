@@ -0,0 +1,178 @@
+"""
+Local cache of Snowflake reference dictionaries (sqlite).
+CARC/RARC are cached as whole tables; POS, procedure, modifier and diagnosis
+dictionaries per key, so only keys we haven't seen (or that went stale) are
+queried. Entries expire after a TTL, and a dictionary is dropped outright when
+its Snowflake table's LAST_ALTERED changes. One instance is shared by every
+practice and worker thread in an orchestrator run.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.environ.get(
+    'REFERENCE_CACHE',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/cache/reference_cache.sqlite'))
+)
+DEFAULT_TTL = float(os.environ.get('REFERENCE_CACHE_TTL_HOURS', '168')) * 3600
+
+# name -> (source table, query). Rows come back key first; keyed queries filter with IN {keys}.
+DICTIONARIES = {
+    'carc': ('PM_ADJUSTMENTREASON',
+             "SELECT ADJUSTMENTREASONCODE, DESCRIPTION FROM PM_ADJUSTMENTREASON"),
+    'rarc': ('PM_REMITTANCEREMARK',
+             "SELECT REMITTANCECODE, REMITTANCEDESCRIPTION FROM PM_REMITTANCEREMARK"),
+    'pos': ('PM_PLACEOFSERVICE',
+            "SELECT PLACEOFSERVICECODE, DESCRIPTION FROM PM_PLACEOFSERVICE WHERE PLACEOFSERVICECODE IN {keys}"),
+    'proc_dict': ('PM_PROCEDURECODEDICTIONARY',
+                  "SELECT PROCEDURECODEDICTIONARYID, OFFICIALNAME FROM PM_PROCEDURECODEDICTIONARY "
+                  "WHERE PROCEDURECODEDICTIONARYID IN {keys}"),
+    'modifier': ('PM_PROCEDUREMODIFIER',
+                 "SELECT PROCEDUREMODIFIERCODE, MODIFIERNAME FROM PM_PROCEDUREMODIFIER WHERE PROCEDUREMODIFIERCODE IN {keys}"),
+    'icd10': ('PM_ICD10DIAGNOSISCODEDICTIONARY', """
+        SELECT ICD10DIAGNOSISCODEDICTIONARYID,
+               COALESCE(OFFICIALNAME, OFFICIALDESCRIPTION, LOCALNAME) as Desc
+        FROM PM_ICD10DIAGNOSISCODEDICTIONARY
+        WHERE ICD10DIAGNOSISCODEDICTIONARYID IN {keys}
+    """),
+    'diag_legacy': ('PM_DIAGNOSISCODEDICTIONARY',
+                    "SELECT DIAGNOSISCODEDICTIONARYID, OFFICIALNAME FROM PM_DIAGNOSISCODEDICTIONARY "
+                    "WHERE DIAGNOSISCODEDICTIONARYID IN {keys}"),
+}
+
+# Stored in place of a key's rows for the whole-table marker
+_TABLE_KEY = '*'
+
+class ReferenceCache:
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Used from practice worker threads, always under _lock
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ref_entry (
+                dictionary TEXT NOT NULL,
+                key TEXT NOT NULL,
+                rows TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (dictionary, key)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ref_version (
+                dictionary TEXT PRIMARY KEY,
+                version TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        # dictionary -> {str(key): (rows, fetched_at)}, read from disk once per run
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def check_versions(self, cursor):
+        """Drop dictionaries whose Snowflake table changed since they were cached."""
+        tables = {table: name for name, (table, _) in DICTIONARIES.items()}
+        try:
+            cursor.execute(
+                "SELECT TABLE_NAME, LAST_ALTERED FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME IN ("
+                + ", ".join(["%s"] * len(tables)) + ")", list(tables))
+            current = {tables[r[0]]: str(r[1]) for r in cursor.fetchall() if r[0] in tables}
+        except Exception as e:
+            logger.warning(f"Reference version check failed, relying on TTL only: {e}")
+            return
+        with self._lock:
+            stored = dict(self.conn.execute("SELECT dictionary, version FROM ref_version"))
+            for name, version in current.items():
+                if stored.get(name) == version:
+                    continue
+                if name in stored:
+                    logger.info(f"Reference dictionary {name} changed in Snowflake; dropping cached entries.")
+                self.conn.execute("DELETE FROM ref_entry WHERE dictionary = ?", (name,))
+                self.conn.execute("INSERT OR REPLACE INTO ref_version (dictionary, version) VALUES (?, ?)",
+                                  (name, version))
+                self._entries.pop(name, None)
+            self.conn.commit()
+
+    def _loaded(self, name):
+        entries = self._entries.get(name)
+        if entries is None:
+            entries = {}
+            for key, rows, fetched_at in self.conn.execute(
+                    "SELECT key, rows, fetched_at FROM ref_entry WHERE dictionary = ?", (name,)):
+                entries[key] = (json.loads(rows), fetched_at)
+            self._entries[name] = entries
+        return entries
+
+    def _fresh(self, entry, now):
+        return entry is not None and now - entry[1] < self.ttl
+
+    def _store(self, name, key, rows, now):
+        self._entries[name][key] = (rows, now)
+        # default=str: dates are written to CSV as str() anyway
+        self.conn.execute("""
+            INSERT OR REPLACE INTO ref_entry (dictionary, key, rows, fetched_at) VALUES (?, ?, ?, ?)
+        """, (name, key, json.dumps(rows, default=str), now))
+
+    def table(self, name, fetch):
+        """All rows of a whole-table dictionary; fetch(query) runs on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._loaded(name).get(_TABLE_KEY)
+            if self._fresh(entry, now):
+                self.hits += 1
+                return [tuple(r) for r in entry[0]]
+            self.misses += 1
+        rows = [list(r) for r in fetch(DICTIONARIES[name][1])]
+        with self._lock:
+            self._loaded(name)
+            self._store(name, _TABLE_KEY, rows, now)
+            self.conn.commit()
+        return [tuple(r) for r in rows]
+
+    def lookup(self, name, keys, fetch):
+        """Rows of a keyed dictionary for `keys`, shaped like fetch_by_keys' result.
+
+        fetch(query, keys) is called once with the keys not cached (or stale).
+        Keys with no rows are remembered too, so they aren't re-queried until the TTL.
+        """
+        now = time.time()
+        rows = []
+        missing = []
+        with self._lock:
+            entries = self._loaded(name)
+            for key in keys:
+                entry = entries.get(str(key))
+                if self._fresh(entry, now):
+                    rows.extend((key, *values) for values in entry[0])
+                else:
+                    missing.append(key)
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return rows
+
+        fetched = {str(k): [] for k in missing}
+        for r in fetch(DICTIONARIES[name][1], missing):
+            fetched.setdefault(str(r[0]), []).append(list(r[1:]))
+            rows.append(tuple(r))
+        with self._lock:
+            self._loaded(name)
+            for key, values in fetched.items():
+                self._store(name, key, values, now)
+            self.conn.commit()
+        return rows
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
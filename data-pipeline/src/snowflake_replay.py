@@ -0,0 +1,283 @@
+"""
+Offline stand-in for Snowflake (SNOWFLAKE_BACKEND=record|replay, see src/connection.py).
+
+record: a live connection whose query results are also saved under
+        <replay dir>/queries/ (Parquet, plus the SQL text for reference).
+replay: no network. Each connection is a DuckDB session over the PM_* tables
+        in <replay dir>/tables/*.parquet, loaded once per process. A query
+        that was recorded is answered from its recording; anything else runs
+        on the tables after translate() adapts the few Snowflake-only bits.
+
+Tables come from `python -m src.snowflake_replay snapshot` (a live copy of
+the PM_* tables the pipeline reads, optionally limited to some practices) or
+from the synthetic data generator.
+"""
+import argparse
+import hashlib
+import os
+import re
+import threading
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_DIR = os.environ.get(
+    'SNOWFLAKE_REPLAY_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '../data/replay'))
+)
+
+# Snowflake tables the pipeline reads -> snapshot filter for a practice list
+# ({practices} is a bound IN list). None copies the whole table (dictionaries).
+_PRACTICE_ENCOUNTERS = "SELECT {column} FROM PM_ENCOUNTER WHERE PRACTICEGUID IN {practices}"
+_PRACTICE_PROCEDURES = ("SELECT EP.{column} FROM PM_ENCOUNTERPROCEDURE EP JOIN PM_ENCOUNTER E "
+                        "ON E.ENCOUNTERGUID = EP.ENCOUNTERGUID WHERE E.PRACTICEGUID IN {practices}")
+_PRACTICE_PLANS = "SELECT INSURANCECOMPANYPLANGUID FROM PM_INSURANCEPOLICY WHERE PRACTICEGUID IN {practices}"
+SNAPSHOT_TABLES = {
+    'PM_PRACTICE': "PRACTICEGUID IN {practices}",
+    'PM_CLEARINGHOUSERESPONSE': "PRACTICEGUID IN {practices}",
+    'PM_CLAIM': "PRACTICEGUID IN {practices}",
+    'PM_ENCOUNTER': "PRACTICEGUID IN {practices}",
+    'PM_ENCOUNTERPROCEDURE': f"ENCOUNTERGUID IN ({_PRACTICE_ENCOUNTERS.format(column='ENCOUNTERGUID', practices='{practices}')})",
+    'PM_ENCOUNTERDIAGNOSIS': "ENCOUNTERDIAGNOSISID IN (" + " UNION ".join(
+        _PRACTICE_PROCEDURES.format(column=f'ENCOUNTERDIAGNOSISID{i}', practices='{practices}')
+        for i in range(1, 9)) + ")",
+    'PM_APPOINTMENT': f"APPOINTMENTGUID IN ({_PRACTICE_ENCOUNTERS.format(column='APPOINTMENTGUID', practices='{practices}')})",
+    'PM_PATIENT': "PRACTICEGUID IN {practices}",
+    'PM_DOCTOR': "PRACTICEGUID IN {practices}",
+    'PM_SERVICELOCATION': "PRACTICEGUID IN {practices}",
+    'PM_INSURANCEPOLICYAUTHORIZATION': "INSURANCEPOLICYAUTHORIZATIONID IN ("
+        + _PRACTICE_ENCOUNTERS.format(column='INSURANCEPOLICYAUTHORIZATIONID', practices='{practices}') + ")",
+    'PM_INSURANCEPOLICY': "PRACTICEGUID IN {practices}",
+    'PM_INSURANCECOMPANYPLAN': f"INSURANCECOMPANYPLANGUID IN ({_PRACTICE_PLANS})",
+    'PM_INSURANCECOMPANY': "INSURANCECOMPANYID IN (SELECT INSURANCECOMPANYID FROM PM_INSURANCECOMPANYPLAN "
+        f"WHERE INSURANCECOMPANYPLANGUID IN ({_PRACTICE_PLANS}))",
+    'PM_PROCEDURECODEDICTIONARY': None,
+    'PM_PROCEDUREMODIFIER': None,
+    'PM_ICD10DIAGNOSISCODEDICTIONARY': None,
+    'PM_DIAGNOSISCODEDICTIONARY': None,
+    'PM_PLACEOFSERVICE': None,
+    'PM_ADJUSTMENTREASON': None,
+    'PM_REMITTANCEREMARK': None,
+}
+
+# Statements whose results are recorded; DDL/DML always runs against the session
+_QUERY = re.compile(r'^\s*(SELECT|WITH|SHOW|DESCRIBE)\b', re.IGNORECASE)
+
+def _require(module, package):
+    if module is None:
+        raise ImportError(f"SNOWFLAKE_BACKEND record/replay needs {package} (pip install {package})")
+
+def query_key(sql, params=None):
+    """Recording file name for a statement: whitespace-insensitive SQL plus its parameters."""
+    text = " ".join(sql.split()) + "\n" + repr(list(params) if params is not None else None)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def translate(sql, params=None):
+    """Snowflake SQL as DuckDB runs it."""
+    if params is not None:
+        # pyformat placeholders; a literal % is doubled when parameters are bound
+        sql = sql.replace('%s', '?').replace('%%', '%')
+    # Staged keys are VARCHAR: Snowflake casts them to the column's type, DuckDB won't compare
+    sql = re.sub(r'([\w.]+)\s+IN\s+\(\s*SELECT KEY_VALUE FROM', r'CAST(\1 AS VARCHAR) IN (SELECT KEY_VALUE FROM', sql)
+    # DuckDB's catalog has no LAST_ALTERED; a table's version is its snapshot file's mtime
+    sql = re.sub(r'\bINFORMATION_SCHEMA\.TABLES\b', 'REPLAY_TABLE_VERSIONS', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'^(\s*)DESCRIBE\s+TABLE\b', r'\1DESCRIBE', sql, flags=re.IGNORECASE)
+    return sql
+
+def _table_from_rows(names, rows):
+    columns = list(zip(*rows)) if rows else [[] for _ in names]
+    return pa.table([pa.array(list(values)) for values in columns], names=names)
+
+def save_result(directory, sql, params, names, rows):
+    _require(pa, 'pyarrow')
+    queries = os.path.join(directory, 'queries')
+    os.makedirs(queries, exist_ok=True)
+    key = query_key(sql, params)
+    pq.write_table(_table_from_rows(names, rows), os.path.join(queries, f"{key}.parquet"), compression='zstd')
+    with open(os.path.join(queries, f"{key}.sql"), 'w') as f:
+        f.write(sql.strip() + "\n-- params: " + repr(params) + "\n")
+
+class _BufferedCursor:
+    """Results held in memory, served through the DB-API fetch calls the pipeline uses."""
+    def _set_result(self, names, rows):
+        self.description = [(n, None, None, None, None, None, None) for n in names] if names is not None else None
+        self._rows = rows
+        self._pos = 0
+        self.rowcount = len(rows)
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def close(self):
+        self._rows = []
+
+class RecordingCursor(_BufferedCursor):
+    def __init__(self, connection, cursor):
+        self.connection = connection
+        self._cursor = cursor
+        self._set_result(None, [])
+
+    def execute(self, sql, params=None):
+        if params is None:
+            self._cursor.execute(sql)
+        else:
+            self._cursor.execute(sql, params)
+        if _QUERY.match(sql):
+            names = [d[0] for d in self._cursor.description]
+            rows = [tuple(r) for r in self._cursor.fetchall()]
+            save_result(self.connection.directory, sql, params, names, rows)
+        else:
+            names, rows = None, []
+        self._set_result(names, rows)
+        return self
+
+    def executemany(self, sql, seq):
+        self._cursor.executemany(sql, seq)
+        self._set_result(None, [])
+
+class RecordingConnection:
+    """Live Snowflake connection whose query results are saved for replay."""
+    def __init__(self, conn, directory=DEFAULT_DIR):
+        _require(pa, 'pyarrow')
+        self._conn = conn
+        self.directory = directory
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return RecordingCursor(self, self._conn.cursor())
+
+    def close(self):
+        self._conn.close()
+
+class ReplayCursor(_BufferedCursor):
+    def __init__(self, connection):
+        self.connection = connection
+        self._set_result(None, [])
+
+    def execute(self, sql, params=None):
+        session = self.connection.session
+        path = os.path.join(self.connection.directory, 'queries', f"{query_key(sql, params)}.parquet")
+        if _QUERY.match(sql) and os.path.exists(path):
+            result = session.execute("SELECT * FROM read_parquet(?)", [path])
+        elif params is None:
+            result = session.execute(translate(sql))
+        else:
+            result = session.execute(translate(sql, params), list(params))
+        if result.description is None:
+            self._set_result(None, [])
+        else:
+            self._set_result([d[0] for d in result.description], result.fetchall())
+        return self
+
+    def executemany(self, sql, seq):
+        self.connection.session.executemany(translate(sql, ()), [list(p) for p in seq])
+        self._set_result(None, [])
+
+class ReplayConnection:
+    """One DuckDB session on the process's replay database, standing in for a Snowflake session."""
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        # Temp tables (e.g. TMP_ENRICH_KEYS) are per session, as in Snowflake
+        self.session = _database(directory).cursor()
+        self._closed = False
+
+    def cursor(self):
+        return ReplayCursor(self)
+
+    def is_closed(self):
+        return self._closed
+
+    def close(self):
+        if not self._closed:
+            self.session.close()
+            self._closed = True
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+def _database(directory):
+    """In-memory DuckDB with every tables/*.parquet loaded, built once per directory."""
+    _require(duckdb, 'duckdb')
+    with _databases_lock:
+        db = _databases.get(directory)
+        if db is None:
+            db = duckdb.connect()
+            tables = os.path.join(directory, 'tables')
+            versions = []
+            for name in sorted(os.listdir(tables)) if os.path.isdir(tables) else []:
+                table, ext = os.path.splitext(name)
+                if ext != '.parquet':
+                    continue
+                path = os.path.join(tables, name)
+                db.execute(f"CREATE TABLE {table} AS SELECT * FROM read_parquet(?)", [path])
+                versions.append((table.upper(), str(os.path.getmtime(path))))
+            db.execute("CREATE TABLE REPLAY_TABLE_VERSIONS (TABLE_NAME VARCHAR, LAST_ALTERED VARCHAR)")
+            if versions:
+                db.executemany("INSERT INTO REPLAY_TABLE_VERSIONS VALUES (?, ?)", versions)
+            _databases[directory] = db
+        return db
+
+def snapshot(conn, directory=DEFAULT_DIR, practices=None, tables=None):
+    """Copy the PM_* tables into <directory>/tables/ for replay.
+
+    practices limits practice-owned tables (and the rows they reference) to those GUIDs.
+    """
+    _require(pa, 'pyarrow')
+    out = os.path.join(directory, 'tables')
+    os.makedirs(out, exist_ok=True)
+    cursor = conn.cursor()
+    for table in tables or SNAPSHOT_TABLES:
+        where = SNAPSHOT_TABLES.get(table)
+        params = None
+        query = f"SELECT * FROM {table}"
+        if practices and where:
+            query += " WHERE " + where.replace('{practices}', "(" + ", ".join(["%s"] * len(practices)) + ")")
+            params = list(practices) * where.count('{practices}')
+        cursor.execute(query, params)
+        names = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+        pq.write_table(_table_from_rows(names, rows), os.path.join(out, f"{table}.parquet"), compression='zstd')
+        print(f"  {table}: {len(rows)} rows")
+    cursor.close()
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from src.connection import get_connection
+
+    parser = argparse.ArgumentParser(description='Snapshot Snowflake PM_* tables for SNOWFLAKE_BACKEND=replay')
+    parser.add_argument('command', choices=['snapshot'])
+    parser.add_argument('--out', default=DEFAULT_DIR, help='Replay directory (default: SNOWFLAKE_REPLAY_DIR)')
+    parser.add_argument('--practice', action='append', help='Limit to this practice GUID (repeatable)')
+    parser.add_argument('--table', action='append', help='Only this table (repeatable)')
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        snapshot(conn, args.out, practices=args.practice, tables=args.table)
+    finally:
+        conn.close()
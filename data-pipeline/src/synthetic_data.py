@@ -0,0 +1,484 @@
+"""
+Synthetic PM_* tables for load and scaling tests (no patient data).
+
+Writes <replay dir>/tables/*.parquet for SNOWFLAKE_BACKEND=replay
+(src/snowflake_replay.py): practices with clearinghouse responses whose ERA
+FILECONTENTS are XML-wrapped 835s (CLP/NM1/SVC/DTM/CAS/REF*6R), processing
+reports (.CSR) for the same claims, and the encounter, procedure, claim,
+patient, provider, location, policy and dictionary rows the REF*6R claim IDs
+link to. Everything is drawn from one seeded RNG, so a given set of options
+always produces the same tables.
+
+Volume is practices x ERAs per practice (times --scale) x claims per ERA x
+lines per claim; rows are streamed to Parquet in row groups, so memory stays
+flat as the scale grows.
+
+    python -m src.synthetic_data --practices 5 --eras 40 --claims 25 --lines 3 --scale 10
+"""
+import argparse
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from src.snowflake_replay import DEFAULT_DIR, _require
+
+# Rows buffered per table before a Parquet row group is written
+ROW_GROUP_SIZE = 50000
+
+# The pipeline links service lines on 6-digit claim IDs (REF*6R ...K<claim id>)
+FIRST_CLAIM_ID = 100000
+LAST_CLAIM_ID = 999999
+
+# Encounters per patient, on average
+VISITS_PER_PATIENT = 6
+PROVIDERS_PER_PRACTICE = 4
+LOCATIONS_PER_PRACTICE = 2
+# Share of claims the payer denies, and of encounters carrying an authorization
+DENIAL_RATE = 0.05
+AUTHORIZATION_RATE = 0.3
+
+# table -> [(column, type)]
+SCHEMAS = {
+    'PM_PRACTICE': [
+        ('PRACTICEGUID', 'str'), ('NAME', 'str'), ('ACTIVE', 'bool'), ('NPI', 'str'),
+        ('ADDRESSLINE1', 'str'), ('CITY', 'str'), ('STATE', 'str'), ('ZIPCODE', 'str'),
+    ],
+    'PM_CLEARINGHOUSERESPONSE': [
+        ('CUSTOMERID', 'int'), ('CLEARINGHOUSERESPONSEID', 'int'), ('CLEARINGHOUSERESPONSEREPORTTYPEID', 'int'),
+        ('CLEARINGHOUSERESPONSEREPORTTYPENAME', 'str'), ('CLEARINGHOUSERESPONSESOURCETYPEID', 'int'),
+        ('CLEARINGHOUSERESPONSESOURCETYPENAME', 'str'), ('DENIED', 'int'), ('FILECONTENTS', 'str'),
+        ('FILENAME', 'str'), ('FILERECEIVEDATE', 'timestamp'), ('ITEMCOUNT', 'int'), ('PAYMENTID', 'int'),
+        ('PRACTICEGUID', 'str'), ('PROCESSEDFLAG', 'bool'), ('REJECTED', 'int'), ('RESPONSETYPE', 'int'),
+        ('CLEARINGHOUSERESPONSETYPENAME', 'str'), ('REVIEWEDFLAG', 'bool'), ('SOURCEADDRESS', 'str'),
+        ('SOURCENAME', 'str'), ('TITLE', 'str'), ('TOTALAMOUNT', 'float'),
+    ],
+    'PM_CLAIM': [
+        ('CLAIMID', 'int'), ('ENCOUNTERPROCEDUREID', 'int'), ('PATIENTGUID', 'str'), ('STATUSNAME', 'str'),
+        ('PAYERPROCESSINGSTATUSTYPEDESC', 'str'), ('CLEARINGHOUSEPAYER', 'str'),
+        ('CLEARINGHOUSETRACKINGNUMBER', 'str'), ('PRACTICEGUID', 'str'),
+    ],
+    'PM_ENCOUNTER': [
+        ('ENCOUNTERGUID', 'str'), ('ENCOUNTERID', 'int'), ('DATEOFSERVICE', 'timestamp'),
+        ('ENCOUNTERSTATUSDESCRIPTION', 'str'), ('APPOINTMENTGUID', 'str'), ('PROVIDERGUID', 'str'),
+        ('SERVICELOCATIONGUID', 'str'), ('INSURANCEPOLICYAUTHORIZATIONID', 'int'), ('PATIENTCASEID', 'int'),
+        ('PLACEOFSERVICECODE', 'str'), ('REFERRINGPHYSICIANGUID', 'str'), ('PRACTICEGUID', 'str'),
+        ('PATIENTGUID', 'str'),
+    ],
+    'PM_ENCOUNTERPROCEDURE': [
+        ('ENCOUNTERPROCEDUREID', 'int'), ('ENCOUNTERGUID', 'str'), ('PROCEDURECODEDICTIONARYID', 'int'),
+        ('PROCEDUREDATEOFSERVICE', 'date'), ('SERVICECHARGEAMOUNT', 'float'), ('SERVICEUNITCOUNT', 'float'),
+        ('TYPEOFSERVICEDESCRIPTION', 'str'),
+    ] + [(f'ENCOUNTERDIAGNOSISID{i}', 'int') for i in range(1, 9)]
+      + [(f'PROCEDUREMODIFIER{i}', 'str') for i in range(1, 5)],
+    'PM_ENCOUNTERDIAGNOSIS': [
+        ('ENCOUNTERDIAGNOSISID', 'int'), ('ENCOUNTERGUID', 'str'), ('DIAGNOSISCODEDICTIONARYID', 'int'),
+    ],
+    'PM_APPOINTMENT': [
+        ('APPOINTMENTGUID', 'str'), ('APPOINTMENTTYPE', 'str'), ('APPOINTMENTTYPEDESCRIPTION', 'str'),
+        ('SUBJECT', 'str'), ('NOTES', 'str'), ('STARTDATE', 'timestamp'), ('PRACTICEGUID', 'str'),
+        ('PATIENTGUID', 'str'),
+    ],
+    'PM_PATIENT': [
+        ('PATIENTGUID', 'str'), ('PATIENTID', 'int'), ('FIRSTNAME', 'str'), ('LASTNAME', 'str'), ('DOB', 'date'),
+        ('GENDER', 'str'), ('ADDRESSLINE1', 'str'), ('CITY', 'str'), ('STATE', 'str'), ('ZIPCODE', 'str'),
+        ('PRACTICEGUID', 'str'), ('PRIMARYPROVIDERGUID', 'str'), ('DEFAULTSERVICELOCATIONGUID', 'str'),
+        ('REFERRINGPHYSICIANGUID', 'str'), ('ACTIVE', 'bool'),
+    ],
+    'PM_DOCTOR': [
+        ('DOCTORGUID', 'str'), ('NPI', 'str'), ('FIRSTNAME', 'str'), ('LASTNAME', 'str'), ('PRACTICEGUID', 'str'),
+        ('DOCTORID', 'int'), ('TAXONOMYCODE', 'str'),
+    ],
+    'PM_SERVICELOCATION': [
+        ('SERVICELOCATIONGUID', 'str'), ('NAME', 'str'), ('ADDRESSLINE1', 'str'), ('CITY', 'str'), ('STATE', 'str'),
+        ('PRACTICEGUID', 'str'), ('NPI', 'str'), ('PLACEOFSERVICECODE', 'str'), ('SERVICELOCATIONID', 'int'),
+    ],
+    'PM_INSURANCEPOLICYAUTHORIZATION': [
+        ('INSURANCEPOLICYAUTHORIZATIONID', 'int'), ('INSURANCEPOLICYGUID', 'str'), ('AUTHORIZATIONNUMBER', 'str'),
+    ],
+    'PM_INSURANCEPOLICY': [
+        ('INSURANCEPOLICYGUID', 'str'), ('POLICYNUMBER', 'str'), ('GROUPNUMBER', 'str'),
+        ('INSURANCECOMPANYPLANGUID', 'str'), ('POLICYSTARTDATE', 'date'), ('POLICYENDDATE', 'date'),
+        ('COPAY', 'float'), ('PRACTICEGUID', 'str'), ('PATIENTCASEID', 'int'), ('PRECEDENCE', 'int'),
+        ('ACTIVE', 'bool'),
+    ],
+    'PM_INSURANCECOMPANYPLAN': [
+        ('INSURANCECOMPANYPLANGUID', 'str'), ('PLANNAME', 'str'), ('INSURANCECOMPANYID', 'int'),
+    ],
+    'PM_INSURANCECOMPANY': [('INSURANCECOMPANYID', 'int'), ('INSURANCECOMPANYNAME', 'str')],
+    'PM_PROCEDURECODEDICTIONARY': [
+        ('PROCEDURECODEDICTIONARYID', 'int'), ('PROCEDURECODE', 'str'), ('OFFICIALNAME', 'str'),
+    ],
+    'PM_PROCEDUREMODIFIER': [
+        ('PROCEDUREMODIFIERID', 'int'), ('PROCEDUREMODIFIERCODE', 'str'), ('MODIFIERNAME', 'str'),
+    ],
+    'PM_ICD10DIAGNOSISCODEDICTIONARY': [
+        ('ICD10DIAGNOSISCODEDICTIONARYID', 'int'), ('DIAGNOSISCODE', 'str'), ('OFFICIALNAME', 'str'),
+        ('OFFICIALDESCRIPTION', 'str'), ('LOCALNAME', 'str'),
+    ],
+    'PM_DIAGNOSISCODEDICTIONARY': [
+        ('DIAGNOSISCODEDICTIONARYID', 'int'), ('DIAGNOSISCODE', 'str'), ('OFFICIALNAME', 'str'),
+    ],
+    'PM_PLACEOFSERVICE': [('PLACEOFSERVICECODE', 'str'), ('DESCRIPTION', 'str')],
+    'PM_ADJUSTMENTREASON': [('ADJUSTMENTREASONCODE', 'str'), ('DESCRIPTION', 'str')],
+    'PM_REMITTANCEREMARK': [('REMITTANCECODE', 'str'), ('REMITTANCEDESCRIPTION', 'str')],
+}
+
+# (code, official name, charge per unit)
+PROCEDURES = [
+    ('97110', 'Therapeutic exercises', 65.00),
+    ('97112', 'Neuromuscular reeducation', 70.00),
+    ('97140', 'Manual therapy techniques', 60.00),
+    ('97530', 'Therapeutic activities', 72.00),
+    ('97161', 'PT evaluation low complexity', 150.00),
+    ('97162', 'PT evaluation moderate complexity', 175.00),
+    ('97014', 'Electric stimulation unattended', 30.00),
+    ('97035', 'Ultrasound therapy', 28.00),
+    ('99213', 'Office visit established patient, low', 110.00),
+    ('99214', 'Office visit established patient, moderate', 160.00),
+]
+MODIFIERS = [('GP', 'Services delivered under outpatient PT plan of care'), ('KX', 'Requirements met'),
+             ('59', 'Distinct procedural service'), ('25', 'Significant, separately identifiable E/M'),
+             ('CQ', 'Services by a PT assistant')]
+ICD10 = [
+    ('M54.50', 'Low back pain, unspecified'), ('M25.561', 'Pain in right knee'),
+    ('M25.562', 'Pain in left knee'), ('M75.101', 'Rotator cuff tear, right shoulder'),
+    ('M62.81', 'Muscle weakness (generalized)'), ('S83.511A', 'Sprain of ACL of right knee, initial'),
+    ('M17.11', 'Primary osteoarthritis, right knee'), ('R26.89', 'Other abnormalities of gait'),
+    ('M54.2', 'Cervicalgia'), ('Z96.651', 'Presence of right artificial knee joint'),
+]
+LEGACY_DIAGNOSES = [('724.2', 'Lumbago'), ('719.46', 'Pain in joint, lower leg')]
+# Legacy dictionary IDs sit in their own range, as in Tebra
+LEGACY_DIAGNOSIS_ID = 5001
+PLACES_OF_SERVICE = [('11', 'Office'), ('22', 'On Campus-Outpatient Hospital'), ('02', 'Telehealth')]
+CARC = [('1', 'Deductible Amount'), ('2', 'Coinsurance Amount'), ('3', 'Co-payment Amount'),
+        ('45', 'Charge exceeds fee schedule/maximum allowable'),
+        ('50', 'These are non-covered services because this is not deemed a medical necessity'),
+        ('97', 'The benefit for this service is included in the payment for another service'),
+        ('253', 'Sequestration - reduction in federal payment')]
+RARC = [('M15', 'Separately billed services/tests have been bundled'),
+        ('N130', 'Consult plan benefit documents/guidelines for information about restrictions'),
+        ('MA130', 'Your claim contains incomplete and/or invalid information'),
+        ('N362', 'The number of Days or Units of Service exceeds our acceptable maximum')]
+PAYERS = ['BLUE CROSS BLUE SHIELD', 'UNITEDHEALTHCARE', 'AETNA', 'CIGNA', 'MEDICARE PART B',
+          'HUMANA', 'MEDICAID', 'TRICARE EAST']
+FIRST_NAMES = ['ALEX', 'JORDAN', 'TAYLOR', 'MORGAN', 'CASEY', 'RILEY', 'JAMIE', 'AVERY', 'QUINN', 'DREW',
+               'SAM', 'ROBIN', 'LEE', 'DANA', 'KENDALL', 'REESE']
+LAST_NAMES = ['SYNTH', 'TESTER', 'SAMPLE', 'MOCKLEY', 'FIXTURE', 'DUMMETT', 'PLACEHOLDER', 'EXEMPLAR',
+              'PROTO', 'STANDIN', 'FAUXMAN', 'DECOY']
+CITIES = [('DURHAM', 'NC', '27701'), ('SANFORD', 'NC', '27330'), ('AUSTIN', 'TX', '78701'),
+          ('DENVER', 'CO', '80202'), ('TAMPA', 'FL', '33602')]
+
+
+def _arrow_type(name):
+    return {'str': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(),
+            'date': pa.date32(), 'timestamp': pa.timestamp('us')}[name]
+
+
+class _TableSink:
+    """Rows for one table, written to Parquet a row group at a time."""
+    def __init__(self, path, columns, row_group_size=ROW_GROUP_SIZE):
+        self.schema = pa.schema([(name, _arrow_type(typ)) for name, typ in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.count = 0
+
+    def add(self, *values):
+        self.rows.append(values)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = [pa.array(list(values), type=field.type) for values, field in zip(zip(*self.rows), self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def segment_xml(name, *values):
+    """One 835 segment in Tebra's XML form; None elements are left out."""
+    elements = "".join(f"<{name}{i:02d}>{v}</{name}{i:02d}>" for i, v in enumerate(values, 1) if v is not None)
+    return f'<segment name="{name}">{elements}</segment>'
+
+
+class _Generator:
+    def __init__(self, sinks, seed, end, days):
+        self.sinks = sinks
+        self.rng = random.Random(seed)
+        self.end = end
+        self.days = days
+        self.next_ids = {}
+        self.claim_id = FIRST_CLAIM_ID
+
+    def guid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4)).upper()
+
+    def next_id(self, sequence, start=1):
+        value = self.next_ids.get(sequence, start)
+        self.next_ids[sequence] = value + 1
+        return value
+
+    def npi(self):
+        return str(self.rng.randrange(1000000000, 2000000000))
+
+    def dictionaries(self):
+        add = lambda table, *values: self.sinks[table].add(*values)
+        for i, (code, name, _) in enumerate(PROCEDURES, 1):
+            add('PM_PROCEDURECODEDICTIONARY', i, code, name)
+        for i, (code, name) in enumerate(MODIFIERS, 1):
+            add('PM_PROCEDUREMODIFIER', i, code, name)
+        for i, (code, name) in enumerate(ICD10, 1):
+            add('PM_ICD10DIAGNOSISCODEDICTIONARY', i, code, name, name, None)
+        for i, (code, name) in enumerate(LEGACY_DIAGNOSES, LEGACY_DIAGNOSIS_ID):
+            add('PM_DIAGNOSISCODEDICTIONARY', i, code, name)
+        for code, name in PLACES_OF_SERVICE:
+            add('PM_PLACEOFSERVICE', code, name)
+        for code, name in CARC:
+            add('PM_ADJUSTMENTREASON', code, name)
+        for code, name in RARC:
+            add('PM_REMITTANCEREMARK', code, name)
+        # Two plans per payer: plan GUID -> payer name
+        self.plans = {}
+        for company_id, payer in enumerate(PAYERS, 1):
+            add('PM_INSURANCECOMPANY', company_id, payer)
+            for plan in ('PPO', 'HMO'):
+                plan_guid = self.guid()
+                add('PM_INSURANCECOMPANYPLAN', plan_guid, f"{payer.title()} {plan}", company_id)
+                self.plans[plan_guid] = payer
+
+    def practice(self, number, eras, claims, lines):
+        rng = self.rng
+        add = lambda table, *values: self.sinks[table].add(*values)
+        practice_guid = self.guid()
+        practice_name = f"Synthetic Practice {number:03d}"
+        city, state, zip_code = rng.choice(CITIES)
+        practice_npi = self.npi()
+        add('PM_PRACTICE', practice_guid, practice_name, True, practice_npi, f"{number} Main St", city, state, zip_code)
+
+        doctors = []
+        for _ in range(PROVIDERS_PER_PRACTICE):
+            doctor_guid = self.guid()
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            add('PM_DOCTOR', doctor_guid, self.npi(), first.title(), last.title(), practice_guid,
+                self.next_id('doctor'), '225100000X')
+            doctors.append((doctor_guid, first, last))
+        locations = []
+        for n in range(LOCATIONS_PER_PRACTICE):
+            location_guid = self.guid()
+            pos = PLACES_OF_SERVICE[0][0] if n == 0 else rng.choice(PLACES_OF_SERVICE)[0]
+            add('PM_SERVICELOCATION', location_guid, f"{practice_name} Clinic {n + 1}", f"{100 + n} Clinic Rd",
+                city, state, practice_guid, self.npi(), pos, self.next_id('location'))
+            locations.append((location_guid, pos))
+
+        # Patients, each with one case and a primary (sometimes also a secondary) policy;
+        # grouped by the primary policy's payer so an ERA only carries that payer's patients
+        patients_by_payer = {}
+        plan_guids = list(self.plans)
+        for _ in range(max(1, eras * claims // VISITS_PER_PATIENT)):
+            patient_guid = self.guid()
+            patient_id = self.next_id('patient')
+            case_id = self.next_id('case')
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            primary_doctor = rng.choice(doctors)[0]
+            add('PM_PATIENT', patient_guid, patient_id, first.title(), last.title(),
+                datetime(1940, 1, 1).date() + timedelta(days=rng.randrange(25000)), rng.choice('FM'),
+                f"{rng.randrange(1, 9999)} Synthetic Ave", city.title(), state, zip_code, practice_guid,
+                primary_doctor, locations[0][0], rng.choice(doctors)[0], True)
+            policies = []
+            for precedence in (1, 2) if rng.random() < 0.3 else (1,):
+                policy_guid = self.guid()
+                plan_guid = rng.choice(plan_guids)
+                add('PM_INSURANCEPOLICY', policy_guid, f"POL{patient_id:08d}{precedence}", f"GRP{rng.randrange(10000):05d}",
+                    plan_guid, (self.end - timedelta(days=self.days + 365)).date(), None,
+                    float(rng.choice([0, 10, 20, 30])), practice_guid, case_id, precedence, True)
+                policies.append((policy_guid, plan_guid))
+            patient = (patient_guid, patient_id, case_id, first, last, policies)
+            patients_by_payer.setdefault(self.plans[policies[0][1]], []).append(patient)
+        payers = sorted(patients_by_payer)
+
+        for era in range(eras):
+            # ERAs are spread evenly over the window, oldest first
+            received = self.end - timedelta(days=self.days * (eras - era) / eras, minutes=rng.randrange(600))
+            payer = rng.choice(payers)
+            self.era(practice_guid, practice_name, practice_npi, received, payer, patients_by_payer[payer],
+                     doctors, locations, claims, lines)
+
+    def era(self, practice_guid, practice_name, practice_npi, received, payer, patients, doctors, locations,
+            claims, lines):
+        rng = self.rng
+        add = lambda table, *values: self.sinks[table].add(*values)
+        claim_segments = []
+        csr_lines = []
+        total_billed = total_paid = 0.0
+        denied = 0
+        for _ in range(claims):
+            patient_guid, patient_id, case_id, first, last, policies = rng.choice(patients)
+            doctor_guid, doctor_first, doctor_last = rng.choice(doctors)
+            location_guid, pos = rng.choice(locations)
+            service_date = received - timedelta(days=rng.randrange(7, 45))
+            encounter_guid = self.guid()
+            encounter_id = self.next_id('encounter')
+            appointment_guid = self.guid()
+            add('PM_APPOINTMENT', appointment_guid, 'P', 'Patient Visit', f"{last.title()}, {first.title()}",
+                None, service_date.replace(hour=9, minute=0, second=0, microsecond=0), practice_guid, patient_guid)
+            authorization_id = None
+            if rng.random() < AUTHORIZATION_RATE:
+                authorization_id = self.next_id('authorization')
+                add('PM_INSURANCEPOLICYAUTHORIZATION', authorization_id, policies[0][0], f"AUTH{authorization_id:07d}")
+            referring = rng.choice(doctors)[0] if rng.random() < 0.5 else None
+            add('PM_ENCOUNTER', encounter_guid, encounter_id, service_date.replace(microsecond=0), 'Approved',
+                appointment_guid, doctor_guid, location_guid, authorization_id, case_id, pos, referring,
+                practice_guid, patient_guid)
+            diagnosis_ids = []
+            for _ in range(rng.randint(1, 3)):
+                diagnosis_id = self.next_id('encounter_diagnosis')
+                if rng.random() < 0.05:
+                    dictionary_id = LEGACY_DIAGNOSIS_ID + rng.randrange(len(LEGACY_DIAGNOSES))
+                else:
+                    dictionary_id = rng.randint(1, len(ICD10))
+                add('PM_ENCOUNTERDIAGNOSIS', diagnosis_id, encounter_guid, dictionary_id)
+                diagnosis_ids.append(diagnosis_id)
+
+            is_denied = rng.random() < DENIAL_RATE
+            denied += is_denied
+            svc_segments = []
+            claim_billed = claim_paid = claim_patient = 0.0
+            for _ in range(lines):
+                procedure_id = rng.randint(1, len(PROCEDURES))
+                code, _, price = PROCEDURES[procedure_id - 1]
+                units = rng.randint(1, 4) if code.startswith('97') else 1
+                modifiers = rng.sample([m for m, _ in MODIFIERS], rng.randint(0, 2))
+                billed = round(price * units, 2)
+                patient_part = 0.0 if is_denied else round(billed * rng.choice([0, 0, 0.1, 0.2]), 2)
+                paid = 0.0 if is_denied else round(billed * rng.uniform(0.35, 0.75), 2)
+                paid = min(paid, round(billed - patient_part, 2))
+                encounter_procedure_id = self.next_id('encounter_procedure')
+                add('PM_ENCOUNTERPROCEDURE', encounter_procedure_id, encounter_guid, procedure_id, service_date.date(),
+                    billed, float(units), 'Medical Care',
+                    *(diagnosis_ids + [None] * 8)[:8], *(modifiers + [None] * 4)[:4])
+                claim_id = self.claim_id
+                self.claim_id += 1
+                add('PM_CLAIM', claim_id, encounter_procedure_id, patient_guid, 'Settled' if not is_denied else 'Denied',
+                    'Denied' if is_denied else 'Paid', payer, f"TRK{claim_id}", practice_guid)
+
+                svc_segments.append(segment_xml('SVC', ":".join(['HC', code] + modifiers), f"{billed:.2f}", f"{paid:.2f}",
+                                                None, str(units)))
+                svc_segments.append(segment_xml('DTM', '472', service_date.strftime('%Y%m%d')))
+                if is_denied:
+                    svc_segments.append(segment_xml('CAS', 'CO', '50', f"{billed:.2f}"))
+                else:
+                    svc_segments.append(segment_xml('CAS', 'CO', '45', f"{billed - paid - patient_part:.2f}"))
+                    if patient_part:
+                        svc_segments.append(segment_xml('CAS', 'PR', '2', f"{patient_part:.2f}"))
+                # The pipeline links a line to PM_CLAIM through the 6 digits after K
+                svc_segments.append(segment_xml('REF', '6R', f"{encounter_procedure_id}K{claim_id}"))
+                claim_billed += billed
+                claim_paid += paid
+                claim_patient += patient_part
+
+            clp01 = f"{patient_id}Z{encounter_id}"
+            claim_segments.append(segment_xml('CLP', clp01, '4' if is_denied else '1', f"{claim_billed:.2f}",
+                                              f"{claim_paid:.2f}", f"{claim_patient:.2f}", '12',
+                                              f"PCN{encounter_id:010d}", '11', '1'))
+            claim_segments.append(segment_xml('NM1', 'QC', '1', last, first, None, None, None, 'MI',
+                                              f"MBR{patient_id:08d}"))
+            claim_segments.append(segment_xml('NM1', '82', '1', doctor_last, doctor_first, None, None, None, 'XX',
+                                              self.npi()))
+            claim_segments.extend(svc_segments)
+            csr_lines.append(f"ACPT    {clp01:<14} {last + ', ' + first:<20} {service_date:%m/%d/%Y} "
+                             f"{claim_billed:>10.2f}  {payer}   ACCEPTED")
+            total_billed += claim_billed
+            total_paid += claim_paid
+
+        check = f"CHK{self.next_id('check'):09d}"
+        header = [
+            segment_xml('ST', '835', '0001'),
+            segment_xml('BPR', 'I', f"{total_paid:.2f}", 'C', 'ACH', 'CCP'),
+            segment_xml('TRN', '1', check, '1' + practice_npi[:9]),
+            segment_xml('DTM', '405', received.strftime('%Y%m%d')),
+            segment_xml('N1', 'PR', payer, 'XV', f"P{PAYERS.index(payer) + 1:04d}"),
+            segment_xml('N3', 'PO BOX 1000'),
+            segment_xml('N4', 'DURHAM', 'NC', '27702'),
+            segment_xml('N1', 'PE', practice_name.upper(), 'XX', practice_npi),
+            segment_xml('LX', '1'),
+        ]
+        segments = header + claim_segments
+        segments.append(segment_xml('SE', str(len(segments) + 1), '0001'))
+
+        # Processing report for the submission the ERA answers, a day after the last service date
+        submitted = received - timedelta(days=6)
+        self.response(practice_guid, submitted, 'Processing', 1, f"{submitted:%Y%m%d}_{check}.CSR",
+                      "CLAIM PROCESSING REPORT\n" + "\n".join(csr_lines) + "\n", claims, 0, 0, total_billed,
+                      None, 'Claim Processing Report')
+        self.response(practice_guid, received, 'ERA', 3, f"{check}.835", "".join(segments), claims, denied, 0,
+                      total_paid, self.next_id('payment'), f"ERA {payer} {check}", source_name=payer)
+
+    def response(self, practice_guid, received, report_type, report_type_id, filename, contents, items, denied,
+                 rejected, amount, payment_id, title, source_name='Clearinghouse'):
+        self.sinks['PM_CLEARINGHOUSERESPONSE'].add(
+            1, self.next_id('response', 1000000), report_type_id, report_type, 1, 'Clearinghouse', denied, contents,
+            filename, received.replace(microsecond=0), items, payment_id, practice_guid, True, rejected,
+            33 if report_type == 'ERA' else 1, 'Electronic Remittance Advice' if report_type == 'ERA' else 'Claim Status',
+            False, 'sftp://clearinghouse.example', source_name, title, round(amount, 2))
+
+
+def generate(directory=DEFAULT_DIR, practices=2, eras=12, claims=20, lines=3, scale=1, seed=0, end=None,
+             days=300):
+    """Write synthetic PM_* tables to <directory>/tables/; returns {table: rows}.
+
+    Each practice gets eras * scale ERAs of `claims` claims with `lines` service
+    lines each, received over the `days` before `end` (default now).
+    """
+    _require(pa, 'pyarrow')
+    eras *= scale
+    total_lines = practices * eras * claims * lines
+    if FIRST_CLAIM_ID + total_lines - 1 > LAST_CLAIM_ID:
+        print(f"  Warning: {total_lines:,} service lines need claim IDs past {LAST_CLAIM_ID}; "
+              f"the pipeline only links 6-digit claim IDs, so lines beyond that won't enrich.")
+    out = os.path.join(directory, 'tables')
+    os.makedirs(out, exist_ok=True)
+    if os.path.isdir(os.path.join(directory, 'queries')):
+        print(f"  Note: recorded queries in {directory}/queries are answered before these tables.")
+
+    sinks = {table: _TableSink(os.path.join(out, f"{table}.parquet"), columns) for table, columns in SCHEMAS.items()}
+    try:
+        generator = _Generator(sinks, seed, end or datetime.now(), days)
+        generator.dictionaries()
+        for number in range(1, practices + 1):
+            generator.practice(number, eras, claims, lines)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    return {table: sink.count for table, sink in sinks.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic PM_* tables for SNOWFLAKE_BACKEND=replay')
+    parser.add_argument('--out', default=DEFAULT_DIR, help='Replay directory (default: SNOWFLAKE_REPLAY_DIR)')
+    parser.add_argument('--practices', type=int, default=2, help='Number of practices')
+    parser.add_argument('--eras', type=int, default=12, help='ERAs per practice (before --scale)')
+    parser.add_argument('--claims', type=int, default=20, help='Claims per ERA')
+    parser.add_argument('--lines', type=int, default=3, help='Service lines per claim')
+    parser.add_argument('--scale', type=int, default=1, help='Multiplies ERAs per practice (e.g. 10, 100)')
+    parser.add_argument('--days', type=int, default=300, help='Days of history the ERAs are spread over')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    counts = generate(args.out, practices=args.practices, eras=args.eras, claims=args.claims, lines=args.lines,
+                      scale=args.scale, seed=args.seed, days=args.days)
+    for table, count in counts.items():
+        print(f"  {table}: {count} rows")
@@ -0,0 +1,37 @@
+import sys
+import os
+import argparse
+import pytest
+from unittest.mock import MagicMock, patch
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from benchmarks.run_benchmarks import TABLES, _postgres_unavailable, compare, scratch_dbname
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {'rows_per_sec': 1000.0, 'peak_rss_mb': 100.0, 'snowflake_round_trips': 10, 'postgres_round_trips': 0}
+
+    within = {'rows_per_sec': 850.0, 'peak_rss_mb': 120.0, 'snowflake_round_trips': 12, 'postgres_round_trips': 0}
+    assert compare(within, baseline, threshold=0.25) == []
+
+    worse = {'rows_per_sec': 700.0, 'peak_rss_mb': 100.0, 'snowflake_round_trips': 10, 'postgres_round_trips': 1}
+    assert compare(worse, baseline, threshold=0.25) == [
+        'rows_per_sec 1000.0 -> 700.0', 'postgres_round_trips 0 -> 1']
+
+def test_scratch_dbname_refuses_the_warehouse():
+    ap = argparse.ArgumentParser()
+    assert scratch_dbname(ap, 'tebra_bench') == 'tebra_bench'
+    with pytest.raises(SystemExit):
+        scratch_dbname(ap, 'tebra_dw')
+
+def test_postgres_stages_start_from_empty_tables():
+    conn = MagicMock()
+    with patch('psycopg2.connect', return_value=conn), patch('src.migrations.migrate'), \
+         patch.dict('loading.load_to_postgres.DB_CONFIG'):
+        assert _postgres_unavailable('tebra_bench') is None
+    truncate = conn.cursor.return_value.execute.call_args[0][0]
+    assert truncate.startswith('TRUNCATE TABLE ')
+    assert all(t in truncate for t in TABLES + ['tebra.etl_practice_watermark', 'tebra.etl_era_failure'])
+    assert conn.commit.called
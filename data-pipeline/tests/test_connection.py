@@ -0,0 +1,67 @@
+import sys
+import os
+import pytest
+from unittest.mock import MagicMock
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from src.connection import ConnectionPool
+
+def make_pool(**opts):
+    opened = []
+    def connect():
+        conn = MagicMock()
+        conn.is_closed.return_value = False
+        opened.append(conn)
+        return conn
+    return ConnectionPool(connect=connect, **opts), opened
+
+def test_returned_connection_is_reused():
+    pool, opened = make_pool(size=2)
+    first = pool.checkout()
+    first.cursor()
+    first.close()
+    with pool.checkout() as second:
+        second.cursor()
+    assert len(opened) == 1
+    assert (pool.opened, pool.reused) == (1, 1)
+    # close() hands the connection back instead of closing it
+    assert not opened[0].close.called
+
+def test_checkout_waits_when_pool_is_full():
+    pool, opened = make_pool(size=1, timeout=0.05)
+    held = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+    # The raw connection (cursor.connection) is accepted on return too
+    pool.checkin(opened[0])
+    pool.checkout()
+    assert len(opened) == 1
+
+def test_stale_connection_is_replaced():
+    pool, opened = make_pool(size=1, ping_after=0)
+    pool.checkout().close()
+    opened[0].cursor.return_value.execute.side_effect = Exception('session expired')
+    conn = pool.checkout()
+    assert len(opened) == 2 and opened[0].close.called
+    conn.close()
+    pool.close()
+    assert opened[1].close.called
+
+def test_closed_postgres_connection_is_replaced():
+    opened = []
+    def connect():
+        # psycopg2: a closed attribute, no is_closed()
+        conn = MagicMock(spec=['cursor', 'close', 'closed'])
+        conn.closed = 0
+        opened.append(conn)
+        return conn
+    pool = ConnectionPool(connect=connect, size=1, timeout=0.05, name='Postgres', size_env='LOAD_WORKERS')
+    pool.checkout().close()
+    opened[0].closed = 1
+    held = pool.checkout()
+    assert len(opened) == 2 and opened[0].close.called
+    with pytest.raises(TimeoutError, match='No Postgres connection free.*raise LOAD_WORKERS'):
+        pool.checkout()
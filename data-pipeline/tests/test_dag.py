@@ -0,0 +1,67 @@
+import sys
+import os
+import threading
+import pytest
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from src.dag import critical_path, run_dag
+
+def test_independent_nodes_run_concurrently():
+    # Both leaves must be in flight at once to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    applied = []
+    opened = []
+    closed = []
+
+    def leaf(session):
+        barrier.wait()
+        return session
+
+    nodes = {
+        'root': ((), lambda s: 'root', applied.append),
+        'a': (('root',), leaf, lambda r: applied.append('a')),
+        'b': (('root',), leaf, lambda r: applied.append('b')),
+        'join': (('a', 'b'), lambda s: 'join', applied.append),
+    }
+
+    def open_session():
+        opened.append(object())
+        return opened[-1]
+
+    timings = run_dag(nodes, session=None, workers=2, open_session=open_session, close_session=closed.append)
+
+    assert applied[0] == 'root' and applied[-1] == 'join'
+    assert sorted(applied[1:3]) == ['a', 'b']
+    assert set(timings) == set(nodes)
+    assert len(opened) == 2 and closed == opened
+
+def test_sequential_uses_given_session_in_dependency_order():
+    seen = []
+    nodes = {
+        'child': (('parent',), lambda s: seen.append(('child', s)), None),
+        'parent': ((), lambda s: seen.append(('parent', s)), None),
+    }
+    run_dag(nodes, session='main')
+    assert seen == [('parent', 'main'), ('child', 'main')]
+
+def test_failure_propagates():
+    def boom(session):
+        raise RuntimeError('query failed')
+    nodes = {'ok': ((), lambda s: 1, None), 'bad': ((), boom, None)}
+    with pytest.raises(RuntimeError, match='query failed'):
+        run_dag(nodes, session=None, workers=2, open_session=object)
+
+def test_critical_path_sums_dependency_chain():
+    nodes = {
+        'claims': ((), None, None),
+        'patients': (('claims',), None, None),
+        'encounters': (('claims',), None, None),
+        'policies': (('encounters',), None, None),
+    }
+    timings = {'claims': (0.0, 1.0), 'patients': (1.0, 3.5), 'encounters': (1.0, 2.0), 'policies': (2.0, 3.0)}
+    total, path = critical_path(nodes, timings)
+    assert path == ['claims', 'patients']
+    assert total == pytest.approx(3.5)
@@ -0,0 +1,116 @@
+import sys
+import os
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+sys.path.append(os.path.join(pipeline_root, 'extraction'))
+
+from src.entity_cache import EntityCache
+import extract_batch_optimized
+
+REFRESHED = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+def warehouse(rows):
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = rows
+    return conn, cur
+
+def test_lookup_splits_hits_and_misses():
+    conn, cur = warehouse([('aaaa-1', REFRESHED, 'NPI1', 'Dr A', None, 7, 'TX')])
+    cache = EntityCache(conn, ttl=3600)
+
+    found, missing = cache.lookup('provider', ['AAAA-1', 'BBBB-2'])
+
+    # Keys are matched case-insensitively and returned as the caller spelled them
+    assert cur.execute.call_args[0][1] == (['aaaa-1', 'bbbb-2'], 3600)
+    assert missing == ['BBBB-2']
+    assert found['AAAA-1']['ProviderNPI'] == 'NPI1'
+    assert found['AAAA-1']['Provider_RefreshedAt'] == '2025-06-01T12:00:00+00:00'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_change_marker_refetches_modified_rows():
+    conn, _ = warehouse([('p-1', REFRESHED, 'Plan')])
+    cache = EntityCache(conn, change_column='MODIFIEDDATE')
+    fetch = MagicMock(return_value=[('P-1',)])
+
+    found, missing = cache.lookup('location', ['P-1'], fetch)
+
+    query, keys = fetch.call_args[0]
+    assert "MODIFIEDDATE > '2025-06-01T12:00:00+00:00'" in query
+    assert keys == ['P-1']
+    assert found == {} and missing == ['P-1']
+
+def test_policies_are_found_through_their_policy_key():
+    conn, cur = warehouse([('pol-1', REFRESHED, 'X1', 'G1', 'Plan', 'Acme', None, None, None, None, 7, 1)])
+    cache = EntityCache(conn)
+
+    found, missing = cache.lookup('policy', ['POL-1', 'POL-2'])
+
+    # ref_insurance_policy holds one row per policy_key, whatever GUIDs share it
+    query = cur.execute.call_args[0][0]
+    assert 'tebra.ref_insurance_policy_guid m JOIN tebra.ref_insurance_policy p USING (policy_key)' in query
+    assert 'WHERE m.policy_guid::text = ANY(%s)' in query
+    assert found['POL-1']['Insurance_PolicyNum'] == 'X1' and missing == ['POL-2']
+
+def cached_patients(cached):
+    entities = MagicMock()
+    entities.lookup.side_effect = lambda kind, guids, fetch: (
+        ({k: v for k, v in cached.items() if k in guids}, [g for g in guids if g not in cached])
+        if kind == 'patient' else ({}, list(guids)))
+    return entities
+
+CACHED = {'PAT-1': {'PatientName': 'Jane Doe', 'Patient_RefreshedAt': '2025-06-01T12:00:00+00:00'}}
+
+def chain_cursor(cursor, **values):
+    """Answers the keys-only chain query with one row; other queries find nothing."""
+    chain = {alias: None for _, alias in extract_batch_optimized.CHAIN_KEY_COLUMNS}
+    chain.update(values)
+    row = tuple(chain[alias] for _, alias in extract_batch_optimized.CHAIN_KEY_COLUMNS)
+    cursor.fetchall.side_effect = lambda: [row] if 'QUALIFY' in cursor.execute.call_args[0][0] else []
+    return cursor
+
+def test_stepwise_only_queries_uncached_patients():
+    entities = cached_patients(CACHED)
+    cursor = MagicMock()
+    # Claims, then empty results for every other lookup
+    cursor.fetchall.side_effect = [[(123456, None, 'PAT-1', 'Paid', None, None, None, 'PR')]] + [[]] * 20
+
+    result = extract_batch_optimized.enrich_stepwise(cursor, ['123456'], entities=entities)
+
+    assert result['123456']['PatientName'] == 'Jane Doe'
+    queries = [c[0][0] for c in cursor.execute.call_args_list]
+    assert not any('FROM PM_PATIENT' in q for q in queries)
+
+def test_joined_only_queries_uncached_entities():
+    cursor = chain_cursor(MagicMock(), CLAIMID=123456, CLAIM_PATIENTGUID='PAT-1', EP_MATCH=77, E_MATCH='ENC-1',
+                          PROVIDERGUID='DOC-1', IPA_MATCH=9, AUTH_POLICYGUID='POL-1')
+
+    result = extract_batch_optimized.enrich_joined(cursor, ['123456'], entities=cached_patients(CACHED))
+
+    assert result['123456']['PatientName'] == 'Jane Doe'
+    assert result['123456']['Calculated_PolicyGUID'] == 'POL-1'
+    queries = [c[0][0] for c in cursor.execute.call_args_list]
+    # The chain stops at the keys; only the uncached provider and policy are looked up
+    assert not any('PM_PATIENT' in q for q in queries)
+    assert any('FROM PM_DOCTOR' in q for q in queries)
+    assert any('FROM PM_INSURANCEPOLICY P' in q and 'QUALIFY' not in q for q in queries)
+
+def test_columnar_only_queries_uncached_entities():
+    pytest.importorskip('pyarrow')
+    cursor = chain_cursor(MagicMock(spec=['execute', 'executemany', 'fetchall', 'connection']),
+                          CLAIMID=123456, CLAIM_PATIENTGUID='PAT-1', EP_MATCH=77, E_MATCH='ENC-1', PROVIDERGUID='DOC-1')
+
+    keys, fields = extract_batch_optimized.enrich_columnar(cursor, ['123456'], entities=cached_patients(CACHED))
+
+    assert keys.to_pylist() == ['123456']
+    assert fields['PatientName'].to_pylist() == ['Jane Doe']
+    assert fields['ProviderNPI'].to_pylist() == [None]
+    queries = [c[0][0] for c in cursor.execute.call_args_list]
+    assert not any('PM_PATIENT' in q for q in queries)
+    assert any('FROM PM_DOCTOR' in q for q in queries)
@@ -0,0 +1,90 @@
+import sys
+import os
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from src.era_parser_xml import EraParser
+from src import era_parser_x12
+
+def seg(name, *values):
+    elements = "".join(f"<{name}{i:02d}>{v}</{name}{i:02d}>" for i, v in enumerate(values, 1))
+    return f'<segment name="{name}">{elements}</segment>'
+
+SAMPLE_SEGMENTS = [
+    ('BPR', 'I', '20.06', 'C', 'ACH', 'CCP'),
+    ('TRN', '1', 'CHK123', '1512345678'),
+    ('N1', 'PR', 'NC BCBS', 'XV', 'P1'),
+    ('N1', 'PE', 'PERFORMANCE REHAB', 'XX', '1508053489'),
+    ('CLP', '387242Z43267', '1', '260.00', '20.06', '0', '12', '26008B961900'),
+    ('NM1', 'QC', '1', 'HAIRE', 'JAMES', 'M'),
+    ('SVC', 'HC:97110:KX:GP', '168.00', '14.01', '', '1'),
+    ('DTM', '472', '20250212'),
+    ('CAS', 'CO', '273', '153.99'),
+    ('REF', '6R', '598306K598306'),
+    ('SVC', 'HC:97140:59:KX:GP', '63.00', '4.02', '', '1'),
+]
+
+def x12(segments, element_sep='*', sub_element_sep=':', segment_term='~'):
+    isa = element_sep.join(['ISA', '00', ' ' * 10, '00', ' ' * 10, 'ZZ', 'SENDER'.ljust(15), 'ZZ',
+                            'RECEIVER'.ljust(15), '250301', '1200', '^', '00501', '000000001', '0', 'P',
+                            sub_element_sep])
+    body = [element_sep.join([name] + [v.replace(':', sub_element_sep) for v in values])
+            for name, *values in segments]
+    return segment_term.join([isa] + body + ['IEA' + element_sep + '1']) + segment_term
+
+SAMPLE_835 = "".join(seg(*s) for s in SAMPLE_SEGMENTS)
+
+def test_parse_business_structure():
+    parsed = EraParser().parse(SAMPLE_835)
+
+    assert parsed['payment']['total_paid'] == '20.06'
+    assert parsed['payment']['check_number'] == 'CHK123'
+    assert parsed['payer']['name'] == 'NC BCBS'
+    assert parsed['payee']['id'] == '1508053489'
+
+    assert len(parsed['claims']) == 1
+    claim = parsed['claims'][0]
+    assert claim['claim_id'] == '387242Z43267'
+    assert claim['patient']['name'] == 'HAIRE, JAMES M'
+    assert [s['proc_code'] for s in claim['service_lines']] == ['HC:97110:KX:GP', 'HC:97140:59:KX:GP']
+    first = claim['service_lines'][0]
+    assert first['date'] == '20250212'
+    assert first['adjustments'] == ['CO-273:153.99']
+    assert first['refs'] == [{'type': '6R', 'value': '598306K598306'}]
+
+def test_parse_segments_indexed_in_order():
+    parsed = EraParser().parse(SAMPLE_835)
+    clp = next(s for s in parsed['segments'] if s['id'] == 'CLP')
+    assert [tag for tag, _ in clp['elements']] == [f'CLP{i:02d}' for i in range(1, 8)]
+
+def test_parse_small_feed_chunks_match():
+    parser = EraParser()
+    parser.FEED_CHUNK_SIZE = 7
+    assert parser.parse(SAMPLE_835) == EraParser().parse(SAMPLE_835)
+
+def test_parse_malformed_returns_error():
+    assert 'error' in EraParser().parse('<segment name="CLP"><CLP01>x</CLP01')
+
+def test_parse_business_detail_skips_segments():
+    parser = EraParser()
+    business = parser.parse(SAMPLE_835, detail='business')
+    full = parser.parse(SAMPLE_835, detail='full')
+
+    assert 'segments' not in business
+    full.pop('segments')
+    assert business == full
+
+def test_x12_backend_matches_xml():
+    parser = EraParser()
+    expected = parser.parse(SAMPLE_835, detail='business')
+
+    assert parser.parse(x12(SAMPLE_SEGMENTS), detail='business') == expected
+    # Separators come from ISA, composites are normalized to ':'
+    assert parser.parse(x12(SAMPLE_SEGMENTS, '|', '>', '\n'), detail='business') == expected
+
+def test_x12_sniffing_and_bad_envelope():
+    assert era_parser_x12.is_x12('\n  ISA*00*')
+    assert not era_parser_x12.is_x12(SAMPLE_835)
+    assert 'error' in EraParser().parse('ISA*00*truncated~')
@@ -0,0 +1,41 @@
+import sys
+import os
+import pytest
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from src.intermediate import TableWriter, count_rows, find_table, read_table
+
+HEADERS = ['ClaimID', 'LineID_Ref6R', 'Billed', 'Paid', 'Units']
+ROWS = [
+    {'ClaimID': 'CLM-1', 'LineID_Ref6R': '598306', 'Billed': '168.00', 'Paid': '14.01', 'Units': '1'},
+    {'ClaimID': 'CLM-1', 'LineID_Ref6R': None, 'Billed': '', 'Paid': '0', 'Units': ''},
+]
+
+def test_csv_round_trip(tmp_path):
+    with TableWriter(str(tmp_path), 'service_lines.csv', HEADERS, fmt='csv') as writer:
+        writer.writerows(ROWS)
+    assert find_table(str(tmp_path), 'service_lines.csv').endswith('.csv')
+    assert count_rows(str(tmp_path), 'service_lines.csv') == 2
+    rows = list(read_table(str(tmp_path), 'service_lines.csv'))
+    assert rows[1]['LineID_Ref6R'] == ''
+
+def test_parquet_typed_columns_and_projection(tmp_path):
+    pytest.importorskip('pyarrow')
+    with TableWriter(str(tmp_path), 'service_lines.csv', HEADERS, fmt='parquet', debug_csv=True) as writer:
+        writer.writerows(ROWS)
+
+    assert find_table(str(tmp_path), 'service_lines.csv').endswith('.parquet')
+    assert os.path.exists(tmp_path / 'service_lines.csv')
+    assert count_rows(str(tmp_path), 'service_lines.csv') == 2
+
+    rows = list(read_table(str(tmp_path), 'service_lines.csv', columns=['ClaimID', 'Billed', 'Missing']))
+    assert rows == [{'ClaimID': 'CLM-1', 'Billed': 168.0}, {'ClaimID': 'CLM-1', 'Billed': None}]
+
+    # Switching back to CSV drops the Parquet table so readers don't pick up stale data
+    with TableWriter(str(tmp_path), 'service_lines.csv', HEADERS, fmt='csv') as writer:
+        writer.writerows(ROWS[:1])
+    assert find_table(str(tmp_path), 'service_lines.csv').endswith('.csv')
+    assert count_rows(str(tmp_path), 'service_lines.csv') == 1
@@ -0,0 +1,161 @@
+import sys
+import os
+import re
+import inspect
+import pytest
+from unittest.mock import MagicMock
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from src.migrations import MIGRATIONS_DIR, fk_levels, list_migrations, migrate
+
+def make_conn(applied=()):
+    conn = MagicMock()
+    cur = conn.cursor.return_value
+    cur.fetchall.return_value = list(applied)
+    return conn, cur
+
+def write(directory, fname, sql):
+    (directory / fname).write_text(sql)
+
+def test_repo_migrations_are_numbered_and_idempotent():
+    migrations = list_migrations()
+    assert [v for v, _, _ in migrations] == list(range(1, len(migrations) + 1))
+    for _, name, path in migrations:
+        with open(path) as f:
+            sql = f.read()
+        # initdb runs them unrecorded, then the runner re-applies them once
+        for stmt in ('CREATE TABLE ', 'CREATE INDEX ', 'ADD COLUMN '):
+            assert sql.count(stmt) == sql.count(stmt + 'IF NOT EXISTS'), (name, stmt)
+        assert sql.count('ADD CONSTRAINT') == sql.count('WHEN duplicate_object'), name
+
+def test_migrate_applies_pending_in_version_order(tmp_path):
+    write(tmp_path, '002_second.sql', "ALTER TABLE t ADD COLUMN IF NOT EXISTS b INT;")
+    write(tmp_path, '001_first.sql', "CREATE TABLE IF NOT EXISTS t (a INT);")
+    write(tmp_path, '010_tenth.sql', "CREATE INDEX IF NOT EXISTS i ON t(a);")
+    write(tmp_path, 'README.md', "not a migration")
+    conn, cur = make_conn()
+
+    assert migrate(conn, str(tmp_path)) == [(1, 'first'), (2, 'second'), (10, 'tenth')]
+
+    statements = [c[0][0] for c in cur.execute.call_args_list]
+    applied = [s for s in statements if s.startswith(('CREATE TABLE IF NOT EXISTS t', 'ALTER', 'CREATE INDEX'))]
+    assert applied == ["CREATE TABLE IF NOT EXISTS t (a INT);", "ALTER TABLE t ADD COLUMN IF NOT EXISTS b INT;",
+                       "CREATE INDEX IF NOT EXISTS i ON t(a);"]
+    recorded = [c[0][1][:2] for c in cur.execute.call_args_list if 'INSERT INTO schema_migrations' in c[0][0]]
+    assert recorded == [(1, 'first'), (2, 'second'), (10, 'tenth')]
+    assert statements[0] == "SELECT pg_advisory_lock(%s)" and statements[-1] == "SELECT pg_advisory_unlock(%s)"
+
+def test_migrate_skips_recorded_versions(tmp_path):
+    from src.migrations import _checksum
+    write(tmp_path, '001_first.sql', "SELECT 1;")
+    write(tmp_path, '002_second.sql', "SELECT 2;")
+    conn, cur = make_conn(applied=[(1, _checksum("SELECT 1;"))])
+
+    assert migrate(conn, str(tmp_path), dry_run=True) == [(2, 'second')]
+    assert "SELECT 2;" not in [c[0][0] for c in cur.execute.call_args_list]
+    assert migrate(conn, str(tmp_path)) == [(2, 'second')]
+    assert "SELECT 1;" not in [c[0][0] for c in cur.execute.call_args_list]
+
+def test_migrate_rolls_back_and_stops_on_failure(tmp_path):
+    write(tmp_path, '001_bad.sql', "BROKEN;")
+    write(tmp_path, '002_next.sql', "SELECT 2;")
+    conn, cur = make_conn()
+    cur.execute.side_effect = lambda sql, *args: (_ for _ in ()).throw(RuntimeError('syntax')) if sql == "BROKEN;" else None
+
+    with pytest.raises(RuntimeError):
+        migrate(conn, str(tmp_path))
+    statements = [c[0][0] for c in cur.execute.call_args_list]
+    assert "SELECT 2;" not in statements
+    assert not any('INSERT INTO schema_migrations' in s for s in statements)
+    assert conn.rollback.called
+    assert statements[-1] == "SELECT pg_advisory_unlock(%s)"
+
+def test_list_migrations_rejects_duplicate_versions(tmp_path):
+    write(tmp_path, '001_a.sql', "SELECT 1;")
+    write(tmp_path, '1_b.sql', "SELECT 1;")
+    with pytest.raises(ValueError):
+        list_migrations(str(tmp_path))
+
+def test_fk_levels_follow_declared_references():
+    tables = ['tebra.cmn_patient', 'tebra.cmn_provider', 'tebra.cmn_location', 'tebra.ref_insurance_policy',
+              'tebra.ref_insurance_policy_guid', 'tebra.clin_encounter', 'tebra.clin_encounter_diagnosis',
+              'tebra.fin_claim_line']
+    assert fk_levels(tables) == [
+        ['tebra.cmn_provider', 'tebra.cmn_location', 'tebra.ref_insurance_policy'],
+        ['tebra.cmn_patient', 'tebra.ref_insurance_policy_guid'],
+        ['tebra.clin_encounter'],
+        ['tebra.clin_encounter_diagnosis', 'tebra.fin_claim_line'],
+    ]
+
+def test_fk_levels_rejects_cycles(tmp_path):
+    write(tmp_path, '001_a.sql', "CREATE TABLE IF NOT EXISTS s.a (id INT, b INT REFERENCES s.b(id));\n"
+                                 "CREATE TABLE IF NOT EXISTS s.b (id INT, a INT REFERENCES s.a(id));")
+    with pytest.raises(ValueError):
+        fk_levels(['s.a', 's.b'], str(tmp_path))
+
+_CREATE = re.compile(r'CREATE (?:UNLOGGED )?TABLE IF NOT EXISTS ([\w.]+)\s*\((.*?)\);', re.S | re.I)
+_ALTER = re.compile(r'ALTER TABLE ([\w.]+)(.*?);', re.S | re.I)
+_NOT_COLUMNS = ('PRIMARY', 'UNIQUE', 'CONSTRAINT', 'FOREIGN', 'CHECK')
+
+def migrated_columns(directory=MIGRATIONS_DIR):
+    """{table: column names} after applying every migration in order (CREATE, LIKE, ADD COLUMN)."""
+    columns = {}
+    for _, _, path in list_migrations(directory):
+        with open(path) as f:
+            sql = re.sub(r'--[^\n]*', '', f.read())
+        statements = [(m.start(), 'create', m) for m in _CREATE.finditer(sql)] + \
+                     [(m.start(), 'alter', m) for m in _ALTER.finditer(sql)]
+        for _, kind, m in sorted(statements, key=lambda s: s[0]):
+            table, body = m.groups()
+            if kind == 'alter':
+                columns.setdefault(table, set()).update(re.findall(r'ADD COLUMN IF NOT EXISTS (\w+)', body, re.I))
+                continue
+            like = re.match(r'\s*LIKE ([\w.]+)', body, re.I)
+            if like:
+                columns.setdefault(table, set()).update(columns[like.group(1)])
+                continue
+            depth, item, items = 0, '', []
+            for ch in body + ',':
+                depth += {'(': 1, ')': -1}.get(ch, 0)
+                if ch == ',' and depth == 0:
+                    items.append(item.split())
+                    item = ''
+                else:
+                    item += ch
+            columns.setdefault(table, set()).update(
+                words[0] for words in items if words and words[0].upper() not in _NOT_COLUMNS)
+    return columns
+
+def loader_tables():
+    """Tables load_practice_data flushes (and, in parallel mode, stages), as passed to fk_levels."""
+    sys.path.append(os.path.join(pipeline_root, 'loading'))
+    import load_to_postgres
+    source = inspect.getsource(load_to_postgres.load_practice_data)
+    upserts = dict(re.findall(r'(sql_\w+) = """\s*INSERT INTO ([\w.]+)', source))
+    targets = re.search(r'targets = \[(.*?)\n\s*\]', source, re.S).group(1)
+    return [upserts[name] for name in re.findall(r'\((sql_\w+),', targets)]
+
+def test_staging_tables_match_their_loader_tables():
+    columns = migrated_columns()
+    tables = [t for level in fk_levels(loader_tables()) for t in level]
+    assert 'tebra.fin_claim_line' in tables and 'tebra.ref_insurance_policy_guid' in tables
+    for table in tables:
+        stage = 'tebra_stage.' + table.split('.')[-1]
+        # 005_add_load_staging.sql: a column added to a tebra table must be added to its twin too
+        assert columns.get(stage, set()) - {'load_id'} == columns[table], (stage, columns[table] ^ columns.get(stage, set()))
+        assert 'load_id' in columns[stage]
+
+def test_migrated_columns_follow_like_snapshots(tmp_path):
+    write(tmp_path, '001_a.sql', "CREATE TABLE IF NOT EXISTS s.a (id INT PRIMARY KEY, n NUMERIC(18,2),\n"
+                                 "    PRIMARY KEY (id, n));")
+    write(tmp_path, '002_b.sql', "CREATE UNLOGGED TABLE IF NOT EXISTS t.a (LIKE s.a INCLUDING DEFAULTS);\n"
+                                 "ALTER TABLE t.a ADD COLUMN IF NOT EXISTS load_id TEXT;")
+    write(tmp_path, '003_c.sql', "-- ALTER TABLE t.a ADD COLUMN IF NOT EXISTS c INT;\n"
+                                 "ALTER TABLE s.a ADD COLUMN IF NOT EXISTS c INT, ADD COLUMN IF NOT EXISTS d TEXT;")
+    columns = migrated_columns(str(tmp_path))
+    assert columns['s.a'] == {'id', 'n', 'c', 'd'}
+    # The twin was copied before c and d existed: the drift the repo test catches
+    assert columns['t.a'] == {'id', 'n', 'load_id'}
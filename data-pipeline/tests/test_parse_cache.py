@@ -0,0 +1,67 @@
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+sys.path.append(os.path.join(pipeline_root, 'extraction'))
+
+from src import parse_cache
+from src.parse_cache import EraParseCache, content_hash
+import extract_claim_encounters
+
+ERA = '<segment name="CLP"><CLP01>CLM-1</CLP01><CLP02>1</CLP02><CLP03>100.00</CLP03><CLP04>80.00</CLP04></segment>'
+ROW = ('CUST-1', 'CH-1', 'RPT-1', 'ERA', 'SRC-1', 'Tebra', 0, None, 'file1.835', '2025-01-01',
+       1, 'PAY-1', 'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 0)
+
+def run_extract(tmp_path, content=ERA):
+    mock_cursor = MagicMock()
+    mock_cursor.fetchmany.side_effect = [[ROW], []]
+    mock_cursor.fetchall.return_value = [('CH-1', content)]
+    with patch('extract_claim_encounters.checkout') as mock_conn_func:
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        return extract_claim_encounters.extract_all_eras(
+            'PRAC-1', start_date='2025-01-01', output_dir=str(tmp_path / 'out'),
+            cache_path=str(tmp_path / 'cache.sqlite'))
+
+def test_cache_hit_skips_parsing(tmp_path):
+    first = run_extract(tmp_path)
+    with open(tmp_path / 'out' / 'claims_extracted.csv') as f:
+        claims = f.read()
+
+    with patch('extract_claim_encounters.parse_era_record') as mock_parse:
+        second = run_extract(tmp_path)
+    assert not mock_parse.called
+    assert first['success'] == second['success'] == 1
+    with open(tmp_path / 'out' / 'claims_extracted.csv') as f:
+        assert f.read() == claims
+
+def test_changed_content_or_parser_version_misses(tmp_path):
+    run_extract(tmp_path)
+    with patch('extract_claim_encounters.parse_era_record',
+               wraps=extract_claim_encounters.parse_era_record) as mock_parse:
+        run_extract(tmp_path, content=ERA.replace('CLM-1', 'CLM-2'))
+    assert mock_parse.called
+
+    path = str(tmp_path / 'cache.sqlite')
+    with patch.object(parse_cache, 'PARSER_VERSION', 'next'):
+        cache = EraParseCache(path)
+        assert cache.get('CH-1', content_hash(ERA), 'full') is None
+        # Old-version entries are dropped when the cache is opened
+        assert cache.conn.execute("SELECT COUNT(*) FROM era_parse_cache").fetchone()[0] == 0
+        cache.close()
+
+def test_size_eviction_drops_least_recently_used(tmp_path):
+    cache = EraParseCache(str(tmp_path / 'cache.sqlite'), max_bytes=300)
+    for n in range(3):
+        cache.put(f'CH-{n}', 'h', 'business', {'claims': ['x' * 80]})
+        cache.commit()
+    cache.get('CH-0', 'h', 'business')
+    cache.put('CH-3', 'h', 'business', {'claims': ['x' * 80]})
+    cache.commit()
+
+    assert cache.get('CH-0', 'h', 'business') is not None
+    assert cache.get('CH-1', 'h', 'business') is None
+    assert cache.get('CH-3', 'h', 'business') is not None
+    cache.close()
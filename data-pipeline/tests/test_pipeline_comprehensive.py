@@ -44,21 +44,27 @@ def selective_open(filename, mode='r', *args, **kwargs):
         return mock_open().return_value
     return original_open(filename, mode, *args, **kwargs)
 
+def csv_tables_exist(path):
+    # Every CSV handoff table "exists"; no Parquet copies
+    return not str(path).endswith('.parquet')
+
 # --- Tests ---
 
 def test_extract_all_eras(mock_csv_writer):
     # Setup Snowflake Mock Data
     mock_cursor = MagicMock()
-    mock_cursor.fetchall.return_value = [
+    mock_cursor.fetchmany.side_effect = [[
         (
             'CUST-1', 'CH-1', 'RPT-1', 'ERA', 'SRC-1', 'Tebra', 0, 
             '<ERA>Content</ERA>', 'file1.835', '2025-01-01', 1, 'PAY-1', 
             'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 100.00
         )
-    ]
+    ], []]
+    # Phase 2 of the two-phase extraction: blob lookup by response ID
+    mock_cursor.fetchall.return_value = [('CH-1', '<ERA>Content</ERA>')]
     
     # Mock connection in the MODULE
-    with patch('extract_claim_encounters.get_connection') as mock_conn_func:
+    with patch('extract_claim_encounters.checkout') as mock_conn_func:
         mock_conn_func.return_value.cursor.return_value = mock_cursor
         
         # Mock open with side_effect
@@ -68,30 +74,360 @@ def test_extract_all_eras(mock_csv_writer):
             
             # Verify Snowflake Query
             assert mock_cursor.execute.called
-            query_arg = mock_cursor.execute.call_args[0][0]
+            query_arg = mock_cursor.execute.call_args_list[0][0][0]
             assert "FROM PM_CLEARINGHOUSERESPONSE" in query_arg
             assert "PRACTICEGUID = 'PRAC-1'" in query_arg
 
+def test_extract_all_eras_streams_in_batches(mock_csv_writer):
+    row = (
+        'CUST-1', 'CH-1', 'RPT-1', 'Processing', 'SRC-1', 'Tebra', 0,
+        'Accepted', 'file1.rpt', '2025-01-01', 1, 'PAY-1',
+        'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 0
+    )
+    mock_cursor = MagicMock()
+    mock_cursor.fetchmany.side_effect = [[row, row], [row], []]
+
+    with patch('extract_claim_encounters.checkout') as mock_conn_func:
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        with patch('builtins.open', side_effect=selective_open):
+            result = extract_all_eras('PRAC-1', start_date='2025-01-01', output_dir='test_output', batch_size=2)
+
+    assert not mock_cursor.fetchall.called
+    assert all(c.args == (2,) for c in mock_cursor.fetchmany.call_args_list)
+    assert result['non_era'] == 3
+
+def test_extract_all_eras_two_phase_fetches_only_era_blobs(mock_csv_writer):
+    def make_row(ch_id, report_type):
+        return (
+            'CUST-1', ch_id, 'RPT-1', report_type, 'SRC-1', 'Tebra', 0,
+            None if report_type == 'ERA' else 'snippet', f'{ch_id}.rmt', '2025-01-01', 1, 'PAY-1',
+            'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 0
+        )
+    mock_cursor = MagicMock()
+    mock_cursor.fetchmany.side_effect = [[make_row(1, 'Processing'), make_row(2, 'ERA'), make_row(3, 'Processing')], []]
+    mock_cursor.fetchall.return_value = [(2, '<ERA>Content</ERA>')]
+
+    with patch('extract_claim_encounters.checkout') as mock_conn_func:
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        with patch('builtins.open', side_effect=selective_open):
+            extract_all_eras('PRAC-1', start_date='2025-01-01', output_dir='test_output')
+
+    queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert "SUBSTR(FILECONTENTS, 1, 500)" in queries[0]
+    blob_calls = [c[0] for c in mock_cursor.execute.call_args_list[1:] if "CLEARINGHOUSERESPONSEID IN" in c[0][0]]
+    assert len(blob_calls) == 1
+    # IDs are bound, never spliced into the SQL
+    assert "IN (%s)" in blob_calls[0][0]
+    assert blob_calls[0][1] == ['PRAC-1', 2]
+
+def test_extract_all_eras_parse_workers_keeps_order(mock_csv_writer):
+    def era(claim_id):
+        return (f'<segment name="CLP"><CLP01>{claim_id}</CLP01><CLP02>1</CLP02>'
+                f'<CLP03>100.00</CLP03><CLP04>80.00</CLP04></segment>')
+
+    rows = [
+        ('CUST-1', f'CH-{n}', 'RPT-1', 'ERA', 'SRC-1', 'Tebra', 0, None, f'file{n}.835', '2025-01-01',
+         1, 'PAY-1', 'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 0)
+        for n in range(5)
+    ]
+    blobs = [(f'CH-{n}', era(f'CLM-{n}')) for n in range(5)]
+
+    def run(parse_workers):
+        mock_csv_writer.reset_mock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [rows[:2], rows[2:4], rows[4:], []]
+        mock_cursor.fetchall.side_effect = [blobs[:2], blobs[2:4], blobs[4:]]
+        with patch('extract_claim_encounters.checkout') as mock_conn_func:
+            mock_conn_func.return_value.cursor.return_value = mock_cursor
+            with patch('builtins.open', side_effect=selective_open):
+                result = extract_all_eras('PRAC-1', start_date='2025-01-01', output_dir='test_output',
+                                          batch_size=2, parse_workers=parse_workers)
+        return result, mock_csv_writer.return_value.method_calls
+
+    serial_result, serial_calls = run(1)
+    parallel_result, parallel_calls = run(2)
+
+    assert serial_result['success'] == parallel_result['success'] == 5
+    assert parallel_calls == serial_calls
+    claim_ids = [c.args[0][0]['ClaimID'] for c in parallel_calls if c[0] == 'writerows' and c.args[0]
+                 and 'PayerControlNumber' in c.args[0][0]]
+    assert claim_ids == [f'CLM-{n}' for n in range(5)]
+
+def test_extract_all_eras_incremental_watermark(mock_csv_writer):
+    mock_cursor = MagicMock()
+    mock_cursor.fetchmany.return_value = []
+
+    with patch('extract_claim_encounters.checkout') as mock_conn_func:
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        with patch('builtins.open', side_effect=selective_open):
+            result = extract_all_eras('PRAC-1', start_date='2025-01-01', output_dir='test_output',
+                                      since=('2025-06-01 10:00:00', 42))
+
+    query_arg, params = mock_cursor.execute.call_args[0]
+    assert "FILERECEIVEDATE > %s" in query_arg
+    assert "CLEARINGHOUSERESPONSEID > %s" in query_arg
+    assert params == ['2025-06-01 10:00:00', '2025-06-01 10:00:00', 42]
+    assert result['high_water'] is None
+
+def test_extract_all_eras_watermark_stays_below_failed_era(mock_csv_writer):
+    import extract_claim_encounters
+    era = ('<segment name="CLP"><CLP01>CLM-1</CLP01><CLP02>1</CLP02>'
+           '<CLP03>100.00</CLP03><CLP04>80.00</CLP04></segment>')
+    # Newest first, as the query orders them; response 2 fails to parse
+    rows = [
+        ('CUST-1', n, 'RPT-1', 'ERA', 'SRC-1', 'Tebra', 0, None, f'file{n}.835', f'2025-03-0{n}',
+         1, 'PAY-1', 'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 0)
+        for n in (3, 2, 1)
+    ]
+    real_parse = extract_claim_encounters.parse_era_record
+
+    def parse(job):
+        return {'error': 'bad'} if job[0] == 2 else real_parse(job)
+
+    def run(**kwargs):
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.side_effect = [rows, []]
+        mock_cursor.fetchall.return_value = [(n, era) for n in (3, 2, 1)]
+        with patch('extract_claim_encounters.checkout') as mock_conn_func, \
+             patch('extract_claim_encounters.parse_era_record', side_effect=parse):
+            mock_conn_func.return_value.cursor.return_value = mock_cursor
+            with patch('builtins.open', side_effect=selective_open):
+                return extract_all_eras('PRAC-1', start_date='2025-01-01', output_dir='test_output', **kwargs)
+
+    result = run()
+    assert result['success'] == 2 and result['errors'] == 1
+    assert result['failed'] == [('2025-03-02', 2)]
+    # Response 3 was written but is newer than the failure: the next run re-fetches both
+    assert result['high_water'] == ('2025-03-01', 1)
+
+    # Out of retries: the failure no longer holds the mark back
+    assert run(settled={('2025-03-02', 2)})['high_water'] == ('2025-03-03', 3)
+
+def test_record_era_failures_counts_runs_and_forgets_fixed_eras(mock_postgres_conn):
+    import load_to_postgres
+    with patch.object(load_to_postgres.psycopg2.extras, 'execute_values',
+                      return_value=[('2025-03-02', 2, 3)]) as mock_values:
+        failures = load_to_postgres.record_era_failures('PRAC-1', [('2025-03-02', 2)])
+
+    assert failures == [('2025-03-02', 2, 3)]
+    delete_sql, delete_params = mock_postgres_conn.execute.call_args[0]
+    # ERAs still being retried that parsed this time are dropped; skipped ones stay on record
+    assert 'DELETE FROM tebra.etl_era_failure' in delete_sql
+    assert delete_params == ('PRAC-1', load_to_postgres.ERA_RETRY_LIMIT, [2])
+    upsert_sql, upsert_rows = mock_values.call_args[0][1:]
+    assert 'attempts = tebra.etl_era_failure.attempts + 1' in upsert_sql
+    assert upsert_rows == [('PRAC-1', '2025-03-02', 2)]
+
+def test_generate_report_lists_era_parse_failures(tmp_path):
+    sys.path.append(os.path.join(pipeline_root, 'core'))
+    import orchestrator
+    held = orchestrator.PracticeStats('Held Clinic', 'G1')
+    held.era_failures = [('2025-03-02', 2, 1)]
+    skipped = orchestrator.PracticeStats('Skipped Clinic', 'G2')
+    skipped.era_failures = [('2025-03-04', 4, orchestrator.ERA_RETRY_LIMIT)]
+    report = tmp_path / 'report.md'
+    with patch.object(orchestrator, 'REPORT_FILE', str(report)):
+        orchestrator.generate_report([held, skipped, orchestrator.PracticeStats('Clean Clinic', 'G3')])
+
+    text = report.read_text()
+    assert '## ERA Parse Failures' in text
+    assert f"| Held Clinic | 2025-03-02 | 2 | 1/{orchestrator.ERA_RETRY_LIMIT} | Held |" in text
+    assert f"| Skipped Clinic | 2025-03-04 | 4 | {orchestrator.ERA_RETRY_LIMIT}/{orchestrator.ERA_RETRY_LIMIT} | Skipped |" in text
+    assert 'Clean Clinic | 2025' not in text
+
+def test_extract_all_eras_skips_response_that_fails_to_write(mock_csv_writer):
+    def era(n):
+        return (f'<segment name="CLP"><CLP01>CLM-{n}</CLP01><CLP02>1</CLP02>'
+                f'<CLP03>100.00</CLP03><CLP04>80.00</CLP04></segment>')
+
+    rows = [
+        ('CUST-1', n, 'RPT-1', 'ERA', 'SRC-1', 'Tebra', 0, None, f'file{n}.835', f'2025-03-0{n}',
+         1, 'PAY-1', 'PRAC-1', True, 0, 'RESP', 'Payment', False, 'Addr', 'Payer', 'Title', 0)
+        for n in (3, 2, 1)
+    ]
+
+    def writerows(table_rows):
+        if table_rows and table_rows[0].get('ClaimID') == 'CLM-2':
+            raise ValueError('unwritable row')
+    mock_csv_writer.return_value.writerows.side_effect = writerows
+
+    mock_cursor = MagicMock()
+    mock_cursor.fetchmany.side_effect = [rows, []]
+    mock_cursor.fetchall.return_value = [(n, era(n)) for n in (3, 2, 1)]
+    with patch('extract_claim_encounters.checkout') as mock_conn_func:
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        with patch('builtins.open', side_effect=selective_open):
+            result = extract_all_eras('PRAC-1', start_date='2025-01-01', output_dir='test_output')
+
+    assert result['success'] == 2 and result['errors'] == 1
+    assert result['high_water'] == ('2025-03-01', 1)
+
 def test_extract_batch_enrichment():
     mock_cursor = MagicMock()
     
-    with patch('extract_batch_optimized.get_connection') as mock_conn_func:
+    with patch('extract_batch_optimized.checkout') as mock_conn_func:
         mock_conn_func.return_value.cursor.return_value = mock_cursor
         
         with patch('builtins.open', side_effect=selective_open):
-            with patch('os.path.exists', return_value=True):
+            with patch('os.path.exists', side_effect=csv_tables_exist):
                  extract_batch(input_dir='test_input', output_dir='test_output')
                  
     # Verify Enrichment Queries
     assert mock_cursor.execute.called
     queries = [call[0][0] for call in mock_cursor.execute.call_args_list]
     
-    # Check if we queried PM_CLAIM with the ID
-    claim_query_found = any("FROM PM_CLAIM" in q and "123456" in q for q in queries)
+    # Check if we queried PM_CLAIM with the ID (bound, not spliced into the SQL)
+    claim_query_found = any("FROM PM_CLAIM" in c[0][0] and c[0][1:] == (['123456'],)
+                            for c in mock_cursor.execute.call_args_list)
     assert claim_query_found, "Did not query PM_CLAIM for LineID 123456"
+    assert not any("123456" in q for q in queries)
+
+def test_extract_batch_stages_large_key_sets():
+    mock_cursor = MagicMock()
+    
+    with patch('extract_batch_optimized.checkout') as mock_conn_func, \
+         patch('extract_batch_optimized.KEY_CHUNK_SIZE', 0):
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        
+        with patch('builtins.open', side_effect=selective_open):
+            with patch('os.path.exists', side_effect=csv_tables_exist):
+                 extract_batch(input_dir='test_input', output_dir='test_output')
+    
+    queries = [call[0][0] for call in mock_cursor.execute.call_args_list]
+    assert "CREATE OR REPLACE TEMPORARY TABLE TMP_ENRICH_KEYS" in queries[0]
+    
+    # Keys are uploaded once, and the claim lookup joins against the stage table
+    insert_sql, insert_rows = mock_cursor.executemany.call_args[0]
+    assert "INSERT INTO TMP_ENRICH_KEYS" in insert_sql
+    assert insert_rows == [('claim', '123456')]
+    claim_query = next(q for q in queries if "FROM PM_CLAIM" in q)
+    assert "SELECT KEY_VALUE FROM TMP_ENRICH_KEYS WHERE KIND = 'claim'" in claim_query
+
+def test_extract_batch_joined_errors_propagate():
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.side_effect = RuntimeError('warehouse unavailable')
+
+    with patch('extract_batch_optimized.checkout') as mock_conn_func:
+        mock_conn_func.return_value.cursor.return_value = mock_cursor
+        with patch('builtins.open', side_effect=selective_open):
+            with patch('os.path.exists', side_effect=csv_tables_exist):
+                with pytest.raises(RuntimeError):
+                    extract_batch(input_dir='test_input', output_dir='test_output', engine='joined', sessions=1)
+
+    # No silent rerun through the per-table lookups
+    queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    assert queries and not any("STATUSNAME, PAYERPROCESSINGSTATUSTYPEDESC" in q for q in queries)
+
+def answer_by_query(cursor, results):
+    """fetchall returns the rows for the first `results` key found in the last executed query."""
+    def fetchall():
+        query = cursor.execute.call_args[0][0]
+        return next((rows for marker, rows in results.items() if marker in query), [])
+    cursor.fetchall.side_effect = fetchall
+
+def test_enrich_joined_flattens_chain_row():
+    import extract_batch_optimized as ebo
+    chain = {alias: None for _, alias in ebo.CHAIN_COLUMNS}
+    chain.update({'CLAIMID': 123456, 'CLAIM_PATIENTGUID': 'PAT-1', 'STATUSNAME': 'Paid',
+                  'EP_MATCH': 77, 'PROCEDURECODEDICTIONARYID': 5, 'ENCOUNTERDIAGNOSISID1': 900,
+                  'PROCEDUREMODIFIER1': '25', 'E_MATCH': 'ENC-1', 'ENCOUNTERID': 5, 'PLACEOFSERVICECODE': '11',
+                  'DATEOFSERVICE': '2025-01-02 00:00:00',
+                  'PAT_MATCH': 'PAT-1', 'PAT_FIRSTNAME': 'Jane', 'PAT_LASTNAME': 'Doe',
+                  'POLICY_MATCH': 'POL-1', 'POLICYNUMBER': 'X1', 'PRECEDENCE': 1})
+    mock_cursor = MagicMock()
+    answer_by_query(mock_cursor, {
+        'QUALIFY ROW_NUMBER()': [tuple(chain[alias] for _, alias in ebo.CHAIN_COLUMNS)],
+        'SLOTS AS': [(123456, 1, 42)],
+        'FROM PM_ICD10DIAGNOSISCODEDICTIONARY': [(42, 'Hypertension')],
+        'FROM PM_PROCEDURECODEDICTIONARY': [(5, 'Office visit')],
+        'FROM PM_PROCEDUREMODIFIER': [('25', 'Significant E/M')],
+        'FROM PM_PLACEOFSERVICE': [('11', 'Office')],
+    })
+
+    result = ebo.enrich_joined(mock_cursor, ['123456', '654321'])
+
+    queries = [c[0][0] for c in mock_cursor.execute.call_args_list]
+    # Dictionary names are never joined server-side
+    assert not any("JOIN PM_PLACEOFSERVICE" in q or "JOIN PM_PROCEDURECODEDICTIONARY" in q
+                   or "JOIN PM_ICD10DIAGNOSISCODEDICTIONARY" in q for q in queries)
+    data = result['123456']
+    assert data['LinkStatus'] == 'Success'
+    assert data['EncounterDate'] == '2025-01-02'
+    assert data['PatientName'] == 'Jane Doe'
+    assert data['Policy_GUID'] == 'POL-1'
+    assert data['DiagDesc_1'] == 'Hypertension'
+    assert data['Proc_Description'] == 'Office visit'
+    assert data['POS_Desc'] == 'Office'
+    assert data['ModifierCode_1'] == '25' and data['ModifierDesc_1'] == 'Significant E/M'
+    assert result['654321'] == {'LinkStatus': 'Failed'}
+
+    # With a warm reference cache only the chain and diagnosis slots reach Snowflake
+    from src.reference_cache import ReferenceCache
+    reference = ReferenceCache(':memory:')
+    ebo.enrich_joined(mock_cursor, ['123456'], reference=reference)
+    mock_cursor.execute.reset_mock()
+    cached = ebo.enrich_joined(mock_cursor, ['123456'], reference=reference)
+    assert mock_cursor.execute.call_count == 2
+    assert cached['123456']['DiagDesc_1'] == 'Hypertension'
+    assert cached['123456']['POS_Desc'] == 'Office'
+    reference.close()
+
+def test_extract_batch_columnar(tmp_path):
+    pytest.importorskip('pyarrow')
+    import csv
+    import extract_batch_optimized as ebo
+    (tmp_path / 'service_lines.csv').write_text(
+        "LineID_Ref6R,Billed,Adjustments\n123456,10.00,CO-45:10.00\n654321,5.00,\nabc,1.00,CO-45:1.00\n")
+    chain = {alias: None for _, alias in ebo.CHAIN_COLUMNS}
+    chain.update({'CLAIMID': 123456, 'EP_MATCH': 77, 'PROCEDUREMODIFIER1': '25', 'E_MATCH': 'ENC-1',
+                  'PLACEOFSERVICECODE': '11', 'DATEOFSERVICE': '2025-01-02 00:00:00',
+                  'PAT_MATCH': 'PAT-1', 'PAT_FIRSTNAME': 'Jane'})
+    # No fetch_arrow_all: rows are converted to Arrow
+    mock_cursor = MagicMock(spec=['execute', 'executemany', 'fetchall', 'connection'])
+    answer_by_query(mock_cursor, {
+        'QUALIFY ROW_NUMBER()': [tuple(chain[alias] for _, alias in ebo.CHAIN_COLUMNS)],
+        'SLOTS AS': [(123456, 1, 42)],
+        'FROM PM_ICD10DIAGNOSISCODEDICTIONARY': [(42, 'Hypertension')],
+        'FROM PM_PROCEDUREMODIFIER': [('25', 'Significant E/M')],
+        'FROM PM_PLACEOFSERVICE': [('11', 'Office')],
+        'FROM PM_ADJUSTMENTREASON': [('45', 'Exceeds fee schedule')],
+    })
+    mock_conn = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+
+    with patch('extract_batch_optimized.checkout', return_value=mock_conn):
+        extract_batch(str(tmp_path), str(tmp_path), engine='columnar', sessions=1)
+
+    with open(tmp_path / 'encounters_enriched_deterministic.csv') as f:
+        rows = {r['LineID_Ref6R']: r for r in csv.DictReader(f)}
+    assert rows['123456']['LinkStatus'] == 'Success'
+    assert rows['123456']['Billed'] == '10.00'
+    assert rows['123456']['EncounterDate'] == '2025-01-02'
+    assert rows['123456']['PatientName'] == 'Jane'
+    assert rows['123456']['DiagDesc_1'] == 'Hypertension'
+    assert rows['123456']['ModifierDesc_1'] == 'Significant E/M'
+    assert rows['123456']['POS_Desc'] == 'Office'
+    assert rows['123456']['Adjustment_Descriptions'] == 'CO-45: Exceeds fee schedule'
+    assert rows['654321']['LinkStatus'] == 'Failed'
+    # Not a claim ID: passed through unenriched
+    assert rows['abc']['LinkStatus'] == '' and rows['abc']['Adjustment_Descriptions'] == ''
+
+def test_extract_batch_columnar_errors_propagate(tmp_path):
+    pytest.importorskip('pyarrow')
+    (tmp_path / 'service_lines.csv').write_text("LineID_Ref6R,Billed\n123456,10.00\n")
+    mock_cursor = MagicMock(spec=['execute', 'executemany', 'fetchall', 'connection'])
+    mock_cursor.fetchall.side_effect = RuntimeError('warehouse unavailable')
+    mock_conn = MagicMock()
+    mock_conn.cursor.return_value = mock_cursor
+
+    # Only a missing pyarrow selects the joined engine; real failures fail the practice
+    with patch('extract_batch_optimized.checkout', return_value=mock_conn):
+        with pytest.raises(RuntimeError):
+            extract_batch(str(tmp_path), str(tmp_path), engine='columnar', sessions=1)
+    assert not (tmp_path / 'encounters_enriched_deterministic.csv').exists()
 
 def test_load_practice_data(mock_postgres_conn):
-     with patch('os.path.exists', return_value=True):
+     with patch('os.path.exists', side_effect=csv_tables_exist):
         with patch('builtins.open', side_effect=selective_open):
             # We need to mock csv.DictReader too, because our mock file returns empty or basic string
             # But the 'selective_open' returns a MagicMock which iterates? No.
@@ -104,3 +440,183 @@ def test_load_practice_data(mock_postgres_conn):
     # Verify SQL Execution
      assert mock_postgres_conn.execute.called or mock_postgres_conn.cursor.return_value.execute.called
 
+
+def write_loader_inputs(directory):
+    import csv
+    with open(directory / 'claims_extracted.csv', 'w', newline='') as f:
+        csv.writer(f).writerows([['ClaimID', 'Paid', 'EraReportID'], ['C1', '5', 'R1']])
+    with open(directory / 'encounters_enriched_deterministic.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['EncounterID', 'ClaimID', 'LineID_Ref6R', 'DB_PatientGUID', 'ProcCode', 'DiagID_1'])
+        writer.writerows([[str(900 + i), 'C1', str(123450 + i), f'PAT-{i % 2}', '99213', 'I10'] for i in range(5)])
+
+def test_load_practice_data_single_pass_flushes_in_fk_order(tmp_path, mock_postgres_conn):
+    import load_to_postgres
+    write_loader_inputs(tmp_path)
+
+    reads = []
+    read_table = load_to_postgres.read_table
+    def counting_read(directory, name, columns=None):
+        reads.append(name)
+        return read_table(directory, name, columns)
+    flushed = []
+    def record(cursor, sql, data, page_size):
+        flushed.append((sql.split('INSERT INTO')[1].split()[0], len(data)))
+
+    with patch.object(load_to_postgres, 'read_table', side_effect=counting_read), \
+         patch.object(load_to_postgres, 'FLUSH_ROWS', 6), \
+         patch.object(load_to_postgres.psycopg2.extras, 'execute_values', side_effect=record):
+        assert load_practice_data(data_dir=str(tmp_path)) is True
+
+    assert reads.count('encounters_enriched_deterministic.csv') == 1
+    # Schema changes live in database/migrations; loads never take DDL locks
+    assert not any('ALTER TABLE' in c[0][0] for c in mock_postgres_conn.execute.call_args_list)
+    order = ['tebra.cmn_patient', 'tebra.clin_encounter', 'tebra.clin_encounter_diagnosis', 'tebra.fin_claim_line']
+    clinical = [t for t, _ in flushed if t in order]
+    # Bounded flushes, each in FK order (both patients are queued by the first one)
+    assert clinical == order + order[1:] + order[1:]
+    assert sum(n for t, n in flushed if t == 'tebra.fin_claim_line') == 5
+    assert sum(n for t, n in flushed if t == 'tebra.cmn_patient') == 2
+
+def test_load_practice_data_maps_every_policy_guid_to_its_key(tmp_path, mock_postgres_conn):
+    import csv
+    import load_to_postgres
+    write_loader_inputs(tmp_path)
+    with open(tmp_path / 'encounters_enriched_deterministic.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['EncounterID', 'ClaimID', 'Insurance_PolicyNum', 'Insurance_GroupNum', 'Policy_GUID'])
+        writer.writerows([['901', 'C1', 'X1', 'G1', 'POL-1'], ['902', 'C1', 'X1', 'G1', 'POL-2'],
+                          ['903', 'C1', 'X1', 'G1', 'POL-1']])
+    flushed = {}
+    def record(cursor, sql, data, page_size):
+        flushed.setdefault(sql.split('INSERT INTO')[1].split()[0], []).extend(data)
+
+    with patch.object(load_to_postgres.psycopg2.extras, 'execute_values', side_effect=record):
+        assert load_practice_data(data_dir=str(tmp_path)) is True
+
+    # One row per policy_key; every GUID that shares it points at it
+    key = load_to_postgres.make_policy_key('X1', 'G1')
+    assert [row[0] for row in flushed['tebra.ref_insurance_policy']] == [key]
+    assert flushed['tebra.ref_insurance_policy_guid'] == [('POL-1', key), ('POL-2', key)]
+
+def test_load_practice_data_recounts_only_touched_reports(tmp_path, mock_postgres_conn):
+    import load_to_postgres
+    write_loader_inputs(tmp_path)
+    # C1 currently belongs to R0, so moving it to R1 changes R0's counts too
+    mock_postgres_conn.fetchall.return_value = [('R0',)]
+
+    with patch.object(load_to_postgres.psycopg2.extras, 'execute_values'):
+        assert load_practice_data(data_dir=str(tmp_path)) is True
+
+    recounts = [c[0] for c in mock_postgres_conn.execute.call_args_list if 'UPDATE tebra.fin_era_report' in c[0][0]]
+    assert len(recounts) == 1
+    sql, params = recounts[0]
+    assert 'claim_reference_id = ANY' in sql
+    assert params == (['R0', 'R1'], ['C1'])
+
+def run_parallel_load(tmp_path, mock_postgres_conn, fail_table=None):
+    import threading
+    import load_to_postgres
+    from src.connection import ConnectionPool
+    write_loader_inputs(tmp_path)
+    copies = []
+    lock = threading.Lock()
+    def copy(sql, buf):
+        if fail_table and fail_table in sql:
+            raise RuntimeError('copy failed')
+        with lock:
+            copies.append((sql, buf.read()))
+    staging_conn = MagicMock()
+    staging_conn.cursor.return_value.copy_expert.side_effect = copy
+    pool = ConnectionPool(lambda: staging_conn, size=3)
+
+    with patch.object(load_to_postgres, 'get_load_pool', return_value=pool), \
+         patch.object(load_to_postgres, 'FLUSH_ROWS', 6), \
+         patch.object(load_to_postgres.psycopg2.extras, 'execute_values'):
+        loaded = load_practice_data(data_dir=str(tmp_path), load_mode='parallel')
+    return loaded, copies, staging_conn
+
+def test_parallel_load_stages_concurrently_and_merges_in_fk_order(tmp_path, mock_postgres_conn):
+    loaded, copies, _ = run_parallel_load(tmp_path, mock_postgres_conn)
+    assert loaded is True
+
+    staged_lines = [line for sql, data in copies if 'tebra_stage.fin_claim_line' in sql for line in data.splitlines()]
+    assert len(staged_lines) == 5
+    load_id = staged_lines[0].split('\t')[0]
+    assert all(line.startswith(load_id + '\t') for _, data in copies for line in data.splitlines())
+
+    statements = [c[0][0] for c in mock_postgres_conn.execute.call_args_list]
+    merged = [s.split()[2] for s in statements if s.startswith('INSERT INTO') and 'FROM tebra_stage.' in s]
+    # Patients reference providers and locations; encounters reference all four
+    assert merged.index('tebra.cmn_patient') > merged.index('tebra.cmn_provider')
+    assert merged.index('tebra.clin_encounter') > merged.index('tebra.cmn_patient')
+    assert merged.index('tebra.ref_insurance_policy_guid') > merged.index('tebra.ref_insurance_policy')
+    assert merged[-2:] == ['tebra.clin_encounter_diagnosis', 'tebra.fin_claim_line']
+    deletes = [c[0] for c in mock_postgres_conn.execute.call_args_list if c[0][0].startswith('DELETE FROM tebra_stage.')]
+    assert len(deletes) == len(merged) and all(params == (load_id,) for _, params in deletes)
+
+def test_parallel_load_failure_rolls_back_and_discards_staging(tmp_path, mock_postgres_conn):
+    loaded, _, staging_conn = run_parallel_load(tmp_path, mock_postgres_conn, fail_table='tebra_stage.clin_encounter ')
+    assert loaded is False
+    statements = [c[0][0] for c in mock_postgres_conn.execute.call_args_list]
+    assert not any('FROM tebra_stage.' in s for s in statements)
+    discarded = [c[0][0] for c in staging_conn.cursor.return_value.execute.call_args_list
+                 if c[0][0].startswith('DELETE FROM tebra_stage.')]
+    assert len(discarded) == 8
+
+def test_copy_mode_stages_rows_and_merges_once():
+    import load_to_postgres
+    cursor = MagicMock()
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, buf: copied.append((sql, buf.read()))
+    sql = """
+        INSERT INTO tebra.cmn_provider (provider_guid, npi, name) VALUES %s
+        ON CONFLICT (provider_guid) DO UPDATE SET npi = EXCLUDED.npi
+    """
+
+    load_to_postgres.execute_batch(cursor, sql, [('G1', None, 'Tab\tName'), ('G2', '123', True)], 'Providers', mode='copy')
+
+    statements = [c[0][0] for c in cursor.execute.call_args_list]
+    assert statements[0].startswith("CREATE TEMP TABLE stage_cmn_provider (LIKE tebra.cmn_provider")
+    assert copied == [("COPY stage_cmn_provider (provider_guid, npi, name) FROM STDIN",
+                       "G1\t\\N\tTab\\tName\nG2\t123\tt\n")]
+    assert statements[1].startswith("INSERT INTO tebra.cmn_provider (provider_guid, npi, name) "
+                                    "SELECT provider_guid, npi, name FROM stage_cmn_provider ON CONFLICT (provider_guid)")
+    assert statements[2] == "DROP TABLE stage_cmn_provider"
+
+def test_run_pipeline_parallel_merges_report():
+    sys.path.append(os.path.join(pipeline_root, 'core'))
+    import orchestrator
+
+    practices = [(f'GUID-{i}', f'Practice {i}') for i in range(6)]
+
+    def fake_process(i, total, p_guid, p_name, **opts):
+        stats = orchestrator.PracticeStats(p_name, p_guid)
+        stats.status = 'Success'
+        return stats
+
+    with patch.object(orchestrator, 'get_practices', return_value=practices), \
+         patch.object(orchestrator, 'process_practice', side_effect=fake_process) as mock_process, \
+         patch.object(orchestrator, 'generate_report') as mock_report, \
+         patch.object(orchestrator, 'ReferenceCache') as mock_reference, \
+         patch.object(orchestrator, 'checkout'), \
+         patch.object(orchestrator, 'EntityCache') as mock_entities, \
+         patch.object(orchestrator.psycopg2, 'connect'), \
+         patch.object(orchestrator, 'parse_pool') as mock_parse_pool, \
+         patch('os.makedirs'):
+        orchestrator.run_pipeline(workers=3, parse_workers=2)
+
+    assert mock_process.call_count == len(practices)
+    # One reference cache for the whole run, checked once and closed at the end
+    assert mock_reference.call_count == 1
+    mock_reference.return_value.check_versions.assert_called_once()
+    mock_reference.return_value.close.assert_called_once()
+    assert all(c.kwargs['reference'] is mock_reference.return_value for c in mock_process.call_args_list)
+    assert all(c.kwargs['entities'] is mock_entities.return_value for c in mock_process.call_args_list)
+    mock_entities.return_value.close.assert_called_once()
+    # One parse pool per run, not one forked inside every practice thread
+    mock_parse_pool.assert_called_once_with(2)
+    assert all(c.kwargs['parse_executor'] is mock_parse_pool.return_value for c in mock_process.call_args_list)
+    mock_parse_pool.return_value.shutdown.assert_called_once()
+    reported = mock_report.call_args[0][0]
+    assert [s.guid for s in reported] == [p[0] for p in practices]
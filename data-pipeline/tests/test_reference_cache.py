@@ -0,0 +1,48 @@
+import sys
+import os
+from unittest.mock import MagicMock
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+
+from src.reference_cache import ReferenceCache
+
+def test_lookup_only_fetches_misses(tmp_path):
+    path = str(tmp_path / 'ref.sqlite')
+    cache = ReferenceCache(path)
+    fetch = MagicMock(return_value=[(1, 'Office visit'), (2, 'X-ray')])
+    rows = cache.lookup('proc_dict', [1, 2, 3], fetch)
+    assert sorted(rows) == [(1, 'Office visit'), (2, 'X-ray')]
+    assert fetch.call_args[0][1] == [1, 2, 3]
+    cache.close()
+
+    # A new run reads the file; 3 had no rows and is remembered as such
+    cache = ReferenceCache(path)
+    fetch = MagicMock(return_value=[(4, 'MRI')])
+    rows = cache.lookup('proc_dict', [1, 3, 4], fetch)
+    assert sorted(rows) == [(1, 'Office visit'), (4, 'MRI')]
+    assert fetch.call_args[0][1] == [4]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_table_ttl_and_version_change(tmp_path):
+    cache = ReferenceCache(str(tmp_path / 'ref.sqlite'))
+    fetch = MagicMock(return_value=[('45', 'Charge exceeds fee schedule')])
+    assert cache.table('carc', fetch) == [('45', 'Charge exceeds fee schedule')]
+    cache.table('carc', fetch)
+    assert fetch.call_count == 1
+
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [('PM_ADJUSTMENTREASON', '2025-01-01 00:00:00')]
+    cache.check_versions(cursor)
+    cache.table('carc', fetch)
+    assert fetch.call_count == 2
+
+    # Same version: kept
+    cache.check_versions(cursor)
+    cache.table('carc', fetch)
+    assert fetch.call_count == 2
+
+    cache.ttl = 0
+    cache.table('carc', fetch)
+    assert fetch.call_count == 3
@@ -0,0 +1,53 @@
+import sys
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+
+# Paths
+pipeline_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(pipeline_root)
+sys.path.append(os.path.join(pipeline_root, 'extraction'))
+
+from src import snowflake_replay
+from src.snowflake_replay import RecordingConnection, ReplayConnection, translate
+
+def test_translate_snowflake_only_sql():
+    sql = translate("SELECT * FROM PM_CLAIM WHERE C.CLAIMID IN (SELECT KEY_VALUE FROM TMP_ENRICH_KEYS) "
+                    "AND NAME ILIKE %s", ['P%'])
+    assert "CAST(C.CLAIMID AS VARCHAR) IN (SELECT KEY_VALUE FROM TMP_ENRICH_KEYS)" in sql
+    assert sql.endswith("ILIKE ?")
+    assert "REPLAY_TABLE_VERSIONS" in translate("SELECT TABLE_NAME, LAST_ALTERED FROM INFORMATION_SCHEMA.TABLES")
+
+def test_recorded_query_replays_offline(tmp_path):
+    pytest.importorskip('duckdb')
+    pytest.importorskip('pyarrow')
+    live = MagicMock()
+    live.cursor.return_value.description = [('PRACTICEGUID',), ('NAME',)]
+    live.cursor.return_value.fetchall.return_value = [('P-1', 'Practice One')]
+    query = "SELECT PRACTICEGUID, NAME FROM PM_PRACTICE WHERE ACTIVE = %s"
+
+    recorded = RecordingConnection(live, str(tmp_path)).cursor()
+    assert recorded.execute(query, [True]).fetchall() == [('P-1', 'Practice One')]
+
+    # No PM_PRACTICE table: only the recording can answer
+    replay = ReplayConnection(str(tmp_path))
+    assert replay.cursor().execute(query, [True]).fetchall() == [('P-1', 'Practice One')]
+    replay.close()
+
+def test_replay_runs_staged_lookups_on_tables(tmp_path):
+    pytest.importorskip('duckdb')
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    import extract_batch_optimized as ebo
+    (tmp_path / 'tables').mkdir()
+    pq.write_table(pa.table({'CLAIMID': pa.array([123456, 654321], pa.int64()), 'STATUSNAME': ['Paid', 'Denied']}),
+                   tmp_path / 'tables' / 'PM_CLAIM.parquet')
+
+    conn = ReplayConnection(str(tmp_path))
+    cursor = conn.cursor()
+    stage = ebo.create_key_stage(cursor)
+    with patch('extract_batch_optimized.KEY_CHUNK_SIZE', 0):
+        rows = ebo.fetch_by_keys(cursor, "SELECT CLAIMID, STATUSNAME FROM PM_CLAIM WHERE CLAIMID IN {keys}",
+                                 'claim', ['123456'], stage)
+    assert rows == [(123456, 'Paid')]
+    conn.close()
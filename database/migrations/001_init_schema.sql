@@ -32,7 +32,8 @@ CREATE TABLE IF NOT EXISTS tebra.cmn_patient (
     primary_provider_guid UUID,          -- → cmn_provider (deferred, circular)
     default_location_guid UUID,          -- → cmn_location (deferred, circular)
     referring_provider_guid UUID,
-    active BOOLEAN DEFAULT TRUE
+    active BOOLEAN DEFAULT TRUE,
+    refreshed_at TIMESTAMPTZ             -- Last fetched from Snowflake (entity cache TTL)
 );
 
 CREATE TABLE IF NOT EXISTS tebra.cmn_provider (
@@ -43,7 +44,8 @@ CREATE TABLE IF NOT EXISTS tebra.cmn_provider (
     -- FK linkages (from PM_DOCTOR)
     practice_guid UUID REFERENCES tebra.cmn_practice(practice_guid),
     provider_id INTEGER,                 -- Snowflake DOCTORID
-    taxonomy_code VARCHAR(20)
+    taxonomy_code VARCHAR(20),
+    refreshed_at TIMESTAMPTZ
 );
 
 CREATE TABLE IF NOT EXISTS tebra.cmn_location (
@@ -55,19 +57,26 @@ CREATE TABLE IF NOT EXISTS tebra.cmn_location (
     practice_guid UUID REFERENCES tebra.cmn_practice(practice_guid),
     npi VARCHAR(20),
     place_of_service_code VARCHAR(10),
-    location_id INTEGER                  -- Snowflake SERVICELOCATIONID
+    location_id INTEGER,                 -- Snowflake SERVICELOCATIONID
+    refreshed_at TIMESTAMPTZ
 );
 
 -- After cmn_provider and cmn_location exist, add deferred FKs on cmn_patient
-ALTER TABLE tebra.cmn_patient
-    ADD CONSTRAINT fk_patient_primary_provider
-    FOREIGN KEY (primary_provider_guid) REFERENCES tebra.cmn_provider(provider_guid)
-    NOT VALID;
-
-ALTER TABLE tebra.cmn_patient
-    ADD CONSTRAINT fk_patient_default_location
-    FOREIGN KEY (default_location_guid) REFERENCES tebra.cmn_location(location_guid)
-    NOT VALID;
+DO $$ BEGIN
+    ALTER TABLE tebra.cmn_patient
+        ADD CONSTRAINT fk_patient_primary_provider
+        FOREIGN KEY (primary_provider_guid) REFERENCES tebra.cmn_provider(provider_guid)
+        NOT VALID;
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+DO $$ BEGIN
+    ALTER TABLE tebra.cmn_patient
+        ADD CONSTRAINT fk_patient_default_location
+        FOREIGN KEY (default_location_guid) REFERENCES tebra.cmn_location(location_guid)
+        NOT VALID;
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
 
 -- ==========================================
 -- 2. Reference Data (ref_)
@@ -87,7 +96,8 @@ CREATE TABLE IF NOT EXISTS tebra.ref_insurance_policy (
     practice_guid UUID REFERENCES tebra.cmn_practice(practice_guid),
     patient_case_id BIGINT,
     policy_guid UUID,                    -- Snowflake INSURANCEPOLICYGUID
-    precedence INTEGER
+    precedence INTEGER,
+    refreshed_at TIMESTAMPTZ
 );
 
 -- ==========================================
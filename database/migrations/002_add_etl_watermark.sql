@@ -0,0 +1,15 @@
+-- ============================================================
+-- Migration: Per-practice extraction high-water mark
+-- The orchestrator only pulls PM_CLEARINGHOUSERESPONSE rows newer
+-- than (last_file_receive_date, last_clearinghouse_response_id).
+-- Idempotent: uses CREATE TABLE IF NOT EXISTS
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS tebra.etl_practice_watermark (
+    practice_guid UUID PRIMARY KEY,
+    last_file_receive_date TIMESTAMP NOT NULL,
+    last_clearinghouse_response_id BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Done!
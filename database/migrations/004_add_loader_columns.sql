@@ -0,0 +1,45 @@
+-- ============================================================
+-- Migration: Columns the loader used to add on every run
+-- load_to_postgres.py issued these ALTERs inside each practice
+-- load; databases created from an older 001_init_schema.sql may
+-- still lack them. Types match 001_init_schema.sql.
+-- Idempotent: uses ADD COLUMN IF NOT EXISTS
+-- ============================================================
+
+ALTER TABLE tebra.fin_era_report
+    ADD COLUMN IF NOT EXISTS practice_guid UUID;
+
+ALTER TABLE tebra.cmn_patient
+    ADD COLUMN IF NOT EXISTS dob DATE,
+    ADD COLUMN IF NOT EXISTS gender TEXT,
+    ADD COLUMN IF NOT EXISTS address_line1 TEXT,
+    ADD COLUMN IF NOT EXISTS city TEXT,
+    ADD COLUMN IF NOT EXISTS state TEXT,
+    ADD COLUMN IF NOT EXISTS zip TEXT;
+
+ALTER TABLE tebra.ref_insurance_policy
+    ADD COLUMN IF NOT EXISTS start_date DATE,
+    ADD COLUMN IF NOT EXISTS end_date DATE,
+    ADD COLUMN IF NOT EXISTS copay NUMERIC(18,2);
+
+ALTER TABLE tebra.clin_encounter
+    ADD COLUMN IF NOT EXISTS referring_provider_guid UUID,
+    ADD COLUMN IF NOT EXISTS appt_subject TEXT,
+    ADD COLUMN IF NOT EXISTS appt_notes TEXT,
+    ADD COLUMN IF NOT EXISTS pos_description TEXT;
+
+ALTER TABLE tebra.clin_encounter_diagnosis
+    ADD COLUMN IF NOT EXISTS description TEXT;
+
+ALTER TABLE tebra.fin_claim_line
+    ADD COLUMN IF NOT EXISTS practice_guid UUID,
+    ADD COLUMN IF NOT EXISTS tracking_number TEXT,
+    ADD COLUMN IF NOT EXISTS clearinghouse_payer TEXT;
+
+-- Entity cache freshness (data-pipeline/src/entity_cache.py)
+ALTER TABLE tebra.cmn_patient ADD COLUMN IF NOT EXISTS refreshed_at TIMESTAMPTZ;
+ALTER TABLE tebra.cmn_provider ADD COLUMN IF NOT EXISTS refreshed_at TIMESTAMPTZ;
+ALTER TABLE tebra.cmn_location ADD COLUMN IF NOT EXISTS refreshed_at TIMESTAMPTZ;
+ALTER TABLE tebra.ref_insurance_policy ADD COLUMN IF NOT EXISTS refreshed_at TIMESTAMPTZ;
+
+-- Done!
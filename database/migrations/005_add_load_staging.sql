@@ -0,0 +1,42 @@
+-- ============================================================
+-- Migration: Staging tables for parallel loads (LOAD_MODE=parallel)
+-- Loader workers COPY each table's rows here on their own
+-- connections, tagged with the load's load_id; one transaction then
+-- merges them into tebra.* in FK order and deletes them.
+-- UNLOGGED: staged rows are transient and need no WAL.
+-- Created LIKE the tebra tables as of 004; a migration that adds a
+-- loaded column to a tebra table must add it here too.
+-- Idempotent: uses IF NOT EXISTS
+-- ============================================================
+
+CREATE SCHEMA IF NOT EXISTS tebra_stage;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.cmn_provider (LIKE tebra.cmn_provider INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.cmn_provider ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_cmn_provider_load ON tebra_stage.cmn_provider(load_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.cmn_location (LIKE tebra.cmn_location INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.cmn_location ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_cmn_location_load ON tebra_stage.cmn_location(load_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.ref_insurance_policy (LIKE tebra.ref_insurance_policy INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.ref_insurance_policy ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_ref_insurance_policy_load ON tebra_stage.ref_insurance_policy(load_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.cmn_patient (LIKE tebra.cmn_patient INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.cmn_patient ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_cmn_patient_load ON tebra_stage.cmn_patient(load_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.clin_encounter (LIKE tebra.clin_encounter INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.clin_encounter ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_clin_encounter_load ON tebra_stage.clin_encounter(load_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.clin_encounter_diagnosis (LIKE tebra.clin_encounter_diagnosis INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.clin_encounter_diagnosis ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_clin_encounter_diagnosis_load ON tebra_stage.clin_encounter_diagnosis(load_id);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.fin_claim_line (LIKE tebra.fin_claim_line INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.fin_claim_line ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_fin_claim_line_load ON tebra_stage.fin_claim_line(load_id);
+
+-- Done!
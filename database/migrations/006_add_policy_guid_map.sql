@@ -0,0 +1,24 @@
+-- ============================================================
+-- Migration: Policy GUID -> policy_key map
+-- ref_insurance_policy is keyed on policy_key (policy + group
+-- number), and one row there stands for every Snowflake policy
+-- GUID sharing those numbers, so its policy_guid column is neither
+-- unique nor complete. The loader records each GUID's current key
+-- here; the entity cache (data-pipeline/src/entity_cache.py) finds
+-- cached policies through it.
+-- Idempotent: uses IF NOT EXISTS
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS tebra.ref_insurance_policy_guid (
+    policy_guid UUID PRIMARY KEY,        -- Snowflake INSURANCEPOLICYGUID
+    policy_key VARCHAR(100) NOT NULL REFERENCES tebra.ref_insurance_policy(policy_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_policy_guid_key ON tebra.ref_insurance_policy_guid(policy_key);
+
+-- Parallel loads stage it like the other loaded tables (005_add_load_staging.sql)
+CREATE UNLOGGED TABLE IF NOT EXISTS tebra_stage.ref_insurance_policy_guid (LIKE tebra.ref_insurance_policy_guid INCLUDING DEFAULTS);
+ALTER TABLE tebra_stage.ref_insurance_policy_guid ADD COLUMN IF NOT EXISTS load_id TEXT;
+CREATE INDEX IF NOT EXISTS idx_stage_ref_insurance_policy_guid_load ON tebra_stage.ref_insurance_policy_guid(load_id);
+
+-- Done!
@@ -0,0 +1,21 @@
+-- ============================================================
+-- Migration: ERAs that failed to parse
+-- A failed ERA holds its practice's high-water mark
+-- (002_add_etl_watermark.sql) back so the next run retries it.
+-- attempts counts those runs; once it reaches ERA_RETRY_LIMIT
+-- (load_to_postgres.py) the mark moves past the ERA and the row stays
+-- as the record of what was skipped.
+-- Idempotent: uses IF NOT EXISTS
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS tebra.etl_era_failure (
+    practice_guid UUID NOT NULL,
+    file_receive_date TIMESTAMP NOT NULL,
+    clearinghouse_response_id BIGINT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    first_failed_at TIMESTAMP DEFAULT NOW(),
+    last_failed_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (practice_guid, clearinghouse_response_id)
+);
+
+-- Done!
@@ -1,7 +1,7 @@
-from src.connection import get_connection
+from src.connection import checkout
 
 def dump_schema():
-    conn = get_connection()
+    conn = checkout()
     cursor = conn.cursor()
     
     # Check PM_CLAIM full
@@ -29,5 +29,7 @@ def dump_schema():
         except:
             print(f"  {t}: Not Found")
 
+    conn.close()
+
 if __name__ == "__main__":
     dump_schema()
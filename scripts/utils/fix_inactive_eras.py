@@ -2,7 +2,7 @@
 Script to upsert ERA reports from INACTIVE practices.
 """
 import psycopg2
-from src.connection import get_connection
+from src.connection import checkout
 import hashlib
 
 # Inactive practices with data
@@ -19,7 +19,7 @@ INACTIVE_PRACTICES = [
 ]
 
 def upsert_inactive_practices():
-    sf_conn = get_connection()
+    sf_conn = checkout()
     sf_cur = sf_conn.cursor()
     
     pg_conn = psycopg2.connect(
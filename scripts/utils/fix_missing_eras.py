@@ -3,7 +3,7 @@ Script to upsert missing ERA reports directly from Snowflake to Postgres.
 These are 4 practices that had only non-ERA records (no ERA-type files).
 """
 import psycopg2
-from src.connection import get_connection
+from src.connection import checkout
 import hashlib
 
 # Missing practices
@@ -16,7 +16,7 @@ MISSING_PRACTICES = [
 
 def upsert_missing_eras():
     # Connect to Snowflake
-    sf_conn = get_connection()
+    sf_conn = checkout()
     sf_cur = sf_conn.cursor()
     
     # Connect to Postgres
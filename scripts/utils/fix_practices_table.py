@@ -1,5 +1,5 @@
 import psycopg2
-from src.connection import get_connection as get_sf_conn
+from src.connection import checkout
 
 # Postgres Connection Params
 PG_HOST = "localhost"
@@ -17,7 +17,7 @@ def get_pg_conn():
 
 def sync_practices():
     print("Connecting to Snowflake...")
-    sf_conn = get_sf_conn()
+    sf_conn = checkout()
     sf_cur = sf_conn.cursor()
     
     # Get Active Practices